@@ -0,0 +1,454 @@
+"""
+Offline API-call budget benchmark.
+
+Drives the city and JPM screens of missapptesting.py through Streamlit's AppTest
+against in-memory Google Sheets, Drive and Dropbox fakes (see fakes.py), and
+records for each scenario how many remote calls it made, how many bytes those
+calls moved and how long the reruns took. No network access or real secrets are
+needed; the clock is pinned (see frozen_app.py) so the numbers are repeatable.
+
+    python benchmarks/api_budget.py                 # check against api_budgets.json
+    python benchmarks/api_budget.py --latency 0.05  # add 50 ms to every remote call
+    python benchmarks/api_budget.py --record        # accept the current numbers
+
+Each scenario runs twice, once with the Sheets outbox (the default) and once
+writing to Sheets directly. Calls made by the outbox worker are counted once it
+has drained. The run exits non-zero when a scenario errors, makes more calls
+than its budget, or moves more than BYTES_SLACK times its budgeted bytes.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import openpyxl
+import pytz
+import streamlit as st
+from PIL import Image
+from streamlit.testing.v1 import AppTest
+
+import fakes
+
+HERE = pathlib.Path(__file__).resolve().parent
+APP_PATH = HERE.parent / "missapptesting.py"
+FROZEN_APP = HERE / "frozen_app.py"
+BUDGETS_PATH = HERE / "api_budgets.json"
+DEFAULT_NOW = "2026-10-21 15:00"
+BYTES_SLACK = 1.10
+DRAIN_TIMEOUT = 30
+
+COLUMNS = [
+    "Date", "Submitted By", "Time Called In", "Zone", "YW Zone Color", "Time Sent to JPM", "Address",
+    "Service Type", "Route", "Whole Block", "Placement Exception", "PE Address", "City Notes",
+    "Time Dispatched", "Driver Check-in Time", "Collection Status", "JPM Notes", "Image",
+    "Times Missed", "Last Missed", "MissID",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def next_saturday(day):
+    return day + datetime.timedelta(days=6 if day.weekday() == 6 else 5 - day.weekday())
+
+
+def tab_name(day):
+    # Mirrors get_today_tab_name: Sunday misses go on the following Monday's tab
+    if day.weekday() == 6:
+        target, label = day + datetime.timedelta(days=1), "Monday"
+    else:
+        target, label = day, DAYS[day.weekday()]
+    return f"{label} {target.month}/{target.day}/{str(target.year)[-2:]}"
+
+
+def build_world(rec, today, n_addresses=600, n_misses=300):
+    """Address list, master log and archive, and three weeks of weekly and completion-time sheets."""
+    addresses = [["Address", "MSW Zone", "SS Zone", "YW Zone", "YW Zone Color", "MSW Route", "SS Route", "YW Route", "Latitude", "Longitude"]]
+    for i in range(n_addresses):
+        addresses.append([
+            f"{1000 + i} MAIN ST", DAYS[i % 6], DAYS[(i + 1) % 6], DAYS[(i + 2) % 6], ["Red", "Blue"][i % 2],
+            f"M{i % 5}", f"S{i % 4}", f"Y{i % 3}", str(40.6 + i * 0.0001), str(-75.47 - i * 0.0001),
+        ])
+
+    # Misses sit on the last addresses so the city form's default address is clean
+    master = [list(COLUMNS)]
+    weekly = {}
+    for k in range(n_misses):
+        day = today - datetime.timedelta(days=k % 10)
+        status = ["Picked Up", "Pending", "Dispatched", "Premature", "Rejected"][k % 5]
+        row = {
+            "Date": str(day), "Submitted By": "bench", "Time Called In": f"{k % 12 + 1:02d}:00 AM",
+            "Zone": DAYS[k % 6], "YW Zone Color": "N/A", "Time Sent to JPM": f"{day} 08:00:00",
+            "Address": f"{1000 + n_addresses - 1 - k % 100} MAIN ST", "Service Type": "MSW", "Route": "M1",
+            "Whole Block": "NO", "Placement Exception": "NO", "PE Address": "N/A",
+            "Time Dispatched": f"{day} 09:00:00" if status == "Dispatched" else "",
+            "Collection Status": status, "Times Missed": "1", "Last Missed": str(day), "MissID": f"miss-{k}",
+        }
+        values = [row.get(c, "") for c in COLUMNS]
+        master.append(values)
+        if day.weekday() != 6:
+            weekly.setdefault(next_saturday(day), {}).setdefault(tab_name(day), [list(COLUMNS)]).append(list(values))
+
+    # Last year's closed misses, already moved to the archive and summarized in its rollup
+    archived = [list(COLUMNS)]
+    rollup = {}
+    for k in range(n_misses // 2):
+        day = datetime.date(today.year - 1, 1 + k % 12, 1 + k % 28)
+        address = f"{1000 + n_addresses - 1 - k % 100} MAIN ST"
+        row = {"Date": str(day), "Time Called In": "09:00 AM", "Address": address, "Service Type": "MSW",
+               "Collection Status": "Picked Up", "MissID": f"archived-{k}"}
+        archived.append([row.get(c, "") for c in COLUMNS])
+        rollup.setdefault(address, []).append(f"{day} 09:00")
+    rollup_values = [["Address", "Times Missed", "Last Missed", "Missed On"]] + [
+        [address, len(dates), max(dates)[:10], "; ".join(sorted(dates))] for address, dates in sorted(rollup.items())
+    ]
+
+    spreadsheets = {
+        "ADDR": fakes.FakeSpreadsheet(rec, "ADDR", {"Sheet1": addresses}),
+        "MASTER": fakes.FakeSpreadsheet(rec, "MASTER", {"Sheet1": master}),
+        "ARCHIVE": fakes.FakeSpreadsheet(rec, "ARCHIVE", {str(today.year - 1): archived, "Rollup": rollup_values}),
+    }
+    titles = {"Master Misses Log": "MASTER", "Master Misses Archive": "ARCHIVE"}
+    for k in range(3):
+        saturday = next_saturday(today) - datetime.timedelta(days=7 * k)
+        monday = saturday - datetime.timedelta(days=5)
+        week_days = [monday + datetime.timedelta(days=j) for j in range(6)]
+        tabs = weekly.get(saturday, {})
+        for day in week_days:
+            tabs.setdefault(tab_name(day), [list(COLUMNS)])
+        spreadsheets[f"WEEK{k}"] = fakes.FakeSpreadsheet(rec, f"WEEK{k}", tabs)
+        titles[f"Misses Week Ending {saturday:%Y-%m-%d}"] = f"WEEK{k}"
+
+        completion = {
+            tab_name(day): [["Service Type", "Completion Status", "Completion Time", "Submitted At", "Submitted By"]]
+            + [[svc, "NOT COMPLETE", "", "", ""] for svc in ("MSW", "SS", "YW")]
+            for day in week_days
+        }
+        spreadsheets[f"CT{k}"] = fakes.FakeSpreadsheet(rec, f"CT{k}", completion)
+        titles[f"Completion Times Week Ending {saturday:%Y-%m-%d}"] = f"CT{k}"
+    return spreadsheets, titles
+
+
+def install_fakes(rec, spreadsheets, titles, username):
+    """Route every client the app builds to the fakes and log in as username."""
+    import dropbox
+    import googleapiclient.discovery
+    import gspread
+    import streamlit_authenticator as stauth
+    from google.oauth2 import service_account
+
+    address_url = re.search(r'^ADDRESS_LIST_SHEET_URL = "(.*)"', APP_PATH.read_text(), re.M).group(1)
+    client = fakes.FakeGspreadClient(rec, spreadsheets, {address_url: "ADDR"})
+    drive = fakes.FakeDrive(rec, titles, spreadsheets)
+    dbx = fakes.FakeDropbox(rec)
+
+    class Authenticator:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def login(self, *args, **kwargs):
+            return ("Bench User", True, username)
+
+        def logout(self, *args, **kwargs):
+            pass
+
+    gspread.authorize = lambda *args, **kwargs: client
+    googleapiclient.discovery.build = lambda *args, **kwargs: drive
+    service_account.Credentials.from_service_account_info = classmethod(lambda cls, *args, **kwargs: object())
+    dropbox.Dropbox = lambda *args, **kwargs: dbx
+    stauth.Authenticate = Authenticator
+    return dbx
+
+
+SELECTED_ROWS = {}
+UPLOAD = {}
+
+
+def patch_widgets():
+    """AppTest cannot select dataframe rows or upload files, so stand in for both."""
+    dataframe, file_uploader = st.dataframe, st.file_uploader
+
+    class Selection:
+        def __init__(self, rows):
+            self.selection = type("Rows", (), {"rows": rows})()
+
+    def fake_dataframe(*args, **kwargs):
+        result = dataframe(*args, **kwargs)
+        key = kwargs.get("key")
+        return Selection(SELECTED_ROWS[key]) if key in SELECTED_ROWS else result
+
+    def fake_file_uploader(*args, **kwargs):
+        file_uploader(*args, **kwargs)
+        if not UPLOAD:
+            return None
+        upload = BytesIO(UPLOAD["data"])
+        upload.name, upload.type = UPLOAD["name"], "image/jpeg"
+        return upload
+
+    st.dataframe = fake_dataframe
+    st.file_uploader = fake_file_uploader
+    st.image = lambda *args, **kwargs: None
+
+
+def sample_photo():
+    buf = BytesIO()
+    Image.effect_noise((3000, 2000), 64).convert("RGB").save(buf, "JPEG", quality=95)
+    return buf.getvalue()
+
+
+class Session:
+    """One user session against a fresh fake world."""
+
+    def __init__(self, username, mode, now, latency):
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        SELECTED_ROWS.clear()
+        UPLOAD.clear()
+        self.rec = fakes.Recorder(latency)
+        self.today = datetime.datetime.strptime(now, "%Y-%m-%d %H:%M").date()
+        self.spreadsheets, titles = build_world(self.rec, self.today)
+        self.dropbox = install_fakes(self.rec, self.spreadsheets, titles, username)
+        self.outbox_path = None
+        if mode == "outbox":
+            self.outbox_path = os.path.join(tempfile.mkdtemp(prefix="api_budget_"), "outbox.db")
+            storage = {"outbox_path": self.outbox_path}
+        else:
+            storage = {"outbox": False}
+        self.at = AppTest.from_file(str(FROZEN_APP), default_timeout=120)
+        self.at.secrets["auth_users"] = {"usernames": json.dumps({"usernames": {"jpmuser": {"role": "jpm"}, "cityuser": {"role": "city"}}})}
+        self.at.secrets["dropbox"] = {"app_key": "key", "app_secret": "secret", "refresh_token": "token"}
+        self.at.secrets["google_service_account"] = {"type": "service_account"}
+        self.at.secrets["storage"] = storage
+        self.seconds = 0.0
+
+    def run(self, action=None):
+        """Apply action (a widget interaction) and rerun, timing the rerun."""
+        start = time.perf_counter()
+        (action() if action else self.at).run()
+        self.seconds += time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+        if self.at.error:
+            raise RuntimeError(self.at.error[0].value)
+        return self.at
+
+    def button(self, label):
+        return next(b for b in self.at.button if b.label == label)
+
+    def measure(self):
+        """Forget everything recorded so far; only what follows counts."""
+        self.rec.reset()
+        self.seconds = 0.0
+
+    def drain(self):
+        if not self.outbox_path:
+            return
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while time.monotonic() < deadline:
+            with sqlite3.connect(self.outbox_path) as conn:
+                if not conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]:
+                    return
+            time.sleep(0.1)
+        raise RuntimeError("Sheets outbox did not drain")
+
+
+def city_load(s):
+    s.measure()
+    s.run()
+
+
+def city_rerun(s):
+    s.run()
+    s.measure()
+    s.run(lambda: s.at.selectbox(key="whole_block").set_value("YES"))
+    s.run(lambda: s.at.text_input(key="city_notes").input("Cart at the curb"))
+
+
+def city_submit(s):
+    s.run()
+    s.measure()
+    s.run(lambda: s.button("Submit Missed Stop").click())
+    s.drain()
+
+
+def jpm_load(s):
+    s.measure()
+    s.run()
+
+
+def jpm_refresh(s):
+    """Another writer appends and edits master rows; the next rerun picks them up incrementally."""
+    s.run()
+    master = s.spreadsheets["MASTER"]
+    rows = master.worksheet("Sheet1").values
+    for k in range(3):
+        rows.append([{"Date": rows[-1][0], "Time Sent to JPM": f"{rows[-1][0]} 12:00:00", "Collection Status": "Pending", "Address": "1 NEW ST", "MissID": f"new-{k}"}.get(c, "") for c in COLUMNS])
+    rows[2][COLUMNS.index("Collection Status")] = "Picked Up"
+    master.version += 1
+    sync_interval = float(re.search(r"^MASTER_SYNC_INTERVAL = (\d+)", APP_PATH.read_text(), re.M).group(1))
+    time.sleep(sync_interval)
+    repo = s.at.session_state["miss_repository"]
+    repo._records_at = repo._open_at = 0  # as if MASTER_SNAPSHOT_TTL had passed
+    s.measure()
+    s.run()
+    records = {r["MissID"]: r for r in repo.master_records()}
+    if "new-2" not in records or records[rows[2][-1]]["Collection Status"] != "Picked Up":
+        raise RuntimeError("master snapshot missed the other writer's changes")
+
+
+def jpm_dispatch(s):
+    s.run()
+    s.measure()
+    SELECTED_ROWS["undispatched_data"] = list(range(5))
+    s.run()
+    s.run(lambda: s.button("Dispatch Selected Stops").click())
+    SELECTED_ROWS.clear()
+    s.drain()
+
+
+def jpm_complete(s):
+    s.run()
+    s.run(lambda: s.at.sidebar.radio[0].set_value("Complete a Missed Stop"))
+    s.measure()
+    UPLOAD.update(data=sample_photo(), name="photo.jpg")
+    s.run()
+    s.run(lambda: s.button("Complete Missed Stop").click())
+    s.drain()
+
+
+def city_import(s):
+    """An .xlsx bulk import; a row whose weekly tab is gone and one from a week with no sheet are rejected."""
+    gone = s.today - datetime.timedelta(days=7)
+    s.spreadsheets["WEEK1"]._tabs.pop(tab_name(gone))
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(["Address", "Service Type", "Date", "Time Called In"])
+    for i in range(40):
+        sheet.append([f"{1000 + i} MAIN ST", "MSW", s.today - datetime.timedelta(days=i % 2), datetime.time(9, 15)])
+    sheet.append(["1040 MAIN ST", "MSW", gone, None])
+    sheet.append(["1041 MAIN ST", "MSW", s.today - datetime.timedelta(days=60), None])
+    upload = BytesIO()
+    book.save(upload)
+    UPLOAD.update(data=upload.getvalue(), name="misses.xlsx")
+    s.run()
+    s.run(lambda: s.at.sidebar.radio[0].set_value("Bulk Import"))
+    s.measure()
+    s.run(lambda: s.button("Import Missed Stops").click())
+    s.drain()
+    report = next(d.value for d in s.at.dataframe if "Result" in d.value.columns)
+    rejected = {row: reason for row, reason in zip(report["Row"], report["Reason"]) if reason}
+    if (report["Result"] == "Accepted").sum() != 40 or sorted(rejected) != [42, 43]:
+        raise RuntimeError(f"unexpected import report: {rejected}")
+    if "has no" not in rejected[42] or "does not exist" not in rejected[43]:
+        raise RuntimeError(f"unexpected rejections: {rejected}")
+
+
+def completion_times(s):
+    s.run()
+    s.measure()
+    s.run(lambda: s.at.sidebar.radio[0].set_value("Submit Completion Times"))
+    s.run(lambda: s.button("Submit MSW").click())
+    s.run()
+
+
+SCENARIOS = {
+    "city_load": ("cityuser", city_load),
+    "city_rerun": ("cityuser", city_rerun),
+    "city_submit": ("cityuser", city_submit),
+    "jpm_load": ("jpmuser", jpm_load),
+    "jpm_refresh": ("jpmuser", jpm_refresh),
+    "jpm_dispatch": ("jpmuser", jpm_dispatch),
+    "jpm_complete": ("jpmuser", jpm_complete),
+    "city_import": ("cityuser", city_import),
+    "completion_times": ("jpmuser", completion_times),
+}
+
+
+def run_scenario(name, mode, now, latency):
+    username, scenario = SCENARIOS[name]
+    session = Session(username, mode, now, latency)
+    try:
+        scenario(session)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "calls": session.rec.total(),
+        "bytes": session.rec.bytes,
+        "seconds": round(session.seconds, 3),
+        "by_call": dict(sorted(session.rec.calls.items())),
+    }
+
+
+def over_budget(result, budget):
+    if "error" in result:
+        return result["error"]
+    if budget is None:
+        return "no budget recorded"
+    problems = []
+    if result["calls"] > budget["calls"]:
+        problems.append(f"{result['calls']} calls > budget {budget['calls']}")
+    if result["bytes"] > budget["bytes"] * BYTES_SLACK:
+        problems.append(f"{result['bytes']} bytes > budget {budget['bytes']}")
+    return "; ".join(problems)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake remote call")
+    parser.add_argument("--mode", choices=["outbox", "direct", "both"], default="both")
+    parser.add_argument("--only", action="append", choices=sorted(SCENARIOS), help="run just these scenarios")
+    parser.add_argument("--now", default=DEFAULT_NOW, help="pinned New York time, YYYY-MM-DD HH:MM")
+    parser.add_argument("--record", action="store_true", help="write the measured numbers as the new budgets")
+    parser.add_argument("--verbose", action="store_true", help="break calls down by method")
+    parser.add_argument("--trace-log", action="store_true", help="keep the app's per-call JSON log lines")
+    args = parser.parse_args(argv)
+
+    if not args.trace_log:
+        calls_log = logging.getLogger("missapp.calls")
+        calls_log.addHandler(logging.NullHandler())
+        calls_log.propagate = False
+
+    os.environ["API_BUDGET_NOW"] = args.now
+    patch_widgets()
+    budgets = json.loads(BUDGETS_PATH.read_text()) if BUDGETS_PATH.exists() else {}
+    modes = ["outbox", "direct"] if args.mode == "both" else [args.mode]
+
+    failures = 0
+    print(f"{'scenario':<28}{'calls':>7}{'budget':>8}{'bytes':>11}{'seconds':>9}")
+    for name in args.only or SCENARIOS:
+        for mode in modes:
+            key = f"{name} [{mode}]"
+            result = run_scenario(name, mode, args.now, args.latency)
+            budget = budgets.get(key)
+            if args.record and "error" not in result:
+                budgets[key] = {"calls": result["calls"], "bytes": result["bytes"]}
+                problem = ""
+            else:
+                problem = over_budget(result, budget)
+            if "error" in result:
+                print(f"{key:<28}  ERROR {result['error']}")
+            else:
+                print(f"{key:<28}{result['calls']:>7}{budget['calls'] if budget else '-':>8}{result['bytes']:>11}{result['seconds']:>9.2f}")
+                if args.verbose:
+                    for call, count in result["by_call"].items():
+                        print(f"    {call:<34}{count:>5}")
+            if problem:
+                failures += 1
+                if "error" not in result:
+                    print(f"    OVER BUDGET: {problem}")
+
+    if args.record:
+        BUDGETS_PATH.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+        print(f"Budgets written to {BUDGETS_PATH.name}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
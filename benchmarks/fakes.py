@@ -0,0 +1,326 @@
+"""
+In-memory stand-ins for the gspread client, the Drive v3 service and the Dropbox
+client, used by the API-call budget benchmark. Every remote operation goes
+through a Recorder, which counts it, adds the configured latency and tallies
+the bytes that would have crossed the network.
+"""
+
+import collections
+import json
+import re
+import threading
+import time
+
+import dropbox
+import gspread
+
+
+def payload_size(obj):
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    return len(json.dumps(obj, default=str))
+
+
+class Recorder:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def hit(self, name, sent=None, received=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] += 1
+            self.bytes += payload_size(sent) + payload_size(received)
+        return received
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.bytes = 0
+
+    def total(self):
+        return sum(self.calls.values())
+
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _numeric(value):
+    # get_all_records returns numbers for numeric-looking cells
+    if isinstance(value, str) and re.fullmatch(r"-?\d+", value.strip() or "x"):
+        return int(value)
+    return value
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, values, ws_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.values = values
+        self.id = ws_id
+
+    @property
+    def spreadsheet_id(self):
+        return self.spreadsheet.id
+
+    @property
+    def rec(self):
+        return self.spreadsheet.rec
+
+    @property
+    def row_count(self):
+        return max(len(self.values), 1000)
+
+    def _rows(self, rng):
+        m = re.match(r"([A-Z]*)(\d*):([A-Z]*)(\d*)", rng)
+        start = int(m.group(2) or 1)
+        end = int(m.group(4)) if m.group(4) else len(self.values)
+        c0 = _col_index(m.group(1)) if m.group(1) else 1
+        c1 = _col_index(m.group(3)) if m.group(3) else max(map(len, self.values), default=0)
+        out = [[r[i] for i in range(c0 - 1, min(c1, len(r)))] for r in self.values[start - 1:end]]
+        while out and not any(out[-1]):
+            out.pop()
+        return out
+
+    def _set(self, rng, vals):
+        self.spreadsheet.version += 1
+        m = re.match(r"([A-Z]+)(\d+)", rng)
+        col0, row0 = _col_index(m.group(1)), int(m.group(2))
+        for i, row in enumerate(vals):
+            while len(self.values) < row0 + i:
+                self.values.append([])
+            target = self.values[row0 + i - 1]
+            for j, v in enumerate(row):
+                while len(target) < col0 + j:
+                    target.append("")
+                target[col0 + j - 1] = str(v)
+
+    def get_all_values(self, *args, **kwargs):
+        return self.rec.hit("sheets.get_all_values", received=[list(r) for r in self.values])
+
+    def get_all_records(self, *args, **kwargs):
+        header = self.values[0]
+        records = [
+            {c: _numeric(r[i] if i < len(r) else "") for i, c in enumerate(header)}
+            for r in self.values[1:]
+        ]
+        return self.rec.hit("sheets.get_all_records", received=records)
+
+    def get(self, rng=None, **kwargs):
+        return self.rec.hit("sheets.get", received=self._rows(rng))
+
+    def col_values(self, col, **kwargs):
+        return self.rec.hit("sheets.col_values", received=[r[col - 1] if col - 1 < len(r) else "" for r in self.values])
+
+    def row_values(self, idx, **kwargs):
+        return self.rec.hit("sheets.row_values", received=list(self.values[idx - 1]) if idx - 1 < len(self.values) else [])
+
+    def _appended(self, start, end):
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:U{end}"}}
+
+    def append_row(self, values, **kwargs):
+        self.spreadsheet.version += 1
+        self.values.append([str(v) for v in values])
+        return self.rec.hit("sheets.append_row", sent=values, received=self._appended(len(self.values), len(self.values)))
+
+    def append_rows(self, rows, **kwargs):
+        self.spreadsheet.version += 1
+        start = len(self.values) + 1
+        self.values.extend([str(v) for v in r] for r in rows)
+        return self.rec.hit("sheets.append_rows", sent=rows, received=self._appended(start, len(self.values)))
+
+    def update(self, a=None, b=None, values=None, range_name=None, **kwargs):
+        rng, vals = (a, b) if isinstance(a, str) else (b, a)
+        rng, vals = rng or range_name, vals or values
+        self._set(rng, vals)
+        return self.rec.hit("sheets.update", sent=vals)
+
+    def batch_update(self, data, **kwargs):
+        for d in data:
+            self._set(d["range"], d["values"])
+        return self.rec.hit("sheets.batch_update", sent=data)
+
+    def batch_clear(self, ranges):
+        self.spreadsheet.version += 1
+        for rng in ranges:
+            m = re.match(r"([A-Z]*)(\d*):([A-Z]*)(\d*)", rng)
+            start = int(m.group(2) or 1)
+            end = int(m.group(4)) if m.group(4) else len(self.values)
+            c0 = _col_index(m.group(1)) if m.group(1) else 1
+            c1 = _col_index(m.group(3)) if m.group(3) else None
+            for row in self.values[start - 1:end]:
+                for i in range(c0 - 1, min(c1 or len(row), len(row))):
+                    row[i] = ""
+        return self.rec.hit("sheets.batch_clear", sent=ranges)
+
+
+class FakeSpreadsheet:
+    def __init__(self, rec, sheet_id, tabs):
+        self.rec = rec
+        self.id = sheet_id
+        self.version = 1  # bumped on every write, like a Drive file version
+        self._tabs = {title: FakeWorksheet(self, title, values, i) for i, (title, values) in enumerate(tabs.items())}
+
+    def _split(self, rng):
+        m = re.match(r"'?([^'!]+)'?!(.*)", rng)
+        return self._tabs[m.group(1)], m.group(2)
+
+    @property
+    def sheet1(self):
+        return self.get_worksheet(0)
+
+    def get_worksheet(self, index):
+        return self.rec.hit("sheets.fetch_metadata") or list(self._tabs.values())[index]
+
+    def worksheet(self, title):
+        self.rec.hit("sheets.fetch_metadata")
+        if title not in self._tabs:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._tabs[title]
+
+    def worksheets(self):
+        return self.rec.hit("sheets.fetch_metadata") or list(self._tabs.values())
+
+    def add_worksheet(self, title, rows=100, cols=26, **kwargs):
+        self.rec.hit("sheets.add_worksheet")
+        self._tabs[title] = FakeWorksheet(self, title, [], len(self._tabs))
+        return self._tabs[title]
+
+    def batch_update(self, body):
+        for request in body["requests"]:
+            rng = request["deleteDimension"]["range"]
+            ws = next(ws for ws in self._tabs.values() if ws.id == rng["sheetId"])
+            del ws.values[rng["startIndex"]:rng["endIndex"]]
+        self.version += 1
+        return self.rec.hit("sheets.spreadsheet_batch_update", sent=body)
+
+    def values_batch_get(self, ranges, params=None):
+        value_ranges = []
+        for rng in ranges:
+            ws, cells = self._split(rng)
+            value_ranges.append({"range": rng, "values": ws._rows(cells)})
+        return self.rec.hit("sheets.values_batch_get", received={"valueRanges": value_ranges})
+
+    def values_batch_update(self, body=None):
+        for d in body["data"]:
+            ws, cells = self._split(d["range"])
+            ws._set(cells, d["values"])
+        return self.rec.hit("sheets.values_batch_update", sent=body)
+
+
+class FakeGspreadClient:
+    def __init__(self, rec, spreadsheets, urls=None):
+        self.rec = rec
+        self.spreadsheets = spreadsheets
+        self.urls = urls or {}
+
+    def open_by_key(self, key):
+        self.rec.hit("sheets.open")
+        return self.spreadsheets[key]
+
+    def open_by_url(self, url):
+        self.rec.hit("sheets.open")
+        return self.spreadsheets[self.urls.get(url, url)]
+
+
+class _Request:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeDriveFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q="", fields="", **kwargs):
+        names = re.findall(r"name\s*=\s*'((?:[^'\\]|\\.)*)'", q)
+        files = [
+            {"id": self.drive.titles[n], "name": n, "modifiedTime": self.drive.modified.get(self.drive.titles[n], "2025-01-01T00:00:00Z")}
+            for n in names if n in self.drive.titles
+        ]
+        return _Request(lambda: self.drive.rec.hit("drive.files.list", sent=q, received={"files": files}))
+
+    def get(self, fileId=None, fields="", **kwargs):
+        spreadsheet = self.drive.spreadsheets.get(fileId)
+        version = str(spreadsheet.version) if spreadsheet else "1"
+        meta = {"id": fileId, "modifiedTime": self.drive.modified.get(fileId, "2025-01-01T00:00:00Z"), "version": version}
+        return _Request(lambda: self.drive.rec.hit("drive.files.get", received=meta))
+
+
+class FakeDrive:
+    """Drive v3 service: titles maps spreadsheet title -> file ID; versions come from the spreadsheets."""
+
+    def __init__(self, rec, titles, spreadsheets=None):
+        self.rec = rec
+        self.titles = titles
+        self.spreadsheets = spreadsheets or {}
+        self.modified = {}
+
+    def files(self):
+        return FakeDriveFiles(self)
+
+
+class _Obj:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class FakeDropbox:
+    def __init__(self, rec):
+        self.rec = rec
+        self.files = {}
+        self.links = {}
+        self._sessions = {}
+
+    def _conflict(self, path, data, mode):
+        # WriteMode.add keeps an existing file; identical content is not a conflict
+        return mode is not None and mode.is_add() and path in self.files and self.files[path] != data
+
+    def files_upload(self, data, path, mode=None, **kwargs):
+        self.rec.hit("dropbox.files_upload", sent=data)
+        if self._conflict(path, data, mode):
+            reason = dropbox.files.WriteError.conflict(dropbox.files.WriteConflictError.file)
+            raise dropbox.exceptions.ApiError(
+                "request-id", dropbox.files.UploadError.path(dropbox.files.UploadWriteFailed(reason=reason, upload_session_id="")), "conflict", None
+            )
+        self.files[path] = data
+        return _Obj(path_lower=path)
+
+    def files_upload_session_start(self, data, **kwargs):
+        session_id = f"session-{len(self._sessions)}"
+        self._sessions[session_id] = bytearray(data)
+        return self.rec.hit("dropbox.upload_session", sent=data, received=_Obj(session_id=session_id))
+
+    def files_upload_session_append_v2(self, data, cursor, **kwargs):
+        self._sessions[cursor.session_id] += data
+        return self.rec.hit("dropbox.upload_session", sent=data)
+
+    def files_upload_session_finish(self, data, cursor, commit, **kwargs):
+        self.rec.hit("dropbox.upload_session", sent=data)
+        content = bytes(self._sessions.pop(cursor.session_id) + data)
+        if self._conflict(commit.path, content, commit.mode):
+            raise dropbox.exceptions.ApiError(
+                "request-id", dropbox.files.UploadSessionFinishError.path(dropbox.files.WriteError.conflict(dropbox.files.WriteConflictError.file)), "conflict", None
+            )
+        self.files[commit.path] = content
+        return _Obj(path_lower=commit.path)
+
+    def sharing_create_shared_link_with_settings(self, path, *args, **kwargs):
+        self.links[path] = f"https://www.dropbox.com/s/fake{path}?dl=0"
+        return self.rec.hit("dropbox.create_shared_link", received=_Obj(url=self.links[path]))
+
+    def sharing_list_shared_links(self, path=None, **kwargs):
+        links = [_Obj(url=self.links[path])] if path in self.links else []
+        return self.rec.hit("dropbox.list_shared_links", received=_Obj(links=links))
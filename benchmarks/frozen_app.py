@@ -0,0 +1,54 @@
+"""
+Runs missapptesting.py with datetime pinned to API_BUDGET_NOW ("YYYY-MM-DD HH:MM",
+New York wall clock) so every benchmark run sees the same weekday, tabs and
+completion schedule.
+"""
+
+import builtins
+import datetime as _datetime
+import os
+import pathlib
+import types
+
+import pytz
+
+APP_PATH = pathlib.Path(__file__).resolve().parent.parent / "missapptesting.py"
+
+
+def frozen_datetime_module(when):
+    aware = pytz.timezone("America/New_York").localize(when)
+
+    class FrozenDateTime(_datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            v = aware.astimezone(tz) if tz else aware.replace(tzinfo=None)
+            return cls(v.year, v.month, v.day, v.hour, v.minute, v.second, tzinfo=v.tzinfo)
+
+    class FrozenDate(_datetime.date):
+        @classmethod
+        def today(cls):
+            return aware.date()
+
+    module = types.ModuleType("datetime")
+    module.__dict__.update(_datetime.__dict__)
+    module.datetime = FrozenDateTime
+    module.date = FrozenDate
+    return module
+
+
+_frozen = frozen_datetime_module(_datetime.datetime.strptime(os.environ["API_BUDGET_NOW"], "%Y-%m-%d %H:%M"))
+_import = builtins.__import__
+
+
+def _frozen_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if name == "datetime" and level == 0:
+        return _frozen
+    return _import(name, globals, locals, fromlist, level)
+
+
+_namespace = {
+    "__name__": "__main__",
+    "__file__": str(APP_PATH),
+    "__builtins__": dict(builtins.__dict__, __import__=_frozen_import),
+}
+exec(compile(APP_PATH.read_text(), str(APP_PATH), "exec"), _namespace)
@@ -12,7 +12,35 @@ import dropbox
 from googleapiclient.errors import HttpError
 import uuid
 import pandas as pd
+import numpy as np
 import time
+import bisect
+import threading
+import sqlite3
+import random
+import logging
+import collections
+import copy
+import io
+import csv
+import hashlib
+import difflib
+from PIL import Image, ImageOps, UnidentifiedImageError
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()  # lets Pillow open iPhone HEIC photos
+except ImportError:
+    pass
+
+try:
+    import openpyxl  # reads .xlsx files for the bulk import
+except ImportError:
+    openpyxl = None
+
+RERUN_STARTED = time.perf_counter()
 
 jpm_logo = "https://github.com/marko-londo/coa_testing/blob/main/1752457645003.png?raw=true"
 
@@ -31,11 +59,16 @@ app_secret = st.secrets["dropbox"]["app_secret"]
 
 refresh_token = st.secrets["dropbox"]["refresh_token"]
 
-dbx = dropbox.Dropbox(
-    oauth2_refresh_token=refresh_token,
-    app_key=app_key,
-    app_secret=app_secret
-)
+@st.cache_resource
+def get_dropbox_client(app_key, app_secret, refresh_token):
+    """One Dropbox client per process, so its access token is refreshed once rather than on every upload."""
+    return dropbox.Dropbox(
+        oauth2_refresh_token=refresh_token,
+        app_key=app_key,
+        app_secret=app_secret
+    )
+
+dbx = get_dropbox_client(app_key, app_secret, refresh_token)
 
 SERVICE_ACCOUNT_INFO = st.secrets["google_service_account"]
 
@@ -47,7 +80,12 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapi
 
 credentials_gs = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
 
-gs_client = gspread.authorize(credentials_gs)
+@st.cache_resource
+def get_gspread_client():
+    """One authorized gspread client per process, so its access token survives reruns."""
+    return gspread.authorize(credentials_gs)
+
+gs_client = get_gspread_client()
 
 
 st.set_page_config(
@@ -59,41 +97,287 @@ st.set_page_config(
 
 st.logo(image=coa_logo)
 
+CALL_TRACE_WINDOW = 5000  # most recent external calls kept for the performance page
+CALL_LOG = logging.getLogger("missapp.calls")
+if not CALL_LOG.handlers:
+    _call_log_handler = logging.StreamHandler()
+    _call_log_handler.setFormatter(logging.Formatter("%(message)s"))
+    CALL_LOG.addHandler(_call_log_handler)
+    CALL_LOG.setLevel(logging.INFO)
+    CALL_LOG.propagate = False
+
+def begin_rerun_trace(fragment=False):
+    """
+    Start a new trace ID for this rerun. Fragments call this with fragment=True,
+    because their reruns skip the top of the script; inside a full rerun it does nothing.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None or (fragment and not ctx.fragment_ids_this_run):
+        return
+    st.session_state.trace_rerun = uuid.uuid4().hex[:12]
+
+def set_trace_mode(mode):
+    st.session_state.trace_mode = mode
+
+def trace_context():
+    """(rerun ID, screen) for the current thread; the outbox worker has no session."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return "background", "Sheets outbox"
+    return st.session_state.get("trace_rerun", "startup"), st.session_state.get("trace_mode", "Startup")
+
+def result_rows(result):
+    if isinstance(result, dict) and "valueRanges" in result:
+        return sum(len(r.get("values", [])) for r in result["valueRanges"])
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+RESULT_SIZE_SAMPLE = 50  # rows serialized to estimate the size of a long read
+
+def _sampled_json_size(items):
+    # Long reads are sized from evenly spaced rows rather than serialized in full
+    if len(items) <= RESULT_SIZE_SAMPLE:
+        return len(json.dumps(items, separators=(",", ":"), default=str))
+    step = len(items) / RESULT_SIZE_SAMPLE
+    sample = [items[int(i * step)] for i in range(RESULT_SIZE_SAMPLE)]
+    return round(len(json.dumps(sample, separators=(",", ":"), default=str)) * len(items) / RESULT_SIZE_SAMPLE)
+
+def result_bytes(result):
+    """Approximate size of a Sheets or Drive response, as the JSON it arrived as; None for other results."""
+    if isinstance(result, list):
+        return _sampled_json_size(result)
+    if isinstance(result, dict):
+        if isinstance(result.get("valueRanges"), list):
+            return sum(_sampled_json_size(r.get("values", [])) for r in result["valueRanges"])
+        return len(json.dumps(result, separators=(",", ":"), default=str))
+    return None
+
+class CallTracer:
+    """
+    Times every gspread, Drive and Dropbox call, writes one JSON log line per call
+    and keeps the last CALL_TRACE_WINDOW calls for the performance page.
+    """
+
+    def __init__(self, window=CALL_TRACE_WINDOW):
+        self.calls = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, service, method, target, seconds, rows=None, size=None, error=None, wait=0.0):
+        """size is the bytes sent (uploads) or received (reads)."""
+        rerun, mode = trace_context()
+        entry = {
+            "at": datetime.datetime.now(pytz.timezone("America/New_York")).isoformat(timespec="seconds"),
+            "rerun": rerun, "mode": mode, "service": service, "method": method, "target": target,
+            "ms": round(seconds * 1000, 1), "wait_ms": round(wait * 1000, 1), "rows": rows, "bytes": size, "error": error,
+        }
+        with self._lock:
+            self.calls.append(entry)
+        CALL_LOG.info(json.dumps(entry))
+
+    def trace(self, service, method, target, callable_fn, *args, size=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = callable_fn(*args, **kwargs)
+        except Exception as e:
+            self.record(service, method, target, time.perf_counter() - start, size=size, error=type(e).__name__)
+            raise
+        self.record(service, method, target, time.perf_counter() - start, rows=result_rows(result), size=result_bytes(result) if size is None else size)
+        return result
+
+    def frame(self):
+        with self._lock:
+            return pd.DataFrame(list(self.calls))
+
+@st.cache_resource
+def call_tracer():
+    return CallTracer()
+
+def traced(service, method, target, callable_fn, *args, size=None, **kwargs):
+    """Run one Drive or Dropbox call under the process-wide tracer."""
+    return call_tracer().trace(service, method, target, callable_fn, *args, size=size, **kwargs)
+
+def sheets_target(callable_fn, args):
+    owner = getattr(callable_fn, "__self__", None)
+    if hasattr(owner, "spreadsheet"):  # Worksheet
+        return f"{getattr(owner.spreadsheet, 'title', owner.spreadsheet_id)} / {owner.title}"
+    if hasattr(owner, "worksheets"):  # Spreadsheet
+        return getattr(owner, "title", owner.id)
+    return str(args[0]) if args else ""
+
+begin_rerun_trace()
+
+SHEETS_READS_PER_MINUTE = 60  # per-user Sheets API quota; every session shares the one service account
+SHEETS_WRITES_PER_MINUTE = 60
+SHEETS_MAX_RETRIES = 5
+SHEETS_MAX_BACKOFF = 32  # seconds
+
+SHEETS_WRITE_METHODS = {
+    "append_row", "append_rows", "update", "update_cell", "update_cells", "batch_update",
+    "values_batch_update", "values_update", "values_append", "add_worksheet", "clear", "batch_clear",
+}
+
+# Reads whose result is plain data, so concurrent identical calls can share one response
+SHEETS_SHARED_READS = {"get_all_records", "get_all_values", "col_values", "row_values", "get", "batch_get", "values_batch_get"}
+
+class TokenBucket:
+    """Allows rate_per_minute calls a minute, with bursts of up to half of that."""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1, rate_per_minute // 2)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SheetsQuota:
+    """
+    Process-wide gate for Google Sheets calls: a read and a write token bucket
+    sized to the API quota, retries with exponential backoff and jitter on 429
+    and 5xx, and singleflight for identical reads, so sessions that load the
+    same sheet at the same moment share one response.
+    """
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE, tracer=None):
+        self.tracer = tracer
+        self.reads = TokenBucket(reads_per_minute)
+        self.writes = TokenBucket(writes_per_minute)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def retryable(error):
+        if isinstance(error, gspread.exceptions.APIError):
+            code = getattr(error, "code", None)
+        elif isinstance(error, HttpError):
+            code = error.resp.status
+        else:
+            return False
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return False
+        return code == 429 or code >= 500
+
+    @staticmethod
+    def read_key(callable_fn, args, kwargs):
+        name = getattr(callable_fn, "__name__", "")
+        owner = getattr(callable_fn, "__self__", None)
+        if name not in SHEETS_SHARED_READS or owner is None:
+            return None
+        return (
+            type(owner).__name__, getattr(owner, "spreadsheet_id", None), getattr(owner, "id", None),
+            name, repr(args), repr(sorted(kwargs.items())),
+        )
+
+    def _attempt(self, bucket, callable_fn, args, kwargs):
+        queued = time.perf_counter()
+        bucket.acquire()
+        if self.tracer is None:
+            return callable_fn(*args, **kwargs)
+        start = time.perf_counter()
+        method, target = getattr(callable_fn, "__name__", "call"), sheets_target(callable_fn, args)
+        try:
+            result = callable_fn(*args, **kwargs)
+        except Exception as e:
+            code = getattr(e, "code", None) or getattr(getattr(e, "resp", None), "status", None)
+            self.tracer.record("sheets", method, target, time.perf_counter() - start, error=f"{type(e).__name__} {code or ''}".strip(), wait=start - queued)
+            raise
+        self.tracer.record("sheets", method, target, time.perf_counter() - start, rows=result_rows(result), size=result_bytes(result), wait=start - queued)
+        return result
+
+    def _call(self, callable_fn, *args, **kwargs):
+        bucket = self.writes if getattr(callable_fn, "__name__", "") in SHEETS_WRITE_METHODS else self.reads
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            try:
+                return self._attempt(bucket, callable_fn, args, kwargs)
+            except (gspread.exceptions.APIError, HttpError) as e:
+                if attempt == SHEETS_MAX_RETRIES or not self.retryable(e):
+                    raise
+            time.sleep(min(SHEETS_MAX_BACKOFF, 2 ** attempt) + random.uniform(0, 1))
+
+    def call(self, callable_fn, *args, **kwargs):
+        key = self.read_key(callable_fn, args, kwargs)
+        if key is None:
+            return self._call(callable_fn, *args, **kwargs)
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)  # callers may modify what they get back
+
+        try:
+            flight.result = self._call(callable_fn, *args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+@st.cache_resource
+def sheets_quota():
+    return SheetsQuota(tracer=call_tracer())
+
+def sheets_call(callable_fn, *args, **kwargs):
+    """Run a gspread call through the shared quota; errors are raised to the caller."""
+    return sheets_quota().call(callable_fn, *args, **kwargs)
+
+class StepFailed(Exception):
+    """Raised instead of st.stop() inside a run_steps step, where st.stop() cannot end the run."""
+
+_step_state = threading.local()
+
+def stop_with_error(message):
+    """st.error and st.stop(), or inside a run_steps step raise StepFailed for run_steps to report."""
+    if getattr(_step_state, "active", False):
+        raise StepFailed(message)
+    st.error(message, icon=":material/error:")
+    st.stop()
+
 def safe_gspread_call(callable_fn, *args, error_message="A Google Sheets error occurred. Please try again.", **kwargs):
-    import gspread
     try:
-        return callable_fn(*args, **kwargs)
-    except gspread.exceptions.APIError:
-        st.error(f"{error_message}", icon=":material/error:")
-        st.stop()
+        return sheets_call(callable_fn, *args, **kwargs)
+    except gspread.exceptions.APIError as e:
+        if SheetsQuota.retryable(e):
+            error_message = f"{error_message} Google Sheets is busy right now; please wait a minute before trying again."
+        stop_with_error(error_message)
 
 def get_weekday_index(day_name):
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     return days.index(day_name)
 
-def get_prior_legit_miss_count(master_records, address, this_row_date, this_row_called_in_time):
+def get_prior_legit_miss_count(history, address, this_row_date, this_row_called_in_time):
     """
     Returns the number of legit missed stops for this address
     *before* this row, based on date and time called in (unique per row).
     """
-    prior_rows = []
-    for row in master_records:
-        # Skip this row itself by comparing date + time called in
-        if (
-            row.get("Address") == address and
-            str(row.get("Date")) < str(this_row_date)
-        ):
-            if str(row.get("Collection Status", "").strip().upper()) in LEGIT_MISS_STATUSES:
-                prior_rows.append(row)
-        # If same day, check time
-        elif (
-            row.get("Address") == address and
-            str(row.get("Date")) == str(this_row_date) and
-            str(row.get("Time Called In")) < str(this_row_called_in_time)
-        ):
-            if str(row.get("Collection Status", "").strip().upper()) in LEGIT_MISS_STATUSES:
-                prior_rows.append(row)
-    return len(prior_rows)
+    return history.count_before(address, this_row_date, this_row_called_in_time)
 
 def get_services_for_completion(today):
     # today is a datetime.date
@@ -108,15 +392,37 @@ def get_services_for_completion(today):
         valid_services.remove("SS")
     return valid_services
 
-def is_service_type_scheduled_today(service_type, today, address_df):
+def miss_status(repo, today, service_type, zone, address_index):
+    """Collection Status for a new miss called in on today: "Premature" or "Pending"."""
+    # Completion status for this service type ("MSW", "SS", or "YW"), from the shared cache
+    completion_status = repo.completion_status(today, service_type)
+
+    # --- UPDATED LOGIC FOR PREMATURE ---
+    # Only mark Premature if:
+    # (A) This zone is *yesterday* relative to today
+    # (B) Completion not yet marked
+    # (C) This service type is actually scheduled today anywhere (optional safeguard)
+
+    today_index = today.weekday()  # Monday=0 ... Sunday=6
+    zone_day_index = get_weekday_index(zone)  # e.g., "Sunday" => 6
+
+    # Only "Premature" if today is the day after the zone day
+    if (
+        completion_status == "NOT COMPLETE" and
+        (today_index - zone_day_index) % 7 == 1 and
+        is_service_type_scheduled_today(service_type, today, address_index)
+    ):
+        return "Premature"
+    return "Pending"
+
+def is_service_type_scheduled_today(service_type, today, address_index):
     """
     Returns True if the given service_type (e.g., 'MSW', 'SS', 'YW')
     is actually scheduled for today anywhere in the address list.
     Example: No YW on Monday, No SS on Thursday.
     """
     day_name = today.strftime("%A")  # "Monday", etc.
-    zone_field = f"{service_type} Zone"
-    return any(str(row[zone_field]).strip().lower() == day_name.lower() for row in address_df)
+    return day_name.lower() in address_index.scheduled_days[service_type]
 
 
 def user_login(authenticator, credentials):
@@ -135,6 +441,75 @@ def user_login(authenticator, credentials):
     authenticator.logout("Logout", "sidebar")
     return name, username, user_role
 
+_startup_marks = []
+
+def mark_startup(label):
+    _startup_marks.append((label, time.perf_counter()))
+
+def startup_timing_report():
+    """
+    Sidebar breakdown of this rerun's startup cost, for admins. The first rerun of a
+    session is reported as cold and later ones as warm, so the two can be compared.
+    """
+    phases = []
+    prev = RERUN_STARTED
+    for label, t in _startup_marks:
+        phases.append({"Phase": label, "ms": round((t - prev) * 1000, 1)})
+        prev = t
+    phases.append({"Phase": "Total", "ms": round((prev - RERUN_STARTED) * 1000, 1)})
+
+    timings = st.session_state.setdefault("startup_timings", {})
+    timings["warm" if "cold" in timings else "cold"] = phases
+
+    with st.sidebar.expander("Startup timing", expanded=False):
+        for kind in ("cold", "warm"):
+            if kind in timings:
+                st.caption(f"{kind.title()} rerun")
+                st.dataframe(pd.DataFrame(timings[kind]), hide_index=True, use_container_width=True)
+
+def rerun_fragment():
+    """st.rerun() of just the calling fragment when it is running on its own, else of the whole app."""
+    ctx = get_script_run_ctx()
+    st.rerun(scope="fragment" if ctx and ctx.fragment_ids_this_run else "app")
+
+def run_steps(steps):
+    """
+    Run independent named steps ({name: callable}) on a thread pool.
+    Returns ({name: result}, {name: seconds}). Steps raise rather than stop; once all
+    have finished, any failures are reported and the run is stopped here.
+    """
+    ctx = get_script_run_ctx()
+    timings = {}
+    errors = {}
+
+    def timed(name, fn):
+        add_script_run_ctx(threading.current_thread(), ctx)  # lets steps use st.* and cached resources
+        _step_state.active = True
+        started = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            errors[name] = e
+        finally:
+            _step_state.active = False
+            timings[name] = time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max(1, len(steps))) as pool:
+        futures = {name: pool.submit(timed, name, fn) for name, fn in steps.items()}
+    if errors:
+        for name, e in errors.items():
+            st.error(f"{name}: {e}", icon=":material/error:")
+        st.stop()
+    return {name: future.result() for name, future in futures.items()}, timings
+
+def role_sheet_titles(user_role, today):
+    """Drive titles each role needs on a normal page load, resolved together in one query."""
+    if user_role == "city":
+        return [get_sheet_title(today), get_completion_times_sheet_title(today), MASTER_LOG_TITLE]
+    if user_role == "jpm":
+        return [get_sheet_title(today), MASTER_LOG_TITLE, get_completion_times_sheet_title(today)]
+    return []
+
 def generate_all_minutes():
     times = []
     for hour in range(0, 24):
@@ -214,7 +589,7 @@ def updates():
         st.link_button("📄 View Full Docs", DOC_LINK)
 
     with sht_col:
-        st.link_button("Open Sheet", f"https://docs.google.com/spreadsheets/d/{weekly_id}/edit")
+        st.link_button("Open Sheet", f"https://docs.google.com/spreadsheets/d/{weekly_id}/edit", disabled=not weekly_id)
 
     with fold_col:
         st.link_button("Open Folder", f"https://drive.google.com/drive/u/0/folders/1ogx3zPeIdTKp7C5EJ5jKavFv21mDmySj")
@@ -247,15 +622,206 @@ DAY_TABS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
 
 LEGIT_MISS_STATUSES = ("PENDING", "DISPATCHED", "NOT OUT", "PICKED UP")
 
-def calculate_times_missed(master_records, address):
-    return sum(
-        1
-        for row in master_records
-        if (
-            row.get("Address") == address and
-            str(row.get("Collection Status", "")).strip().upper() in LEGIT_MISS_STATUSES
+COMPLETED_STATUSES = ("PICKED UP", "REJECTED", "CONFIRMED PREMATURE", "ONE TIME EXCEPTION", "NOT OUT", "CREATED IN ERROR", "LATE PUT OUT")
+
+COMPLETION_COLUMNS = ["Service Type", "Completion Status", "Completion Time", "Submitted At", "Submitted By"]
+
+def calculate_times_missed(history, address):
+    return history.count(address)
+
+def normalize_address(address):
+    return str(address or "").strip().upper()
+
+def called_in_minutes(value):
+    """
+    Minutes past midnight for a "Time Called In" value ("%I:%M %p"), or -1 if blank/unparseable.
+    """
+    try:
+        t = datetime.datetime.strptime(str(value).strip(), "%I:%M %p")
+    except ValueError:
+        return -1
+    return t.hour * 60 + t.minute
+
+class MissLookup:
+    """
+    Per-address lookups over self._entries: normalized address -> keys sorted by
+    (date, minutes called in), so counts and last misses are binary searches.
+    """
+
+    def count(self, address):
+        return len(self._entries.get(normalize_address(address), ()))
+
+    def last(self, address):
+        entries = self._entries.get(normalize_address(address))
+        return entries[-1][0] if entries else None
+
+    def _position(self, address, date, time_called_in):
+        entries = self._entries.get(normalize_address(address), [])
+        return entries, bisect.bisect_left(entries, (str(date), called_in_minutes(time_called_in)))
+
+    def count_before(self, address, date, time_called_in):
+        return self._position(address, date, time_called_in)[1]
+
+    def last_before(self, address, date, time_called_in):
+        entries, i = self._position(address, date, time_called_in)
+        return entries[i - 1][0] if i else None
+
+class MissHistoryIndex(MissLookup):
+    """
+    Legit misses per normalized address, kept sorted by (date, time called in) so
+    "how many before this one" and "last miss" are binary searches instead of
+    scans of the whole Master Misses Log.
+    """
+
+    def __init__(self, master_records, generation=0):
+        self._lock = threading.Lock()
+        self._entries = {}  # normalized address -> sorted [(date, minutes, missid)]
+        self._by_missid = {}  # missid -> (normalized address, sort key, status)
+        self.generation = generation  # the MasterLogSnapshot generation it was built from
+        for row in master_records:
+            self._add(row)
+
+    @staticmethod
+    def _key(row):
+        return (str(row.get("Date", "")), called_in_minutes(row.get("Time Called In")), str(row.get("MissID", "")))
+
+    def _add(self, row):
+        address = normalize_address(row.get("Address"))
+        key = self._key(row)
+        status = str(row.get("Collection Status", "")).strip().upper()
+        if key[2]:
+            self._by_missid[key[2]] = (address, key, status)
+        if status in LEGIT_MISS_STATUSES:
+            bisect.insort(self._entries.setdefault(address, []), key)
+
+    def add_row(self, row):
+        """Record a row that this app just appended to the master log."""
+        with self._lock:
+            self._add(row)
+
+    def set_status(self, missid, status):
+        """Move a MissID in or out of the legit-miss entries after a status change."""
+        with self._lock:
+            if missid not in self._by_missid:
+                return
+            address, key, old_status = self._by_missid[missid]
+            new_status = str(status).strip().upper()
+            self._by_missid[missid] = (address, key, new_status)
+            was_legit = old_status in LEGIT_MISS_STATUSES
+            is_legit = new_status in LEGIT_MISS_STATUSES
+            entries = self._entries.setdefault(address, [])
+            if was_legit and not is_legit:
+                i = bisect.bisect_left(entries, key)
+                if i < len(entries) and entries[i] == key:
+                    del entries[i]
+            elif is_legit and not was_legit:
+                bisect.insort(entries, key)
+
+@st.cache_resource
+def _miss_history_store():
+    return {}
+
+def get_miss_history(master_id, master_records, generation):
+    """
+    Shared MissHistoryIndex for the master log. Rebuilt only from records of a newer
+    MasterLogSnapshot generation (the sheet changed outside this app), so sessions
+    holding older or overlaid copies reuse it; this app's own writes are applied
+    incrementally via add_row/set_status.
+    """
+    store = _miss_history_store()
+    history = store.get(master_id)
+    if history is None or generation > history.generation:
+        history = MissHistoryIndex(master_records, generation)
+        store[master_id] = history
+    return history
+
+ROLLUP_COLUMNS = ["Address", "Times Missed", "Last Missed", "Missed On"]
+
+class MissRollup(MissLookup):
+    """
+    Legit misses per normalized address for rows moved out of the active Master
+    Misses Log. The archive keeps the rows; this summary keeps Times Missed and
+    Last Missed correct without reading them. "Missed On" lists every
+    "date HH:MM" so the count_before/last_before lookups stay exact.
+    """
+
+    def __init__(self):
+        self._entries = {}  # normalized address -> sorted [(date, minutes)]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from archived master rows."""
+        rollup = cls()
+        for row in rows:
+            if str(row.get("Collection Status", "")).strip().upper() in LEGIT_MISS_STATUSES:
+                key = (str(row.get("Date", "")), called_in_minutes(row.get("Time Called In")))
+                rollup._entries.setdefault(normalize_address(row.get("Address")), []).append(key)
+        for entries in rollup._entries.values():
+            entries.sort()
+        return rollup
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from the rows of the rollup tab. Raises ValueError on a malformed "Missed On" cell."""
+        rollup = cls()
+        for record in records:
+            entries = []
+            for item in str(record.get("Missed On", "")).split(";"):
+                date, _, hhmm = item.strip().partition(" ")
+                if not date:
+                    continue
+                if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", date) or (hhmm and not re.fullmatch(r"\d{1,2}:\d{2}", hhmm)):
+                    raise ValueError(f"Bad 'Missed On' entry {item.strip()!r}")
+                hours, _, mins = hhmm.partition(":")
+                entries.append((date, int(hours) * 60 + int(mins) if mins else -1))
+            if entries:
+                rollup._entries[normalize_address(record.get("Address"))] = sorted(entries)
+        return rollup
+
+    def to_values(self):
+        rows = [ROLLUP_COLUMNS]
+        for address, entries in sorted(self._entries.items()):
+            missed_on = "; ".join(f"{d} {m // 60:02d}:{m % 60:02d}" if m >= 0 else d for d, m in entries)
+            rows.append([address, len(entries), entries[-1][0], missed_on])
+        return rows
+
+    def __len__(self):
+        return len(self._entries)
+
+class ArchivedHistory:
+    """A history of the active log with the archived misses from a MissRollup added in."""
+
+    def __init__(self, active, rollup):
+        self.active = active
+        self.rollup = rollup
+
+    @staticmethod
+    def _latest(*dates):
+        return max((d for d in dates if d), default=None)
+
+    def count(self, address):
+        return self.active.count(address) + self.rollup.count(address)
+
+    def last(self, address):
+        return self._latest(self.active.last(address), self.rollup.last(address))
+
+    def count_before(self, address, date, time_called_in):
+        return self.active.count_before(address, date, time_called_in) + self.rollup.count_before(address, date, time_called_in)
+
+    def last_before(self, address, date, time_called_in):
+        return self._latest(
+            self.active.last_before(address, date, time_called_in), self.rollup.last_before(address, date, time_called_in)
         )
-    )
+
+    def add_row(self, row):
+        self.active.add_row(row)
+
+    def set_status(self, missid, status):
+        self.active.set_status(missid, status)
+
+@st.cache_resource
+def _miss_rollup_store():
+    return {}
 
 def upload_image_to_drive(file, folder_id, credentials):
     import io
@@ -269,37 +835,102 @@ def upload_image_to_drive(file, folder_id, credentials):
         "name": filename,
         "parents": [folder_id]
     }
-    media = MediaIoBaseUpload(io.BytesIO(file.read()), mimetype=file.type)
-    uploaded_file = drive_service.files().create(
+    data = file.read()
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=file.type)
+    uploaded_file = traced("drive", "files.create", filename, drive_service.files().create(
         body=file_metadata,
         media_body=media,
         fields="id"
-    ).execute()
+    ).execute, size=len(data))
 
     file_id = uploaded_file.get("id")
     return f"https://drive.google.com/uc?id={file_id}"
 
+MASTER_LOG_TITLE = "Master Misses Log"
+
+MASTER_ARCHIVE_TITLE = "Master Misses Archive"  # one tab per year of archived rows, plus the rollup tab
+MASTER_ROLLUP_TAB = "Rollup"
+MASTER_ARCHIVE_AFTER_DAYS = 90  # default age before a closed miss is archived
+MASTER_ROLLUP_TTL = 600  # seconds a process trusts its copy of the rollup tab
+
+DRIVE_ID_TTL = 600  # seconds a resolved title -> file ID is trusted
+
+@st.cache_resource
+def get_drive_service():
+    """One Drive API client per process instead of a build() on every rerun."""
+    return build('drive', 'v3', credentials=credentials_gs)
+
+class DriveFileResolver:
+    """
+    Spreadsheet title -> Drive file ID within one folder, cached for DRIVE_ID_TTL
+    seconds. Titles that are not cached yet are resolved together in one files().list query.
+    """
+
+    def __init__(self, folder_id, ttl=DRIVE_ID_TTL):
+        self.folder_id = folder_id
+        self.ttl = ttl
+        self._ids = {}  # title -> (file_id, resolved_at)
+        self._lock = threading.Lock()
+
+    def resolve_many(self, drive, titles):
+        now = time.monotonic()
+        missing = [t for t in dict.fromkeys(titles) if t not in self._ids or now - self._ids[t][1] > self.ttl]
+        if missing:
+            names = " or ".join("name='{}'".format(t.replace("'", "\\'")) for t in missing)
+            # The Drive client is shared process-wide and is not thread-safe
+            with self._lock:
+                results = traced("drive", "files.list", ", ".join(missing), drive.files().list(
+                    q=f"'{self.folder_id}' in parents and ({names}) and mimeType='application/vnd.google-apps.spreadsheet'",
+                    fields="files(id, name)"
+                ).execute)
+            found = {}
+            for f in results.get('files', []):
+                found.setdefault(f['name'], f['id'])
+            for title, file_id in found.items():
+                self._ids[title] = (file_id, now)
+        return {t: self._ids[t][0] if t in self._ids else None for t in titles}
+
+    def resolve(self, drive, title):
+        return self.resolve_many(drive, [title])[title]
+
+    def invalidate(self, title):
+        self._ids.pop(title, None)
+
+    def version(self, drive, file_id):
+        """The file's Drive version and modifiedTime as one change marker, or None if Drive can't say."""
+        try:
+            with self._lock:
+                meta = traced("drive", "files.get", file_id, drive.files().get(fileId=file_id, fields="version, modifiedTime").execute)
+        except HttpError:
+            return None
+        return f"{meta.get('version')}@{meta.get('modifiedTime')}"
+
+@st.cache_resource
+def drive_file_resolver(folder_id):
+    return DriveFileResolver(folder_id)
+
+def prefetch_sheet_ids(drive, folder_id, titles):
+    """Warm the resolver for several sheets with a single Drive query."""
+    return drive_file_resolver(folder_id).resolve_many(drive, titles)
+
 def get_completion_times_sheet_title(today):
     next_saturday = get_next_saturday(today)
     return f"Completion Times Week Ending {next_saturday.strftime('%Y-%m-%d')}"
 
 def ensure_completion_times_gsheet_exists(drive, folder_id, title):
-    results = drive.files().list(
-        q=f"'{folder_id}' in parents and name='{title}' and mimeType='application/vnd.google-apps.spreadsheet'",
-        fields="files(id, name)"
-    ).execute()
-    files = results.get('files', [])
-    if files:
-        return files[0]['id']
+    file_id = drive_file_resolver(folder_id).resolve(drive, title)
+    if file_id:
+        return file_id
     else:
         # If you want to create it automatically, implement creation logic here.
-        st.error(
+        stop_with_error(
             f"Completion Times sheet '{title}' does not exist in the specified folder.\n"
-            "Please contact your admin to create this week's completion log sheet.", icon=":material/error:"
+            "Please contact your admin to create this week's completion log sheet."
         )
-        st.stop()
 
+@st.fragment
 def submit_completion_time_section():
+    begin_rerun_trace(fragment=True)
     st.subheader("Submit Completion Time")
 
     today = datetime.datetime.now(pytz.timezone("America/New_York")).date()
@@ -307,38 +938,28 @@ def submit_completion_time_section():
         st.info("Completion times cannot be submitted on Sundays. Please return on a service day (Monday–Saturday).", icon=":material/calendar_clock:")
         return
 
-    completion_sheet_title = get_completion_times_sheet_title(today)
-    drive = build('drive', 'v3', credentials=credentials_gs)
-    completion_sheet_id = ensure_completion_times_gsheet_exists(drive, FOLDER_ID, completion_sheet_title)
-    completion_times_ws = gs_client.open_by_key(completion_sheet_id).worksheet(get_today_tab_name(today))
+    repo = get_miss_repository()
 
-    def auto_fill_skipped_services(completion_times_ws, today):
-        filled = []
-        weekday = today.weekday()
+    def auto_fill_skipped_services(repo, today):
+        # Monday has no YW and Thursday no SS collection, so those are completed automatically
+        skipped = {0: {"YW": "Yard Waste"}, 3: {"SS": "Recycle"}}.get(today.weekday(), {})
+        if not skipped:
+            return []
         now_str = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
-        if weekday == 0:  # Monday, auto-complete YW
-            records = completion_times_ws.get_all_records()
-            for idx, row in enumerate(records, start=2):
-                if row.get("Service Type") == "YW" and row.get("Completion Status", "").strip().upper() != "COMPLETE":
-                    completion_times_ws.update(
-                        f"B{idx}:E{idx}", [["COMPLETE", "N/A", now_str, "System Auto-Fill"]]
-                    )
-                    filled.append("Yard Waste")
-        if weekday == 3:  # Thursday, auto-complete SS
-            records = completion_times_ws.get_all_records()
-            for idx, row in enumerate(records, start=2):
-                if row.get("Service Type") == "SS" and row.get("Completion Status", "").strip().upper() != "COMPLETE":
-                    completion_times_ws.update(
-                        f"B{idx}:E{idx}", [["COMPLETE", "N/A", now_str, "System Auto-Fill"]]
-                    )
-                    filled.append("Recycle")
-        return filled
-    auto_filled = auto_fill_skipped_services(completion_times_ws, today)
+        fills = {
+            row.get("Service Type"): ["COMPLETE", "N/A", now_str, "System Auto-Fill"]
+            for row in repo.completion_times(today)
+            if row.get("Service Type") in skipped and row.get("Completion Status", "").strip().upper() != "COMPLETE"
+        }
+        if fills:
+            repo.update_completion_times(today, fills)  # one batch write
+        return [skipped[svc] for svc in fills]
+    auto_filled = auto_fill_skipped_services(repo, today)
     if auto_filled:
         st.info(f"Auto-filled completion for: {', '.join(auto_filled)} (no service on previous day).", icon=":material/calendar_apps_script:")
 
     # Fetch all rows; assume 1 header + 3 rows (MSW, SS, YW)
-    sheet_data = safe_gspread_call(completion_times_ws.get_all_records, error_message="Could not fetch completion times from Google Sheets.")
+    sheet_data = repo.completion_times(today)
 
     valid_services = get_services_for_completion(today)
 
@@ -360,7 +981,8 @@ def submit_completion_time_section():
             st.write(f"**{service_type}** not yet completed.")
             time_key = f"completion_time_{service_type}"
             if time_key not in st.session_state:
-                st.session_state[time_key] = now_str if now_str in time_options else time_options[0]
+                current_time_str = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%I:%M %p")
+                st.session_state[time_key] = current_time_str if current_time_str in time_options else time_options[0]
             selected_time = st.selectbox(
                 f"Select completion time for {service_type}",
                 time_options,
@@ -369,21 +991,17 @@ def submit_completion_time_section():
                     
             if st.button(f"Submit {service_type}", key=f"submit_{service_type}"):
                 now_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
-                completion_times_ws.update(
-                    f"B{row_idx}:E{row_idx}",
-                    [["COMPLETE", st.session_state[time_key], now_time, name]]
-                )
+                repo.update_completion_times(today, {service_type: ["COMPLETE", st.session_state[time_key], now_time, name]})
                 st.info(f"Completion time for {service_type} recorded at {st.session_state[time_key]} by {name}.", icon=":material/task:")
                 del st.session_state[time_key]  # Clear it after submission
-                st.rerun()
+                rerun_fragment()
 
 
     # --- DIALOG DEFINITION ---
     @st.dialog("WARNING: This will clear all existing submissions in the sheet for today. Continue?")
     def clear_all_dialog():
         if st.button("Yes, Clear All"):
-            for i in range(2, 5):  # Rows 2,3,4 (Google Sheets 1-indexed)
-                completion_times_ws.update(f"B{i}:E{i}", [["NOT COMPLETE", "", "", ""]])
+            repo.update_completion_times(today, {svc: ["NOT COMPLETE", "", "", ""] for svc in ("MSW", "SS", "YW")})
             st.info("All submissions cleared.", icon=":material/delete_sweep:")
             st.rerun()
         if st.button("Cancel"):
@@ -405,45 +1023,143 @@ def get_next_saturday(today):
         days_until_sat = 5 - today.weekday()
         return today + datetime.timedelta(days=days_until_sat)
 
-def upload_to_dropbox(file, row_index, service_type):
-    import dropbox
-    app_key = st.secrets["dropbox"]["app_key"]
-    app_secret = st.secrets["dropbox"]["app_secret"]
-    refresh_token = st.secrets["dropbox"]["refresh_token"]
-    dbx = dropbox.Dropbox(
-        oauth2_refresh_token=refresh_token,
-        app_key=app_key,
-        app_secret=app_secret
-    )
-    filename = f"{row_index}-{service_type}-{today_str}"
-    
-    ext = ""
+IMAGE_SETTINGS = {
+    "max_edge": 2048,  # pixels on the long side
+    "quality": 80,
+    "format": "jpeg",  # or "webp"
+    "thumbnail_edge": 480,
+}
+
+DROPBOX_CHUNK_SIZE = 4 * 1024 * 1024  # files above this go through an upload session
+
+def image_settings():
+    """IMAGE_SETTINGS, overridable from the [images] secrets section."""
+    return {**IMAGE_SETTINGS, **st.secrets.get("images", {})}
+
+def original_extension(file):
     if hasattr(file, "name") and "." in file.name:
-        ext = file.name[file.name.rfind("."):]
-    elif hasattr(file, "type"):
-        mime_map = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/heic": ".heic"}
-        ext = mime_map.get(getattr(file, "type", ""), "")
+        return file.name[file.name.rfind("."):]
+    mime_map = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/heic": ".heic"}
+    return mime_map.get(getattr(file, "type", ""), "")
 
-    filename += ext
+@st.cache_data(max_entries=8, show_spinner=False)
+def prepare_image(data, extension, max_edge, quality, image_format, thumbnail_edge):
+    """
+    Upright, downscaled and re-encoded copy of an uploaded photo plus a small
+    JPEG thumbnail for the preview. Returns (bytes, extension, thumbnail).
+    Anything Pillow cannot open (e.g. HEIC without pillow-heif) is passed through
+    unchanged with no thumbnail.
+    """
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    except (UnidentifiedImageError, OSError):
+        return data, extension, None
+
+    exif = img.getexif()
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if image_format.lower() == "webp":
+        img.save(out, "WEBP", quality=quality, method=4, exif=exif)
+        encoded, new_extension = out.getvalue(), ".webp"
+    else:
+        img.save(out, "JPEG", quality=quality, optimize=True, progressive=True, exif=exif)
+        encoded, new_extension = out.getvalue(), ".jpg"
 
-    dropbox_path = f"/missed_stops/{filename}"
+    thumb = img.copy()
+    thumb.thumbnail((thumbnail_edge, thumbnail_edge), Image.LANCZOS)
+    thumb_out = io.BytesIO()
+    thumb.save(thumb_out, "JPEG", quality=70)
+    return encoded, new_extension, thumb_out.getvalue()
+
+def prepared_image(file):
+    settings = image_settings()
     file.seek(0)
-    dbx.files_upload(file.read(), dropbox_path, mode=dropbox.files.WriteMode.overwrite)
+    return prepare_image(
+        file.read(), original_extension(file),
+        int(settings["max_edge"]), int(settings["quality"]), str(settings["format"]), int(settings["thumbnail_edge"])
+    )
+
+def dropbox_upload(data, dropbox_path, mode):
+    """files_upload for small files; an upload session in DROPBOX_CHUNK_SIZE pieces for large ones."""
+    if len(data) <= DROPBOX_CHUNK_SIZE:
+        return traced("dropbox", "files_upload", dropbox_path, dbx.files_upload, data, dropbox_path, mode=mode, size=len(data))
+    session = traced("dropbox", "upload_session_start", dropbox_path, dbx.files_upload_session_start, data[:DROPBOX_CHUNK_SIZE], size=DROPBOX_CHUNK_SIZE)
+    cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=DROPBOX_CHUNK_SIZE)
+    while len(data) - cursor.offset > DROPBOX_CHUNK_SIZE:
+        traced("dropbox", "upload_session_append", dropbox_path, dbx.files_upload_session_append_v2,
+               data[cursor.offset:cursor.offset + DROPBOX_CHUNK_SIZE], cursor, size=DROPBOX_CHUNK_SIZE)
+        cursor.offset += DROPBOX_CHUNK_SIZE
+    return traced(
+        "dropbox", "upload_session_finish", dropbox_path, dbx.files_upload_session_finish,
+        data[cursor.offset:], cursor, dropbox.files.CommitInfo(path=dropbox_path, mode=mode), size=len(data) - cursor.offset
+    )
 
+DROPBOX_FOLDER = "/missed_stops"
+
+@st.cache_resource
+def dropbox_link_cache():
+    """Process-wide Dropbox path -> shared URL, and (MissID, content hash) -> shared URL."""
+    return {}
+
+def dropbox_upload_once(data, dropbox_path):
+    """
+    Upload without overwriting. Dropbox accepts identical content at an existing path
+    as is; a conflict means another copy of the file (the name carries its hash) got
+    there first, so both count as uploaded, without a metadata round trip beforehand.
+    """
     try:
-        link_metadata = dbx.sharing_create_shared_link_with_settings(dropbox_path)
+        dropbox_upload(data, dropbox_path, dropbox.files.WriteMode.add)
+    except dropbox.exceptions.ApiError as e:
+        error = e.error
+        if isinstance(error, dropbox.files.UploadError) and error.is_path() and error.get_path().reason.is_conflict():
+            return
+        if isinstance(error, dropbox.files.UploadSessionFinishError) and error.is_path() and error.get_path().is_conflict():
+            return
+        raise
+
+def dropbox_shared_link(dropbox_path):
+    links = dropbox_link_cache()
+    if dropbox_path in links:
+        return links[dropbox_path]
+    try:
+        link_metadata = traced("dropbox", "create_shared_link", dropbox_path, dbx.sharing_create_shared_link_with_settings, dropbox_path)
         url = link_metadata.url
     except dropbox.exceptions.ApiError as e:
         if (isinstance(e.error, dropbox.sharing.CreateSharedLinkWithSettingsError) and
             e.error.is_shared_link_already_exists()):
-            links = dbx.sharing_list_shared_links(path=dropbox_path, direct_only=True).links
-            if links:
-                url = links[0].url
+            links_found = traced("dropbox", "list_shared_links", dropbox_path, dbx.sharing_list_shared_links, path=dropbox_path, direct_only=True).links
+            if links_found:
+                url = links_found[0].url
             else:
                 raise RuntimeError("Could not get existing Dropbox shared link.")
         else:
             raise
-    return url.replace("?dl=0", "?raw=1")
+    links[dropbox_path] = url.replace("?dl=0", "?raw=1")
+    return links[dropbox_path]
+
+def upload_to_dropbox(file, row_index, service_type, day, missid=None):
+    """
+    Upload a completion photo taken on day and return its shared link. The file name
+    carries a hash of the content, so the same photo is only uploaded once and a
+    second stop on the same row and day no longer overwrites the first one's photo.
+    """
+    data, ext, _ = prepared_image(file)
+    digest = hashlib.sha256(data).hexdigest()
+    links = dropbox_link_cache()
+    if missid and (missid, digest) in links:
+        return links[(missid, digest)]  # retry or double click for this miss
+
+    dropbox_path = f"{DROPBOX_FOLDER}/{row_index}-{service_type}-{day.strftime('%-m.%-d.%Y')}-{digest[:12]}{ext}"
+    if dropbox_path not in links:
+        dropbox_upload_once(data, dropbox_path)
+
+    url = dropbox_shared_link(dropbox_path)
+    if missid:
+        links[(missid, digest)] = url
+    return url
 
 def get_sheet_title(today):
     next_saturday = get_next_saturday(today)
@@ -469,42 +1185,96 @@ def get_today_tab_name(today):
 
 
 def ensure_gsheet_exists(drive, folder_id, title):
-    results = drive.files().list(
-        q=f"'{folder_id}' in parents and name='{title}' and mimeType='application/vnd.google-apps.spreadsheet'",
-        fields="files(id, name)"
-    ).execute()
-    files = results.get('files', [])
-    if files:
-        return files[0]['id']
+    file_id = drive_file_resolver(folder_id).resolve(drive, title)
+    if file_id:
+        return file_id
     else:
-        st.error(
+        stop_with_error(
             f"Sheet '{title}' does not exist in the specified folder.\n"
-            "Please contact your admin to create this week's log sheet.", icon=":material/error:"
+            "Please contact your admin to create this week's log sheet."
         )
-        st.stop()
+
+class MissIdRowMap:
+    """
+    MissID -> row number (1-based) for one worksheet. Loaded with a single column
+    read, then kept in step with this app's appends. A lookup miss, a row that no
+    longer holds its MissID, or a changed row count forces a reload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = None
+        self.row_count = 0
+
+    def load(self, ws):
+        col_idx = len(COLUMNS)  # last column
+        missids = safe_gspread_call(ws.col_values, col_idx, error_message="Could not fetch MissIDs from Google Sheets.")
+        self.reset(missids)
+
+    def reset(self, missids):
+        with self._lock:
+            self.rows = {v: i + 1 for i, v in enumerate(missids) if v}
+            self.row_count = len(missids)
+
+    def reset_from_values(self, data):
+        col_idx = len(COLUMNS) - 1
+        self.reset([row[col_idx] if col_idx < len(row) else "" for row in data])
+
+    def lookup(self, ws, missid):
+        if self.rows is None:
+            self.load(ws)
+        row = self.rows.get(missid)
+        if row is None:
+            # May have been appended by someone else since the last load
+            self.load(ws)
+            row = self.rows.get(missid)
+        return row
+
+    def verify(self, missid, row_idx, row_values):
+        """False (and invalidate) if the row no longer holds this MissID, e.g. rows were deleted."""
+        col_idx = len(COLUMNS) - 1
+        if col_idx < len(row_values) and row_values[col_idx] == missid:
+            return True
+        self.rows = None
+        return False
+
+    def check_row_count(self, row_count):
+        if self.rows is not None and row_count != self.row_count:
+            self.rows = None
+
+    def note_appended(self, response, missids):
+        """Record rows added by append_row/append_rows; returns the first new row number."""
+        match = re.search(r"![A-Z]+(\d+)", str((response or {}).get("updates", {}).get("updatedRange", "")))
+        if not match or self.rows is None:
+            self.rows = None
+            return int(match.group(1)) if match else None
+        start = int(match.group(1))
+        with self._lock:
+            for i, missid in enumerate(missids):
+                self.rows[missid] = start + i
+            self.row_count = max(self.row_count, start + len(missids) - 1)
+        return start
+
+@st.cache_resource
+def _missid_row_maps():
+    return {}
+
+def missid_row_map(ws):
+    """Shared MissIdRowMap for a worksheet, reused across reruns and sessions."""
+    return _missid_row_maps().setdefault((ws.spreadsheet_id, ws.id), MissIdRowMap())
 
 def find_row_by_missid(ws, missid):
-    col_idx = len(COLUMNS)  # last column
-    missids = safe_gspread_call(ws.col_values, col_idx, error_message="Could not fetch MissIDs from Google Sheets.")
-    for i, v in enumerate(missids):
-        if v == missid:
-            return i + 1  # Google Sheets rows are 1-based
-    return None
+    return missid_row_map(ws).lookup(ws, missid)
     
 def get_master_log_id(drive, folder_id):
-    results = drive.files().list(
-        q=f"'{folder_id}' in parents and name = 'Master Misses Log' and mimeType = 'application/vnd.google-apps.spreadsheet'",
-        fields="files(id, name)"
-    ).execute()
-    files = results.get('files', [])
-    if files:
-        return files[0]['id']
+    file_id = drive_file_resolver(folder_id).resolve(drive, MASTER_LOG_TITLE)
+    if file_id:
+        return file_id
     else:
-        st.error(
+        stop_with_error(
             "The 'Master Misses Log' sheet does not exist in the specified folder.\n"
-            "Please contact your admin to create the log sheet.", icon=":material/error:"
+            "Please contact your admin to create the log sheet."
         )
-        st.stop()
 
 def colnum_string(n):
     string = ""
@@ -539,787 +1309,2503 @@ def update_rows(ws, indices, updates, columns=COLUMNS):
     if requests:
         ws.batch_update(requests, value_input_option="USER_ENTERED")
 
-@st.cache_data(ttl=3600)
-def load_address_df(_service_account_info, address_sheet_url):
-    creds = Credentials.from_service_account_info(_service_account_info, scopes=SCOPES)
-    client = gspread.authorize(creds)
-    ws = client.open_by_url(address_sheet_url).get_worksheet(0)
-    return ws.get_all_records()
-address_df = load_address_df(SERVICE_ACCOUNT_INFO, ADDRESS_LIST_SHEET_URL)
-
-def help_page(name, user_role):
-    st.subheader("Help & Support")
-    st.write(
-        "Welcome to the Missed Pickup Portal Help page. "
-        "For detailed documentation, click the “View Full Docs” button above. "
-        "If you would like to submit feedback, request additional features, or report a bug, "
-        "please use the 'Submit Feedback' button below. "
-        "If you are in need of immediate assistance, please contact us via email or phone. "
-        "Thank you for using our service!"
-    )
-
-    st.markdown("---")
-
-    st.write("#### Rate your overall experience:")
-    feedback = st.feedback("thumbs", key="overall_exp")
+def dispatch_updates(row, now_time):
+    updates = {"Time Dispatched": now_time}
+    if str(row.get("Collection Status", "")).strip().upper() != "PREMATURE":
+        updates["Collection Status"] = "Dispatched"
+    return updates
 
-    FEEDBACK_SHEET_ID = "1fUrJymiIfC5GS_ofz9x4czUG6e3b8W63mMwLUyxHvFM"
-    FEEDBACK_SHEET_NAME = "Feedback"
+def dispatch_stops(stops, master_ws, drive, client, now_time, history):
+    """
+    Dispatch a batch of master-log rows with a fixed number of Sheets calls:
+    one MissID read and one batch update on the master, and per weekly spreadsheet one MissID read
+    covering every touched tab plus one values batch update (and one append per
+    tab for rows missing from the weekly log).
 
-    if feedback is not None:
-        # Map thumbs to text
-        rating_map = {0: "Thumbs Down", 1: "Thumbs Up"}
-        rating_text = rating_map.get(feedback, str(feedback))
+    Returns one result dict per stop (MissID, Address, Master, Weekly).
+    """
+    dispatched_col = colnum_string(COLUMNS.index("Time Dispatched") + 1)
+    status_col = colnum_string(COLUMNS.index("Collection Status") + 1)
+    missid_col = colnum_string(len(COLUMNS))
+
+    def cell_requests(row_idx, updates, tab=None):
+        # Only the two dispatch cells are written, so other columns (e.g. formulas) are left alone
+        prefix = f"'{tab}'!" if tab else ""
+        reqs = [{"range": f"{prefix}{dispatched_col}{row_idx}", "values": [[updates["Time Dispatched"]]]}]
+        if "Collection Status" in updates:
+            reqs.append({"range": f"{prefix}{status_col}{row_idx}", "values": [[updates["Collection Status"]]]})
+        return reqs
+
+    results = {
+        row.get("MissID"): {"MissID": row.get("MissID"), "Address": row.get("Address", ""), "Master": "", "Weekly": ""}
+        for row in stops
+    }
 
-        row = [
-            name,
-            user_role,
-            datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S"),
-            "Quick Feedback",
-            "",  # No details for thumbs, just the rating
-            rating_text
-        ]
+    # --- Master Log: cells are written by row number, so the MissID column is read fresh first ---
+    master_rows = missid_row_map(master_ws)
+    master_rows.load(master_ws)
+    master_requests = []
+    for row in stops:
+        missid = row.get("MissID")
+        row_idx = master_rows.rows.get(missid)
+        if row_idx:
+            master_requests += cell_requests(row_idx, dispatch_updates(row, now_time))
+            results[missid]["Master"] = "Dispatched"
+        else:
+            results[missid]["Master"] = "Not found"
+    if master_requests:
+        safe_gspread_call(
+            master_ws.batch_update, master_requests, value_input_option="USER_ENTERED",
+            error_message="Could not update the Master Misses Log. Please try again."
+        )
+        for row in stops:
+            updates = dispatch_updates(row, now_time)
+            if history is not None and results[row.get("MissID")]["Master"] == "Dispatched" and "Collection Status" in updates:
+                history.set_status(row.get("MissID"), updates["Collection Status"])
+
+    # --- Weekly logs: group by spreadsheet, then by tab ---
+    groups = {}
+    for row in stops:
         try:
-            feedback_ws = gs_client.open_by_key(FEEDBACK_SHEET_ID).worksheet(FEEDBACK_SHEET_NAME)
-            feedback_ws.append_row(row)
-            if feedback == 1:
-                st.info("Thanks for the thumbs up!", icon=":material/cheer:")
-            else:
-                st.info("Sorry to hear that. For more detailed feedback or to report an issue, please use the button below.", icon=":material/sentiment_dissatisfied:")
+            miss_date_dt = datetime.datetime.strptime(str(row.get("Date", "")), "%Y-%m-%d").date()
+        except ValueError:
+            results[row.get("MissID")]["Weekly"] = "No valid date"
+            continue
+        groups.setdefault(get_sheet_title(miss_date_dt), {}).setdefault(get_today_tab_name(miss_date_dt), []).append(row)
+
+    sheet_ids = prefetch_sheet_ids(drive, FOLDER_ID, list(groups))
+    for sheet_title, tabs in groups.items():
+        try:
+            if not sheet_ids.get(sheet_title):
+                raise LookupError(f"Sheet '{sheet_title}' does not exist")
+            weekly_ss = sheets_call(client.open_by_key, sheet_ids[sheet_title])
+            worksheets = {ws.title: ws for ws in sheets_call(weekly_ss.worksheets)}
+            for tab_name in [t for t in tabs if t not in worksheets]:
+                for row in tabs.pop(tab_name):
+                    results[row.get("MissID")]["Weekly"] = f"Tab '{tab_name}' not found"
+            if not tabs:
+                continue
+
+            value_ranges = sheets_call(
+                weekly_ss.values_batch_get, [f"'{tab_name}'!{missid_col}:{missid_col}" for tab_name in tabs]
+            ).get("valueRanges", [])
+            requests = []
+            for tab_name, value_range in zip(tabs, value_ranges):
+                ws = worksheets[tab_name]
+                weekly_rows = missid_row_map(ws)
+                weekly_rows.reset([cell[0] if cell else "" for cell in value_range.get("values", [])])
+                to_append = []
+                for row in tabs[tab_name]:
+                    updates = dispatch_updates(row, now_time)
+                    row_idx = weekly_rows.rows.get(row.get("MissID"))
+                    if row_idx:
+                        requests += cell_requests(row_idx, updates, tab_name)
+                        results[row.get("MissID")]["Weekly"] = "Dispatched"
+                    else:
+                        to_append.append({**row, **updates})
+                if to_append:
+                    resp = sheets_call(
+                        ws.append_rows,
+                        [[row.get(col, "") for col in COLUMNS] for row in to_append],
+                        value_input_option="USER_ENTERED"
+                    )
+                    weekly_rows.note_appended(resp, [row.get("MissID") for row in to_append])
+                    for row in to_append:
+                        results[row.get("MissID")]["Weekly"] = "Appended from master"
+            if requests:
+                sheets_call(weekly_ss.values_batch_update, {"valueInputOption": "USER_ENTERED", "data": requests})
         except Exception as e:
-            st.error(f"Failed to write to feedback sheet: {e}", icon=":material/error:")
+            for rows in tabs.values():
+                for row in rows:
+                    if not results[row.get("MissID")]["Weekly"] or results[row.get("MissID")]["Weekly"] == "Dispatched":
+                        results[row.get("MissID")]["Weekly"] = f"Error: {e}"
 
-    st.markdown("---")
+    return list(results.values())
 
-    @st.dialog("Submit Feedback / Report Bug / Request Feature")
-    def feedback_dialog():
-        feedback_type = st.selectbox("Type", ["Bug Report", "Feature Request", "General Feedback"])
-        details = st.text_area("Describe the issue or idea")
-        if st.button("Submit"):
-            row = [
-                name,
-                user_role,
-                datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S"),
-                feedback_type,
-                details,
-                ""  # Leave rating blank for detailed feedback
-            ]
-            try:
-                feedback_ws = gs_client.open_by_key(FEEDBACK_SHEET_ID).worksheet(FEEDBACK_SHEET_NAME)
-                feedback_ws.append_row(row)
-                st.info("Thank you for your feedback! It has been recorded.", icon=":material/feedback:")
-            except Exception as e:
-                st.error(f"Failed to write to feedback sheet: {e}", icon=":material/error:")
-            st.rerun()
+def update_miss_rows(ws, indices, updates, columns=COLUMNS, missid=None):
+    # Rate limits are retried by sheets_call; what still fails stops with an error
+    last_col = colnum_string(len(columns))
+    for idx in indices:
+        row_values = safe_gspread_call(ws.row_values, idx, error_message="Could not fetch row values from Google Sheets.")
+        if missid and not missid_row_map(ws).verify(missid, idx, row_values):
+            # Rows moved since the MissID map was loaded; look it up again
+            idx = find_row_by_missid(ws, missid)
+            if not idx:
+                stop_with_error(f"Could not find MissID {missid} in Google Sheets. It may have been deleted.")
+            row_values = safe_gspread_call(ws.row_values, idx, error_message="Could not fetch row values from Google Sheets.")
 
-    if st.button("Submit Feedback / Report Bug / Request Feature"):
-        feedback_dialog()
+        row_dict = dict(zip(columns, row_values + [""]*(len(columns)-len(row_values))))
+        row_dict.update(updates)
+        safe_gspread_call(
+            ws.update,
+            f"A{idx}:{last_col}{idx}",
+            [[row_dict.get(col, "") for col in columns]],
+            value_input_option="USER_ENTERED",
+            error_message=f"Could not update row {idx} in Google Sheets."
+        )
 
+class MasterLog:
+    """
+    The master log as one DataFrame, with the columns the JPM screens filter on
+    parsed once: status (upper-cased, categorical), date and sent (datetimes),
+    dispatched (bool) and row (sheet row number). The worklists are boolean
+    masks over those columns, and the frames they return go straight to st.dataframe.
+    """
 
+    UNDISPATCHED_STATUSES = ("PENDING", "PREMATURE")
+    TO_COMPLETE_STATUSES = ("DISPATCHED", "DELAYED", "PREMATURE")
 
+    def __init__(self, records, rows=None):
+        self.records = records
+        self.df = pd.DataFrame.from_records(records, columns=COLUMNS) if records else pd.DataFrame(columns=COLUMNS)
+        self.df = self.df.fillna("")
+        self.status = self.df["Collection Status"].astype(str).str.strip().str.upper().astype("category")
+        self.date = pd.to_datetime(self.df["Date"].astype(str), format="%Y-%m-%d", errors="coerce")
+        self.sent = pd.to_datetime(self.df["Time Sent to JPM"].astype(str), errors="coerce")
+        self.dispatched = self.df["Time Dispatched"].astype(str).str.strip() != ""
+        self.row = pd.Series(list(rows) if rows is not None else range(2, len(self.df) + 2), index=self.df.index)
 
-def city_ops(name, user_role):
-    st.sidebar.subheader("City of Allentown")
-    if "city_mode" not in st.session_state:
-        st.session_state.city_mode = "Submit a Missed Pickup"
+    def __len__(self):
+        return len(self.df)
 
-    city_mode = st.sidebar.radio("Select Action:", ["Submit a Missed Pickup", "Help"])
+    def undispatched_mask(self):
+        return self.status.isin(self.UNDISPATCHED_STATUSES) & ~self.dispatched
 
-    if city_mode == "Submit a Missed Pickup":
-        today = datetime.datetime.now(pytz.timezone("America/New_York")).date()
-    
-        drive = build('drive', 'v3', credentials=credentials_gs)
-        sheet_title = get_sheet_title(today)
-        weekly_id = ensure_gsheet_exists(drive, FOLDER_ID, sheet_title)
-        weekly_ss = safe_gspread_call(gs_client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
-        today_tab = get_today_tab_name(today)
-        
-        service_type = st.selectbox("Service Type", ["MSW", "SS", "YW"])
-        zone_field = f"{service_type} Zone"
-        day_field = f"{service_type} Zone"
-        zone_to_day = {}
-        for row in address_df:
-            zone = row.get(zone_field)
-            day = row.get(day_field) or row.get("Day", "")
-            if zone:  
-                if zone not in zone_to_day:
-                    zone_to_day[zone] = row.get(f"{service_type} Zone") or row.get(f"{service_type} Day", "")
-    
-    
-        week_order = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-        
-        def get_weekday_idx(zone):
-            for i, day in enumerate(week_order):
-                if day.lower() in str(zone_to_day[zone]).lower():
-                    return i
-            return 99
-        
-        zones = sorted({row[zone_field] for row in address_df if row[zone_field]}, key=get_weekday_idx)
-        
-        def weekday_to_week_order_idx(py_weekday):
-            return (py_weekday + 1) % 7
-        
-        today_py_idx = datetime.date.today().weekday()  
-        today_idx = weekday_to_week_order_idx(today_py_idx)  
-        
-        yesterday_idx = (today_idx - 1) % 7
-        yesterday_day = week_order[yesterday_idx]
-        
-    
-        default_zone = None
-        for z in zones:
-            if yesterday_day.lower() in str(zone_to_day[z]).lower():
-                default_zone = z
-                break
-        if not default_zone:
-            default_zone = zones[0] if zones else ""
-        
-    
-        zone = st.selectbox("Zone", zones, index=zones.index(default_zone) if default_zone in zones else 0)
-    
-        zone_color = None
-        if service_type == "YW":
-            # Only addresses in this zone
-            zone_addresses = [row for row in address_df if row[zone_field] == zone]
-            # Pull unique YW Zone Colors
-            zone_colors = sorted({row["YW Zone Color"] for row in zone_addresses if row.get("YW Zone Color")})
-            if zone_colors:
-                zone_color = st.selectbox("YW Zone Color", zone_colors)
-            else:
-                zone_color = ""
-        
-        if service_type == "YW":
-            address = st.selectbox(
-                "Address",
-                sorted({
-                    row["Address"]
-                    for row in address_df
-                    if row[zone_field] == zone and row.get("YW Zone Color") == zone_color
-                })
-            )
-        else:
-            address = st.selectbox(
-                "Address",
-                sorted({
-                    row["Address"]
-                    for row in address_df
-                    if row[zone_field] == zone
-                })
-            )
-        selected_row = next((row for row in address_df if row["Address"] == address), None)
-        if selected_row and "Latitude" in selected_row and "Longitude" in selected_row:
-            import pandas as pd
-            map_df = pd.DataFrame([{
-                "lat": float(selected_row["Latitude"]),
-                "lon": float(selected_row["Longitude"])
-            }])
-            st.map(map_df, latitude="lat", longitude="lon", zoom=16, size=10)       
-        if service_type == "MSW":
-            route = next(
-                (
-                    row["MSW Route"]
-                    for row in address_df
-                    if row["Address"] == address and row["MSW Zone"] == zone
-                ),
-                ""
-            )
-        elif service_type == "SS":
-            route = next(
-                (
-                    row["SS Route"]
-                    for row in address_df
-                    if row["Address"] == address and row["SS Zone"] == zone
-                ),
-                ""
-            )
-        elif service_type == "YW":
-            route = next(
-                (
-                    row["YW Route"]
-                    for row in address_df
-                    if row["Address"] == address
-                    and row["YW Zone"] == zone
-                    and row.get("YW Zone Color", "") == zone_color
-                ),
-                ""
-            )
-        else:
-            route = ""
+    def open_mask(self):
+        return ~self.status.isin(COMPLETED_STATUSES)
 
-        placement_exception = st.selectbox("Placement Exception?", ["NO", "YES"])
-        pe_address = st.text_input("PE Address") if placement_exception == "YES" else "N/A"
-        fields_to_reset = [
-            "whole_block", "called_in_time", "city_notes", 
-            "placement_exception", "pe_address"
-        ]
-        
-        # --- Whole Block ---
-        whole_block = st.selectbox("Whole Block", ["NO", "YES"], key="whole_block")
-        
-        # --- Time Called In ---
-        if "called_in_time" not in st.session_state:
-            now = datetime.datetime.now(pytz.timezone("America/New_York"))
-            current_time_str = now.strftime("%I:%M %p")
-            st.session_state.called_in_time = (
-                current_time_str if current_time_str in time_options else time_options[0]
-            )
-        called_in_time = st.selectbox(
-            "Time Called In",
-            time_options,
-            key="called_in_time"
-        )
-        
-        city_notes = st.text_input("City Notes (optional)", key="city_notes")
-        submit_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
-        form_data = {
-            "Date": str(today), "Submitted By": name, "Time Called In": called_in_time, "Zone": zone,
-            "Time Sent to JPM": submit_time, "Address": address, "Service Type": service_type, "Route": route,
-            "Whole Block": whole_block, "Placement Exception": placement_exception, "PE Address": pe_address,
-            "City Notes": city_notes, "Collection Status": "Pending", "YW Zone Color": zone_color if service_type == "YW" else "N/A", "MissID": str(uuid.uuid4())
-        }
+    def to_complete_mask(self):
+        return self.dispatched & self.status.isin(self.TO_COMPLETE_STATUSES)
 
-        completion_sheet_title = get_completion_times_sheet_title(today)
+    def undispatched(self):
+        """Undispatched Pending/Premature misses, oldest Time Sent to JPM first."""
+        mask = self.undispatched_mask()
+        return self.df[mask].assign(**{"Time Sent to JPM": self.sent[mask]}).sort_values("Time Sent to JPM", kind="stable")
+
+    def old_stops(self, day):
+        """How many undispatched misses were sent to JPM before the given day."""
+        return int((self.undispatched_mask() & (self.sent < pd.Timestamp(day))).sum())
+
+    def prior_open(self, day):
+        """
+        Misses dated before the given day that still need closing out: dispatched
+        but not completed, or Pending/Premature and never dispatched.
+        """
+        before = self.date < pd.Timestamp(day)
+        mask = before & ((self.dispatched & self.open_mask()) | self.undispatched_mask())
+        return self.df[mask].drop_duplicates(subset="MissID").sort_values(["Date", "Time Dispatched"], kind="stable")
+
+    def to_complete(self):
+        """(row number, row) for dispatched misses still waiting on a result."""
+        return [(int(self.row[i]), self.records[i]) for i in self.df.index[self.to_complete_mask()]]
+
+    def records_for(self, frame):
+        """The original row dicts behind a frame returned by one of the views above."""
+        return [self.records[i] for i in frame.index]
+
+class MissRepository:
+    """
+    Storage for the miss log, the weekly tabs and the completion times.
+    The screens only talk to this interface; see SheetsMissRepository and
+    SqliteMissRepository for the two backends.
+    """
+
+    def master_records(self):
+        """Every miss, in log order."""
+        raise NotImplementedError
+
+    def has_open_miss(self, address):
+        """True if the address already has a miss that is not resolved yet."""
+        raise NotImplementedError
+
+    def master_log(self):
+        """The MasterLog the dispatch and completion screens filter."""
+        return MasterLog(self.master_records())
+
+    def miss_history(self):
+        """Object answering count/last/count_before/last_before per address."""
+        raise NotImplementedError
+
+    def append_miss(self, row):
+        raise NotImplementedError
+
+    def target_problem(self, day):
+        """None if a miss dated day has somewhere to be written, else the reason it has not."""
+        return None
+
+    def append_misses(self, rows):
+        """Append many new misses at once (the bulk import)."""
+        for row in rows:
+            self.append_miss(row)
+
+    def dispatch(self, stops, now_time):
+        """Dispatch master rows; returns per-stop result dicts."""
+        raise NotImplementedError
+
+    def locate(self, row):
+        """Warm up whatever complete_miss needs to find this miss; safe to run alongside other steps."""
+
+    def complete_miss(self, row, updates):
+        """Write a completed miss; returns per-step timings {step: seconds} and a list of notices for the user."""
+        raise NotImplementedError
+
+    def weekly_row_index(self, row):
+        """Row number of this miss in its weekly tab, or None."""
+        raise NotImplementedError
+
+    def completion_times(self, day, max_age=None):
+        """
+        Completion rows (Service Type, Completion Status, ...) for a day. Cached
+        copies older than max_age seconds are re-read; None trusts the cache.
+        """
+        raise NotImplementedError
+
+    def completion_status(self, day, service_type):
+        """Upper-cased Completion Status of one service for a day, at most COMPLETION_STATUS_TTL seconds old."""
+        row = next(
+            (r for r in self.completion_times(day, max_age=COMPLETION_STATUS_TTL)
+             if str(r.get("Service Type", "")).strip().upper() == service_type),
+            None
+        )
+        return str(row.get("Completion Status", "")).strip().upper() if row else None
+
+    def update_completion_times(self, day, values):
+        """values: {service type: [status, completion time, submitted at, submitted by]}"""
+        raise NotImplementedError
+
+MASTER_SNAPSHOT_TTL = 10  # seconds a session reuses its copy of the master snapshot before syncing it
+MASTER_SYNC_INTERVAL = 5  # seconds between Drive version checks of the master, shared by every session
+MASTER_FULL_RELOAD = 900  # seconds before the snapshot is re-read in full, catching edits outside the status columns
+
+# The columns this app changes after a miss is appended; MissID rides along to check row order
+MASTER_MUTABLE_COLUMNS = COLUMNS[COLUMNS.index("Time Dispatched"):]
+
+class OpenMissIndex:
+    """
+    The misses in the master log that are not resolved yet, keyed by MissID with
+    their sheet row number and grouped by status (Pending, Premature, Dispatched,
+    Delayed, ...) and by normalized address. Duplicate checks and the JPM
+    worklists read this, so they cost time in the open misses, not the whole log.
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._open = {}  # key -> (row number, record); row 0 until a sync has seen the row
+        self._by_status = {}  # status -> set of keys
+        self._by_address = {}  # normalized address -> set of keys
+        self.generation = 0
+        for i, record in enumerate(records):
+            self._put(record, i + 2)
+
+    @staticmethod
+    def _status(record):
+        return str(record.get("Collection Status", "")).strip().upper()
+
+    def _discard(self, key):
+        found = self._open.pop(key, None)
+        if found is not None:
+            record = found[1]
+            self._by_status[self._status(record)].discard(key)
+            self._by_address[normalize_address(record.get("Address"))].discard(key)
+        return found
+
+    def _put(self, record, row):
+        # Rows without a MissID (entered by hand) are keyed by their row
+        key = str(record.get("MissID", "")) or f"#{row}"
+        self._discard(key)
+        self.generation += 1
+        if self._status(record) in COMPLETED_STATUSES:
+            return
+        self._open[key] = (row, record)
+        self._by_status.setdefault(self._status(record), set()).add(key)
+        self._by_address.setdefault(normalize_address(record.get("Address")), set()).add(key)
+
+    def put(self, record, row=0):
+        """Add, replace or (once its status is resolved) drop a miss."""
+        with self._lock:
+            self._put(dict(record), row)
+
+    def update(self, missid, updates):
+        """Apply a write this app made to a MissID's row."""
+        with self._lock:
+            found = self._open.get(str(missid))
+            if found is not None:
+                self._put(dict(found[1], **updates), found[0])
+
+    def __contains__(self, missid):
+        return str(missid) in self._open
+
+    def has_address(self, address):
+        return bool(self._by_address.get(normalize_address(address)))
+
+    def count(self, *statuses):
+        return sum(len(self._by_status.get(status, ())) for status in statuses)
+
+    def entries(self, *statuses):
+        """(row number, copy of the record) for the open misses, in log order; all of them if no statuses are given."""
+        with self._lock:
+            if statuses:
+                keys = set().union(*(self._by_status.get(status, ()) for status in statuses))
+            else:
+                keys = self._open
+            found = [self._open[key] for key in keys]
+        found.sort(key=lambda entry: entry[0] or float("inf"))
+        return [(row, dict(record)) for row, record in found]
+
+class MasterLogSnapshot:
+    """
+    Process-wide copy of the Master Misses Log, kept current without re-reading
+    the whole sheet. A sync first asks Drive for the file's version; if it is
+    unchanged nothing is read. Otherwise one values batch read fetches the header,
+    the rows past the last known row and the status columns of the known rows.
+    If the header or the MissID order no longer matches (rows inserted, deleted
+    or archived), the sheet is read in full instead.
+    """
+
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.lock = threading.Lock()
+        self.header = None
+        self.rows = []  # padded cell values; rows[i] is sheet row i + 2
+        self.records = []  # the same rows as get_all_records would return them
+        self.open = OpenMissIndex()
+        self.generation = 0  # bumped whenever records change, so copies can be told apart by age
+        self.version = None
+        self.synced_at = 0
+        self.full_at = 0
+
+    def invalidate(self):
+        with self.lock:
+            self.header = None
+
+    def _record(self, row):
+        return dict(zip(self.header, gspread.utils.numericise_all(row)))
+
+    def _pad(self, row):
+        return list(row) + [""] * (len(self.header) - len(row))
+
+    def sync(self, drive, ws, max_age=MASTER_SYNC_INTERVAL, outbox=None):
+        """
+        The current records and their generation; callers must copy a record before
+        changing it. Writes still queued in outbox are re-applied to the open misses
+        after each reload.
+        """
+        with self.lock:
+            if self.header is not None and time.monotonic() - self.synced_at < max_age:
+                return self.records, self.generation
+            reloaded = True
+            if self.header is None or time.monotonic() - self.full_at > MASTER_FULL_RELOAD:
+                self._full(ws)
+                version = None  # the next sync reads the changes since now, then trusts the version
+            else:
+                version = drive_file_resolver(FOLDER_ID).version(drive, self.file_id)
+                reloaded = version is None or version != self.version
+                if reloaded and not self._incremental(ws):
+                    self._full(ws)
+            self.version = version
+            self.synced_at = time.monotonic()
+            if reloaded and outbox is not None:
+                self._apply_pending(outbox)
+            return self.records, self.generation
+
+    def _apply_pending(self, outbox):
+        # Queued writes are not in the sheet yet, so a reload drops queued appends and reopens queued completions
+        for entry in outbox.pending(MASTER_LOG_TITLE, ""):
+            payload = json.loads(entry["payload"])
+            if entry["kind"] == "append" and entry["missid"] not in self.open:
+                self.open.put(payload["row"])
+            elif entry["kind"] == "update":
+                self.open.update(entry["missid"], payload["updates"])
+
+    def _full(self, ws):
+        values = safe_gspread_call(ws.get_all_values, error_message="Could not fetch missed stops from Google Sheets. Please try again.")
+        self.header = values[0] if values else list(COLUMNS)
+        self.rows = [self._pad(row) for row in values[1:]]
+        self.records = [self._record(row) for row in self.rows]
+        self.open = OpenMissIndex(self.records)
+        self.generation += 1
+        self.full_at = time.monotonic()
+
+    def _incremental(self, ws):
+        if not all(col in self.header for col in ("MissID", "Time Dispatched")):
+            return False
+        first = min(self.header.index(col) for col in MASTER_MUTABLE_COLUMNS if col in self.header)
+        last_col, first_col, known = colnum_string(len(self.header)), colnum_string(first + 1), len(self.rows)
+        missid_idx = self.header.index("MissID")
+        ranges = [f"'{ws.title}'!1:1", f"'{ws.title}'!A{known + 2}:{last_col}"]
+        if known:
+            ranges.append(f"'{ws.title}'!{first_col}2:{last_col}{known + 1}")
+        value_ranges = safe_gspread_call(
+            ws.spreadsheet.values_batch_get, ranges, error_message="Could not fetch missed stops from Google Sheets. Please try again."
+        ).get("valueRanges", [])
+        header, tail, block = ([v.get("values", []) for v in value_ranges] + [[], [], []])[:3]
+        if not header or self._pad(header[0]) != self.header:
+            return False
+
+        rows, records, changed = list(self.rows), list(self.records), []
+        for i, cells in enumerate(block + [[]] * (known - len(block))):
+            cells = cells + [""] * (len(self.header) - first - len(cells))
+            if cells[missid_idx - first] != rows[i][missid_idx]:
+                return False  # rows moved; row numbers can no longer be trusted
+            if cells != rows[i][first:]:
+                rows[i] = rows[i][:first] + cells
+                records[i] = self._record(rows[i])
+                changed.append(i)
+        for row in tail:
+            rows.append(self._pad(row))
+            records.append(self._record(rows[-1]))
+            changed.append(len(records) - 1)
+        self.rows, self.records = rows, records  # replaced, not mutated, so readers keep a consistent list
+        if changed:
+            self.generation += 1
+        for i in changed:
+            self.open.put(records[i], i + 2)
+        return True
+
+@st.cache_resource
+def master_log_snapshot(file_id):
+    return MasterLogSnapshot(file_id)
+
+IMPORT_CHUNK_ROWS = 200  # rows per append_rows call in a bulk import
+
+class SheetsMissRepository(MissRepository):
+    """Google Sheets backend: Master Misses Log, weekly sheets and completion sheets in FOLDER_ID."""
+
+    def __init__(self, drive, client, outbox=None):
+        self.drive = drive
+        self.client = client
+        self.outbox = outbox
+        self._master_id = None
+        self._master_ws = None
+        self._records = None
+        self._records_at = 0
+        self._generation = 0
+        self._open_at = 0
+        self._log = None
+        self._log_source = None
+        self._targets = {}
+        self._tab_titles = {}
+
+    @property
+    def master_id(self):
+        if self._master_id is None:
+            self._master_id = get_master_log_id(self.drive, FOLDER_ID)
+        return self._master_id
+
+    @property
+    def master_ws(self):
+        if self._master_ws is None:
+            self._master_ws = safe_gspread_call(self.client.open_by_key, self.master_id, error_message="Could not open the Master Misses Log sheet. Please try again.").sheet1
+        return self._master_ws
+
+    def master_records(self):
+        if self._records is None or time.monotonic() - self._records_at > MASTER_SNAPSHOT_TTL:
+            self._records_at = time.monotonic()
+            # Copies, so this session's own updates never leak into the shared snapshot
+            records, self._generation = master_log_snapshot(self.master_id).sync(self.drive, self.master_ws, outbox=self.outbox)
+            self._records = [dict(record) for record in records]
+            missid_row_map(self.master_ws).check_row_count(len(self._records) + 1)
+            if self.outbox is not None:
+                self._records = self.outbox.overlay(self._records)
+        return self._records
+
+    def open_misses(self, fragment_reuse=True):
+        """
+        The shared OpenMissIndex. This session syncs it with the sheet at most every
+        MASTER_SNAPSHOT_TTL seconds, and (with fragment_reuse) not at all on a rerun of
+        a fragment alone, so picking rows or filling in a form makes no remote calls.
+        """
+        snapshot = master_log_snapshot(self.master_id)
+        ctx = get_script_run_ctx(suppress_warning=True)
+        fragment_rerun = fragment_reuse and bool(ctx and ctx.fragment_ids_this_run)
+        if not self._open_at or (not fragment_rerun and time.monotonic() - self._open_at > MASTER_SNAPSHOT_TTL):
+            snapshot.sync(self.drive, self.master_ws, outbox=self.outbox)
+            self._open_at = time.monotonic()
+        return snapshot.open
+
+    def has_open_miss(self, address):
+        # A duplicate check always honours the TTL, even inside a fragment
+        return self.open_misses(fragment_reuse=False).has_address(address)
+
+    def master_log(self):
+        # Only the open misses feed the worklists; rebuilt when the index or this session's writes change them
+        open_misses = self.open_misses()
+        if self._log is None or self._log_source != (id(open_misses), open_misses.generation):
+            self._log_source = (id(open_misses), open_misses.generation)
+            entries = open_misses.entries()
+            rows = {str(record.get("MissID", "")): row for row, record in entries}
+            records = [record for _, record in entries]
+            if self.outbox is not None:
+                records = self.outbox.overlay(records)
+            records = [r for r in records if str(r.get("Collection Status", "")).strip().upper() not in COMPLETED_STATUSES]
+            self._log = MasterLog(records, rows=[rows.get(str(r.get("MissID", "")), 0) for r in records])
+        return self._log
+
+    def miss_history(self):
+        records = self.master_records()
+        return ArchivedHistory(get_miss_history(self.master_id, records, self._generation), self.archive_rollup(records))
+
+    def _archive_ss(self):
+        archive_id = drive_file_resolver(FOLDER_ID).resolve(self.drive, MASTER_ARCHIVE_TITLE)
+        if not archive_id:
+            return None
+        return safe_gspread_call(self.client.open_by_key, archive_id, error_message="Could not open the Master Misses Archive sheet.")
+
+    def archive_rollup(self, records=()):
+        """
+        The process-wide MissRollup, re-read after MASTER_ROLLUP_TTL seconds or as soon
+        as the active log (records) has fewer rows than when it was read (rows were
+        archived). A rollup tab that no longer parses is rebuilt from the archive.
+        """
+        store = _miss_rollup_store()
+        rollup, loaded_at, rows_then = store.get(self.master_id, (None, 0, 0))
+        if rollup is None or time.monotonic() - loaded_at > MASTER_ROLLUP_TTL or len(records) < rows_then:
+            archive_ss = self._archive_ss()
+            rollup = MissRollup()
+            if archive_ss is not None:
+                values = self._rollup_values(archive_ss)
+                try:
+                    if values and "Missed On" not in values[0]:
+                        raise ValueError("The rollup tab has no 'Missed On' column")
+                    if values:
+                        rollup = MissRollup.from_records(dict(zip(values[0], row)) for row in values[1:])
+                except ValueError:
+                    # Most likely a hand edit; treat the tab as stale rather than failing every load
+                    active = {str(r.get("MissID", "")) for r in records}
+                    rollup = self._rebuild_rollup(archive_ss, self._year_tabs(archive_ss), active, values)
+            store[self.master_id] = (rollup, time.monotonic(), len(records))
+        return rollup
+
+    @staticmethod
+    def _rollup_values(archive_ss):
+        """The rollup tab's rows, header first, or None if the tab does not exist."""
+        # A values read skips the worksheet metadata fetch; a missing tab is a 400
         try:
-            completion_sheet_id = ensure_completion_times_gsheet_exists(drive, FOLDER_ID, completion_sheet_title)
-            completion_times_ws = gs_client.open_by_key(completion_sheet_id).worksheet(get_today_tab_name(today))
-            # Find the correct row for this service type ("MSW", "SS", or "YW")
-            ct_records = completion_times_ws.get_all_records()
-            completion_row = next((row for row in ct_records if row.get("Service Type", "").strip().upper() == service_type), None)
-
-            # --- UPDATED LOGIC FOR PREMATURE ---
-            # Only mark Premature if:
-            # (A) This zone is *yesterday* relative to today
-            # (B) Completion not yet marked
-            # (C) This service type is actually scheduled today anywhere (optional safeguard)
-
-            days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-            today_index = today.weekday()  # Monday=0 ... Sunday=6
-            zone_day_index = get_weekday_index(zone)  # e.g., "Sunday" => 6
-
-            # Only "Premature" if today is the day after the zone day
-            if (
-                completion_row and
-                completion_row.get("Completion Status", "").strip().upper() == "NOT COMPLETE" and
-                (today_index - zone_day_index) % 7 == 1 and
-                is_service_type_scheduled_today(service_type, today, address_df)
-            ):
-                form_data["Collection Status"] = "Premature"
-                st.info(
-                    f"FYI: The {service_type} service has not been marked completed yet for today. "
-                    f"This stop will be flagged as **Premature**.", icon=":material/data_info_alert:"
+            value_ranges = sheets_call(
+                archive_ss.values_batch_get, [f"'{MASTER_ROLLUP_TAB}'!A:{colnum_string(len(ROLLUP_COLUMNS))}"]
+            ).get("valueRanges", [])
+        except gspread.exceptions.APIError as e:
+            if getattr(e, "code", None) == 400:
+                return None
+            stop_with_error("Could not read the miss rollup.")
+        return value_ranges[0].get("values", []) if value_ranges else []
+
+    def _rebuild_rollup(self, archive_ss, tabs, active, previous):
+        """
+        Rebuild the rollup tab from the archive's year tabs, leaving out MissIDs still in
+        the active log. previous is what the tab held (None if missing); rows below the
+        new rollup are cleared only if it was longer.
+        """
+        rollup = MissRollup.from_rows(r for r in self._read_archive(archive_ss, sorted(tabs)) if str(r.get("MissID", "")) not in active)
+        rollup_values = rollup.to_values()
+        if previous is None:
+            rollup_ws = safe_gspread_call(archive_ss.add_worksheet, MASTER_ROLLUP_TAB, rows=len(rollup_values), cols=len(ROLLUP_COLUMNS), error_message="Could not create the rollup tab.")
+        else:
+            rollup_ws = safe_gspread_call(archive_ss.worksheet, MASTER_ROLLUP_TAB, error_message="Could not open the rollup tab.")
+        safe_gspread_call(rollup_ws.update, values=rollup_values, range_name="A1", value_input_option="RAW", error_message="Could not write the miss rollup. Run the archive again to rebuild it.")
+        if previous and len(previous) > len(rollup_values):
+            safe_gspread_call(rollup_ws.batch_clear, [f"A{len(rollup_values) + 1}:{colnum_string(len(ROLLUP_COLUMNS))}"], error_message="Could not trim the miss rollup.")
+        return rollup
+
+    @staticmethod
+    def _year_tabs(archive_ss):
+        return {ws.title: ws for ws in safe_gspread_call(archive_ss.worksheets, error_message="Could not list the archive tabs.") if ws.title.isdigit()}
+
+    def _read_archive(self, archive_ss, tabs):
+        """Every row of the given year tabs, as dicts keyed by each tab's header."""
+        if not tabs:
+            return []
+        last_col = colnum_string(len(COLUMNS))
+        value_ranges = safe_gspread_call(
+            archive_ss.values_batch_get, [f"'{title}'!A:{last_col}" for title in tabs],
+            error_message="Could not read the Master Misses Archive."
+        ).get("valueRanges", [])
+        records = []
+        for value_range in value_ranges:
+            values = value_range.get("values", [])
+            if values:
+                header = values[0]
+                records += [dict(zip(header, row + [""] * (len(header) - len(row)))) for row in values[1:] if any(row)]
+        return records
+
+    def archived_records(self):
+        """All archived misses, oldest year first. Reads the whole archive, so only for one-off jobs."""
+        archive_ss = self._archive_ss()
+        if archive_ss is None:
+            return []
+        tabs = self._year_tabs(archive_ss)
+        return self._read_archive(archive_ss, sorted(tabs))
+
+    def archive_closed(self, cutoff):
+        """
+        Move closed misses dated before cutoff from the active Master Misses Log into
+        the archive's year tabs, delete the moved rows from the active log, then
+        rebuild the rollup from the archive. Safe to re-run after a failure part-way:
+        rows already in the archive are not appended twice, and the rollup leaves out
+        any archived MissID still in the active log, so no miss is counted twice.
+
+        Returns {"archived": rows moved, "years": tabs written, "addresses": rollup size}.
+        """
+        values = safe_gspread_call(self.master_ws.get_all_values, error_message="Could not read the Master Misses Log.")
+        header = values[0] if values else COLUMNS
+        records = [dict(zip(header, row + [""] * (len(header) - len(row)))) for row in values[1:]]
+        moving = [
+            (i + 2, record) for i, record in enumerate(records)
+            if str(record.get("Collection Status", "")).strip().upper() in COMPLETED_STATUSES
+            and re.fullmatch(r"\d{4}-\d{2}-\d{2}", str(record.get("Date", "")))
+            and str(record.get("Date")) < str(cutoff)
+            and record.get("MissID")
+        ]
+
+        archive_ss = self._archive_ss()
+        if archive_ss is None:
+            if not moving:
+                return {"archived": 0, "years": [], "addresses": None}
+            stop_with_error(
+                f"The '{MASTER_ARCHIVE_TITLE}' sheet does not exist in the specified folder.\n"
+                "Please contact your admin to create it."
+            )
+        tabs = self._year_tabs(archive_ss)
+
+        by_year = {}
+        for _, record in moving:
+            by_year.setdefault(record["Date"][:4], []).append(record)
+        already = {str(r.get("MissID", "")) for r in self._read_archive(archive_ss, [y for y in by_year if y in tabs])}
+        for year, year_records in sorted(by_year.items()):
+            ws = tabs.get(year)
+            rows = [[record.get(col, "") for col in header] for record in year_records if record["MissID"] not in already]
+            if ws is None:
+                ws = tabs[year] = safe_gspread_call(
+                    archive_ss.add_worksheet, year, rows=len(rows) + 1, cols=len(header),
+                    error_message=f"Could not create archive tab '{year}'."
                 )
-            else:
-                form_data["Collection Status"] = "Pending"
-        except Exception as e:
-            st.error(f"Could not check completion status for today: {e}", icon=":material/error:")
+                rows = [list(header)] + rows
+            if rows:
+                safe_gspread_call(ws.append_rows, rows, value_input_option="USER_ENTERED", error_message=f"Could not append to archive tab '{year}'.")
+
+        # Rows may have moved since the read; only delete if every MissID is still where it was
+        missids = safe_gspread_call(self.master_ws.col_values, len(COLUMNS), error_message="Could not re-check the Master Misses Log.")
+        if moving:
+            if any(row_idx > len(missids) or missids[row_idx - 1] != record["MissID"] for row_idx, record in moving):
+                stop_with_error("The Master Misses Log changed while archiving. The archive is up to date; run the archive again to remove the rows.")
+            blocks = []
+            for row_idx, _ in moving:
+                if blocks and blocks[-1][1] == row_idx - 1:
+                    blocks[-1][1] = row_idx
+                else:
+                    blocks.append([row_idx, row_idx])
+            safe_gspread_call(
+                self.master_ws.spreadsheet.batch_update,
+                {"requests": [
+                    {"deleteDimension": {"range": {"sheetId": self.master_ws.id, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end}}}
+                    for start, end in reversed(blocks)
+                ]},
+                error_message="Could not remove archived rows from the Master Misses Log. The rollup was left as it was; run the archive again."
+            )
+            missid_row_map(self.master_ws).rows = None
+            master_log_snapshot(self.master_id).invalidate()
+            _miss_history_store().pop(self.master_id, None)
+
+        # Written only once the rows are gone, and without MissIDs the active log still counts
+        active = set(missids) - {record["MissID"] for _, record in moving}
+        rollup = self._rebuild_rollup(archive_ss, tabs, active, self._rollup_values(archive_ss))
+
+        _miss_rollup_store()[self.master_id] = (rollup, time.monotonic(), len(records) - len(moving))
+        self._records = None
+        return {"archived": len(moving), "years": sorted(by_year), "addresses": len(rollup)}
+
+    def _apply_to_records(self, missid, updates):
+        # Keep the session's snapshot and the open misses in step with this session's own writes
+        self._log = None
+        master_log_snapshot(self.master_id).open.update(missid, updates)
+        for record in self._records or []:
+            if record.get("MissID") == missid:
+                record.update(updates)
+
+    def _history_if_loaded(self):
+        # Only keep the shared history in step if this rerun already paid for the master read
+        return get_miss_history(self.master_id, self._records, self._generation) if self._records is not None else None
+
+    def _weekly_ws(self, miss_date):
+        sheet_title = get_sheet_title(miss_date)
+        weekly_id = ensure_gsheet_exists(self.drive, FOLDER_ID, sheet_title)
+        weekly_ss = safe_gspread_call(self.client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
+        tab_name = get_today_tab_name(miss_date)
+        return safe_gspread_call(weekly_ss.worksheet, tab_name, error_message=f"Could not open weekly tab '{tab_name}'.")
+
+    def target_problem(self, day):
+        # The weekly tab takes the row and the completion times tab decides Premature; checked once per day
+        if day not in self._targets:
+            tab_name = get_today_tab_name(day)
+            self._targets[day] = None
+            for title in (get_sheet_title(day), get_completion_times_sheet_title(day)):
+                if title not in self._tab_titles:
+                    sheet_id = drive_file_resolver(FOLDER_ID).resolve(self.drive, title)
+                    ss = sheet_id and safe_gspread_call(self.client.open_by_key, sheet_id, error_message=f"Could not open '{title}'.")
+                    self._tab_titles[title] = {ws.title for ws in safe_gspread_call(ss.worksheets, error_message=f"Could not list the tabs of '{title}'.")} if ss else None
+                if self._tab_titles[title] is None:
+                    self._targets[day] = f"Sheet '{title}' does not exist"
+                    break
+                if tab_name not in self._tab_titles[title]:
+                    self._targets[day] = f"Sheet '{title}' has no '{tab_name}' tab"
+                    break
+        return self._targets[day]
+
+    def append_miss(self, row):
+        history = self._history_if_loaded()
+        miss_date = datetime.datetime.strptime(str(row["Date"]), "%Y-%m-%d").date()
+        master_row = None
+        if self.outbox is not None:
+            ensure_gsheet_exists(self.drive, FOLDER_ID, get_sheet_title(miss_date))
+            self.outbox.enqueue("append", row)
+        else:
+            values = [row.get(col, "") for col in COLUMNS]
+            ws = self._weekly_ws(miss_date)
+            weekly_resp = safe_gspread_call(ws.append_row, values, value_input_option="USER_ENTERED", error_message="Could not submit missed stop to Google Sheets. Please try again.")
+            missid_row_map(ws).note_appended(weekly_resp, [row["MissID"]])
+            master_resp = safe_gspread_call(self.master_ws.append_row, values, value_input_option="USER_ENTERED", error_message="Could not update master log. Please try again.")
+            master_row = missid_row_map(self.master_ws).note_appended(master_resp, [row["MissID"]])
+        master_log_snapshot(self.master_id).open.put(row, master_row or 0)
+        if history is not None:
+            history.add_row(row)
+            self._records.append(row)
+            self._log = None
+
+    def _append_chunks(self, ws, rows, error_message):
+        """append_rows in chunks of IMPORT_CHUNK_ROWS; returns {MissID: row number} where the response says."""
+        found = {}
+        for start in range(0, len(rows), IMPORT_CHUNK_ROWS):
+            chunk = rows[start:start + IMPORT_CHUNK_ROWS]
+            resp = safe_gspread_call(
+                ws.append_rows, [[row.get(col, "") for col in COLUMNS] for row in chunk],
+                value_input_option="USER_ENTERED", error_message=error_message
+            )
+            first = missid_row_map(ws).note_appended(resp, [row["MissID"] for row in chunk])
+            if first:
+                found.update({row["MissID"]: first + i for i, row in enumerate(chunk)})
+        return found
+
+    def append_misses(self, rows):
+        history = self._history_if_loaded()
+        master_rows = {}
+        by_date = {}
+        for row in rows:
+            by_date.setdefault(datetime.datetime.strptime(str(row["Date"]), "%Y-%m-%d").date(), []).append(row)
+        if self.outbox is not None:
+            for title in {get_sheet_title(miss_date) for miss_date in by_date}:
+                ensure_gsheet_exists(self.drive, FOLDER_ID, title)
+            self.outbox.enqueue_appends(rows)
+        else:
+            # One weekly tab per day, then the master, each in as few calls as the chunk size allows
+            for miss_date, day_rows in sorted(by_date.items()):
+                self._append_chunks(self._weekly_ws(miss_date), day_rows, "Could not submit missed stops to Google Sheets. Please try again.")
+            master_rows = self._append_chunks(self.master_ws, rows, "Could not update master log. Please try again.")
+        open_misses = master_log_snapshot(self.master_id).open
+        for row in rows:
+            open_misses.put(row, master_rows.get(row["MissID"], 0))
+            if history is not None:
+                history.add_row(row)
+                self._records.append(row)
+        self._log = None
+
+    def dispatch(self, stops, now_time):
+        if self.outbox is None:
+            results = dispatch_stops(stops, self.master_ws, self.drive, self.client, now_time, self._history_if_loaded())
+            dispatched = {r["MissID"] for r in results if r["Master"] == "Dispatched"}
+            for row in stops:
+                if row.get("MissID") in dispatched:
+                    self._apply_to_records(row.get("MissID"), dispatch_updates(row, now_time))
+            return results
+        history = self._history_if_loaded()
+        for row in stops:
+            updates = dispatch_updates(row, now_time)
+            self.outbox.enqueue("update", row, updates)
+            self._apply_to_records(row.get("MissID"), updates)
+            if history is not None and "Collection Status" in updates:
+                history.set_status(row.get("MissID"), updates["Collection Status"])
+        return [{"MissID": row.get("MissID"), "Address": row.get("Address", ""), "Master": "Queued", "Weekly": "Queued"} for row in stops]
+
+    def locate(self, row):
+        if self.outbox is None:
+            find_row_by_missid(self.master_ws, row.get("MissID"))
+
+    def complete_miss(self, row, updates):
+        missid = row.get("MissID")
+        history = self._history_if_loaded()
+
+        if self.outbox is not None:
+            started = time.perf_counter()
+            self.outbox.enqueue("update", row, updates)
+            self._apply_to_records(missid, updates)
+            if history is not None:
+                history.set_status(missid, updates.get("Collection Status", ""))
+            return {"Queued for Sheets": time.perf_counter() - started}, []
+
+        # The master and weekly logs are independent, so they are written side by side
+        self.master_ws  # opened here rather than racing inside the steps
+        results, timings = run_steps({
+            "Master log": lambda: self._complete_master(row, updates),
+            "Weekly log": lambda: self._complete_weekly(row, updates),
+        })
+        # Both writes succeeded (run_steps stops otherwise), so the shared state can follow
+        self._apply_to_records(missid, updates)
+        if history is not None:
+            history.set_status(missid, updates.get("Collection Status", ""))
+        return timings, [results["Weekly log"]] if results["Weekly log"] else []
+
+    def _complete_master(self, row, updates):
+        missid = row.get("MissID")
+        row_idx_master = find_row_by_missid(self.master_ws, missid)
+        if not row_idx_master:
+            raise StepFailed("Could not find this record in the Master Misses Log. It may have been deleted.")
+        update_miss_rows(self.master_ws, [row_idx_master], updates, missid=missid)
+
+    def _complete_weekly(self, row, updates):
+        # Also update in the correct weekly sheet/tab for recordkeeping; returns a notice for the user, if any
+        missid = row.get("MissID")
+        miss_date = row.get("Date")
+        if not miss_date:
+            return
+        miss_date_dt = datetime.datetime.strptime(miss_date, "%Y-%m-%d").date()
+        sheet_title = get_sheet_title(miss_date_dt)
+        tab_name = get_today_tab_name(miss_date_dt)
+        weekly_id = drive_file_resolver(FOLDER_ID).resolve(self.drive, sheet_title)
+        if not weekly_id:
+            return f"Weekly sheet '{sheet_title}' not found; only the Master Misses Log was updated."
+        weekly_ss = safe_gspread_call(self.client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
+        try:
+            ws = sheets_call(weekly_ss.worksheet, tab_name)
+        except gspread.exceptions.WorksheetNotFound:
+            return f"Weekly tab '{tab_name}' not found in '{sheet_title}'; only the Master Misses Log was updated."
+
+        row_idx_weekly = find_row_by_missid(ws, missid)
+        if row_idx_weekly:
+            update_miss_rows(ws, [row_idx_weekly], updates, missid=missid)
+        else:
+            # Append the missing row, using all columns from Master row!
+            resp = safe_gspread_call(
+                ws.append_row,
+                [{**row, **updates}.get(col, "") for col in COLUMNS],
+                value_input_option="USER_ENTERED",
+                error_message=f"Could not append missing MissID {missid} to weekly tab."
+            )
+            missid_row_map(ws).note_appended(resp, [missid])
+            return f"MissID {missid} was not in weekly sheet '{ws.title}', so it was appended from the master."
 
+    def weekly_row_index(self, row):
+        try:
+            ws = self._weekly_ws(datetime.datetime.strptime(row.get("Date"), "%Y-%m-%d").date())
+            return find_row_by_missid(ws, row.get("MissID"))
+        except Exception:
+            return None
+
+    def _completion_ws(self, day):
+        completion_sheet_id = ensure_completion_times_gsheet_exists(self.drive, FOLDER_ID, get_completion_times_sheet_title(day))
+        completion_ss = safe_gspread_call(self.client.open_by_key, completion_sheet_id, error_message="Could not open the completion times sheet.")
+        return safe_gspread_call(completion_ss.worksheet, get_today_tab_name(day), error_message="Could not open today's completion times tab.")
+
+    def completion_times(self, day, max_age=None):
+        model = completion_times_cache()
+        ws, records, loaded_at = model.get(day, (None, None, 0))
+        if records is None or (max_age is not None and time.monotonic() - loaded_at > max_age):
+            ws = ws or self._completion_ws(day)
+            records = safe_gspread_call(ws.get_all_records, error_message="Could not fetch completion times from Google Sheets.")
+            model[day] = (ws, records, time.monotonic())
+        return records
+
+    def update_completion_times(self, day, values):
+        records = self.completion_times(day)
+        ws = completion_times_cache()[day][0]
+        requests = [
+            {"range": f"B{idx}:E{idx}", "values": [values[row.get("Service Type")]]}
+            for idx, row in enumerate(records, start=2)
+            if row.get("Service Type") in values
+        ]
+        if requests:
+            safe_gspread_call(ws.batch_update, requests, error_message="Could not update completion times in Google Sheets.")
+        completion_times_cache()[day] = (ws, None, 0)  # keep the worksheet, re-read the values
 
-        
-        missing_fields = []
-        
-        if placement_exception == "YES" and not pe_address.strip():
-            missing_fields.append("PE Address")
-        
-        if missing_fields:
-            st.error(f"Please complete the following required fields: {', '.join(missing_fields)}", icon=":material/block:")
-            st.stop()
-        
-        if st.button("Submit Missed Stop"):
-    
-            master_id = get_master_log_id(drive, FOLDER_ID)
-            master_ws = safe_gspread_call(gs_client.open_by_key, master_id, error_message="Could not open the Master Misses Log sheet. Please try again.").sheet1
-            master_records = safe_gspread_call(master_ws.get_all_records, error_message="Could not fetch missed stops from Google Sheets. Please try again.")
-    
-            completed_statuses = (
-                "PICKED UP",
-                "REJECTED",
-                "CONFIRMED PREMATURE",
-                "ONE TIME EXCEPTION",
-                "NOT OUT",
-                "CREATED IN ERROR",
-                "LATE PUT OUT"
+COMPLETION_STATUS_TTL = 60  # seconds the city form's Premature check trusts a cached completion status
+
+@st.cache_resource
+def completion_times_cache():
+    """
+    day -> (worksheet, records, loaded at) for the completion tabs, shared by every
+    session. A day's records are read once and re-read after this app writes to it,
+    or when a caller asks for data fresher than max_age.
+    """
+    return {}
+
+class SqliteMissStore:
+    """
+    Process-wide SQLite database behind SqliteMissRepository. Each miss is kept as
+    JSON alongside indexed columns for the hot queries (open misses by address,
+    undispatched, to complete, prior misses by date/time called in).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS misses (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            missid TEXT UNIQUE NOT NULL,
+            address_key TEXT NOT NULL,
+            status_key TEXT NOT NULL,
+            date TEXT NOT NULL,
+            called_in_minutes INTEGER NOT NULL,
+            time_dispatched TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS misses_by_address ON misses (address_key, date, called_in_minutes);
+        CREATE INDEX IF NOT EXISTS misses_by_status ON misses (status_key, time_dispatched);
+        CREATE INDEX IF NOT EXISTS misses_by_date ON misses (date);
+        CREATE TABLE IF NOT EXISTS completion_times (
+            day TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            completion_time TEXT NOT NULL,
+            submitted_at TEXT NOT NULL,
+            submitted_by TEXT NOT NULL,
+            PRIMARY KEY (day, service_type)
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def index_columns(row):
+        return (
+            normalize_address(row.get("Address")),
+            str(row.get("Collection Status", "")).strip().upper(),
+            str(row.get("Date", "")),
+            called_in_minutes(row.get("Time Called In")),
+            str(row.get("Time Dispatched", "") or ""),
+        )
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM misses LIMIT 1").fetchone() is None
+
+    def insert(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO misses (missid, address_key, status_key, date, called_in_minutes, time_dispatched, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(str(row["MissID"]),) + self.index_columns(row) + (json.dumps(row),) for row in rows if row.get("MissID")]
             )
 
-            duplicate_pending_or_premature = any(
-                row.get("Address", "").strip().upper() == address.strip().upper() and
-                str(row.get("Collection Status", "")).strip().upper() not in completed_statuses
-                for row in master_records
+    def update(self, missid, updates):
+        with self.lock, self.conn:
+            found = self.conn.execute("SELECT data FROM misses WHERE missid = ?", (missid,)).fetchone()
+            if found is None:
+                return None
+            row = {**json.loads(found["data"]), **updates}
+            self.conn.execute(
+                "UPDATE misses SET address_key = ?, status_key = ?, date = ?, called_in_minutes = ?, time_dispatched = ?, data = ? "
+                "WHERE missid = ?",
+                self.index_columns(row) + (json.dumps(row), missid)
             )
+            return row
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+@st.cache_resource
+def open_sqlite_store(path):
+    return SqliteMissStore(path)
+
+class SqliteMissHistory:
+    """MissHistoryIndex equivalent answered from the misses_by_address index."""
 
-            if duplicate_pending_or_premature:
-                st.error("This address already has a missed stop that is not yet resolved.", icon=":material/block:")
-                st.stop()
+    LEGIT = f"status_key IN ({', '.join(repr(s) for s in LEGIT_MISS_STATUSES)})"
+
+    def __init__(self, store):
+        self.store = store
+
+    def count(self, address):
+        return self.store.query(f"SELECT COUNT(*) FROM misses WHERE address_key = ? AND {self.LEGIT}", (normalize_address(address),))[0][0]
+
+    def last(self, address):
+        found = self.store.query(
+            f"SELECT date FROM misses WHERE address_key = ? AND {self.LEGIT} ORDER BY date DESC, called_in_minutes DESC LIMIT 1",
+            (normalize_address(address),)
+        )
+        return found[0]["date"] if found else None
+
+    def _before(self, select, address, date, time_called_in, suffix=""):
+        minutes = called_in_minutes(time_called_in)
+        return self.store.query(
+            f"SELECT {select} FROM misses WHERE address_key = ? AND {self.LEGIT} "
+            f"AND (date < ? OR (date = ? AND called_in_minutes < ?)) {suffix}",
+            (normalize_address(address), str(date), str(date), minutes)
+        )
+
+    def count_before(self, address, date, time_called_in):
+        return self._before("COUNT(*)", address, date, time_called_in)[0][0]
+
+    def last_before(self, address, date, time_called_in):
+        found = self._before("date", address, date, time_called_in, "ORDER BY date DESC, called_in_minutes DESC LIMIT 1")
+        return found[0]["date"] if found else None
+
+    def add_row(self, row):
+        pass  # the store is already up to date
+
+    def set_status(self, missid, status):
+        pass
+
+class SqliteMissRepository(MissRepository):
+    """
+    SQLite as the system of record. When a replica (a SheetsMissRepository) is
+    given, every write is repeated on it so the Google Sheets stay an up-to-date
+    export, and an empty database is seeded from the Master Misses Log and its archive.
+    """
 
-            # Only count legitimate missed stops (exclude Premature/Rejected/other non-miss statuses)
-            matching_entries = [
-                row for row in master_records
-                if (
-                    row.get("Address") == address and
-                    str(row.get("Collection Status", "")).strip().upper() in LEGIT_MISS_STATUSES
+    def __init__(self, store, replica=None):
+        self.store = store
+        self.replica = replica
+        if replica is not None and store.is_empty():
+            store.insert(replica.archived_records() + replica.master_records())
+
+    def _rows(self, sql, params=()):
+        return [json.loads(r["data"]) for r in self.store.query(sql, params)]
+
+    def master_records(self):
+        return self._rows("SELECT data FROM misses ORDER BY seq")
+
+    def has_open_miss(self, address):
+        placeholders = ", ".join("?" * len(COMPLETED_STATUSES))
+        return bool(self.store.query(
+            f"SELECT 1 FROM misses WHERE address_key = ? AND status_key NOT IN ({placeholders}) LIMIT 1",
+            (normalize_address(address),) + tuple(COMPLETED_STATUSES)
+        ))
+
+    def master_log(self):
+        # Only open misses feed the JPM worklists, so closed rows never leave the database
+        placeholders = ", ".join("?" * len(COMPLETED_STATUSES))
+        found = self.store.query(
+            f"SELECT seq, data FROM misses WHERE status_key NOT IN ({placeholders}) ORDER BY seq",
+            tuple(COMPLETED_STATUSES)
+        )
+        # seq is not a sheet row once rows are archived or inserted by hand, so rows are left unknown (0)
+        return MasterLog([json.loads(r["data"]) for r in found], rows=[0] * len(found))
+
+    def miss_history(self):
+        return SqliteMissHistory(self.store)
+
+    def append_miss(self, row):
+        self.store.insert([row])
+        if self.replica is not None:
+            self.replica.append_miss(row)
+
+    def target_problem(self, day):
+        return self.replica.target_problem(day) if self.replica is not None else None
+
+    def append_misses(self, rows):
+        self.store.insert(rows)
+        if self.replica is not None:
+            self.replica.append_misses(rows)
+
+    def dispatch(self, stops, now_time):
+        results, found = [], []
+        for row in stops:
+            if self.store.update(row.get("MissID"), dispatch_updates(row, now_time)):
+                found.append(row)
+                status = "Dispatched"
+            else:
+                status = "Not found"
+            results.append({"MissID": row.get("MissID"), "Address": row.get("Address", ""), "Master": status, "Weekly": status})
+        if self.replica is not None and found:
+            # Only what the local store holds is repeated on Sheets; the rest stays "Not found"
+            replicated = {r["MissID"]: r for r in self.replica.dispatch(found, now_time)}
+            results = [replicated.get(r["MissID"], r) for r in results]
+        return results
+
+    def locate(self, row):
+        if self.replica is not None:
+            self.replica.locate(row)
+
+    def complete_miss(self, row, updates):
+        started = time.perf_counter()
+        if self.store.update(row.get("MissID"), updates) is None:
+            stop_with_error("Could not find this record in the local miss log. It may have been deleted.")
+        timings, notices = {"Local store": time.perf_counter() - started}, []
+        if self.replica is not None:
+            replica_timings, notices = self.replica.complete_miss(row, updates)
+            timings.update(replica_timings)
+        return timings, notices
+
+    def weekly_row_index(self, row):
+        # The store does not know sheet rows; only the replica can say where the miss really is
+        return self.replica.weekly_row_index(row) if self.replica is not None else None
+
+    def completion_times(self, day, max_age=None):
+        # The local table is the system of record, so it is never stale
+        found = self.store.query(
+            "SELECT service_type, status, completion_time, submitted_at, submitted_by FROM completion_times "
+            "WHERE day = ? ORDER BY CASE service_type WHEN 'MSW' THEN 0 WHEN 'SS' THEN 1 ELSE 2 END",
+            (str(day),)
+        )
+        if not found:
+            if self.replica is not None:
+                # Seed by position; the sheet's header names for C:E are not fixed
+                seed = {
+                    r.get("Service Type"): (list(r.values())[1:5] + [""] * 4)[:4]
+                    for r in self.replica.completion_times(day)
+                }
+            else:
+                seed = {svc: ["NOT COMPLETE", "", "", ""] for svc in ("MSW", "SS", "YW")}
+            self._write_completion(day, seed)
+            return self.completion_times(day)
+        return [dict(zip(COMPLETION_COLUMNS, tuple(r))) for r in found]
+
+    def _write_completion(self, day, values):
+        with self.store.lock, self.store.conn:
+            self.store.conn.executemany(
+                "INSERT OR REPLACE INTO completion_times VALUES (?, ?, ?, ?, ?, ?)",
+                [(str(day), svc) + tuple(str(v) for v in vals) for svc, vals in values.items()]
+            )
+
+    def update_completion_times(self, day, values):
+        self.completion_times(day)
+        self._write_completion(day, values)
+        if self.replica is not None:
+            self.replica.update_completion_times(day, values)
+
+OUTBOX_POLL_SECONDS = 5  # worker wake-up interval when nothing new was queued
+OUTBOX_BATCH_DELAY = 1  # seconds to let a burst of writes collect before flushing
+OUTBOX_MAX_BACKOFF = 300
+OUTBOX_LOG = logging.getLogger("missapp.outbox")
+
+class SheetsOutbox:
+    """
+    Durable write-behind queue for miss appends and status updates. Entries are
+    committed to a local SQLite file (WAL) before the UI moves on; a background
+    worker drains them per worksheet with one MissID read, one append_rows and
+    one values_batch_update, retrying failures with exponential backoff.
+
+    Writes are idempotent by MissID: an append whose MissID is already in the
+    sheet is dropped, and updates only touch the cells they change.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sheet_title TEXT NOT NULL,
+            tab TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            missid TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            last_error TEXT NOT NULL DEFAULT '',
+            created REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS outbox_by_target ON outbox (sheet_title, tab, id);
+    """
+
+    def __init__(self, path, drive, client):
+        self.drive = drive
+        self.client = client
+        self.resolver = drive_file_resolver(FOLDER_ID)
+        self.row_maps = _missid_row_maps()
+        self.quota = sheets_quota()
+        self.lock = threading.RLock()
+        self.wake = threading.Event()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=FULL")
+            self.conn.executescript(self.SCHEMA)
+        self.worker = threading.Thread(target=self.run, name="sheets-outbox", daemon=True)
+        self.worker.start()
+
+    @staticmethod
+    def targets(row):
+        """(sheet title, tab) pairs a miss is written to; tab "" is the master log's first sheet."""
+        found = [(MASTER_LOG_TITLE, "")]
+        try:
+            miss_date = datetime.datetime.strptime(str(row.get("Date", "")), "%Y-%m-%d").date()
+            found.append((get_sheet_title(miss_date), get_today_tab_name(miss_date)))
+        except ValueError:
+            pass
+        return found
+
+    def enqueue(self, kind, row, updates=None):
+        """Queue an "append" of row, or an "update" of row's MissID with updates."""
+        self._enqueue(kind, [(row, updates)])
+
+    def enqueue_appends(self, rows):
+        """Queue appends of many rows in one transaction."""
+        self._enqueue("append", [(row, None) for row in rows])
+
+    def _enqueue(self, kind, items):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (sheet_title, tab, kind, missid, payload, created) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (title, tab, kind, str(row.get("MissID", "")), json.dumps({"row": row, "updates": updates or {}}), time.time())
+                    for row, updates in items
+                    for title, tab in self.targets(row)
+                ]
+            )
+        self.wake.set()
+
+    def pending(self, sheet_title=None, tab=None):
+        sql, params = "SELECT * FROM outbox", ()
+        if sheet_title is not None:
+            sql, params = sql + " WHERE sheet_title = ? AND tab = ?", (sheet_title, tab)
+        with self.lock:
+            return self.conn.execute(sql + " ORDER BY id", params).fetchall()
+
+    def overlay(self, records, sheet_title=MASTER_LOG_TITLE, tab=""):
+        """records as they will read once everything queued for this sheet is written."""
+        records = list(records)
+        by_missid = {str(row.get("MissID", "")): row for row in records}
+        for entry in self.pending(sheet_title, tab):
+            payload = json.loads(entry["payload"])
+            if entry["kind"] == "append" and entry["missid"] not in by_missid:
+                by_missid[entry["missid"]] = dict(payload["row"])
+                records.append(by_missid[entry["missid"]])
+            elif entry["kind"] == "update" and entry["missid"] in by_missid:
+                by_missid[entry["missid"]].update(payload["updates"])
+        return records
+
+    def run(self):
+        while True:
+            if self.wake.wait(OUTBOX_POLL_SECONDS):
+                time.sleep(OUTBOX_BATCH_DELAY)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The entries stay queued for the next pass; the sidebar shows why they are stuck
+                OUTBOX_LOG.exception("Sheets outbox flush failed")
+                try:
+                    with self.lock, self.conn:
+                        self.conn.execute("UPDATE outbox SET attempts = attempts + 1, last_error = ?", (str(e) or type(e).__name__,))
+                except Exception:
+                    OUTBOX_LOG.exception("Could not record the outbox failure")
+
+    def flush(self):
+        groups = {}
+        for entry in self.pending():
+            if entry["next_attempt"] <= time.time():
+                groups.setdefault((entry["sheet_title"], entry["tab"]), []).append(entry)
+        for (sheet_title, tab), entries in groups.items():
+            try:
+                waiting = self._write(sheet_title, tab, entries)
+            except Exception as e:
+                waiting, error = {entry["missid"] for entry in entries}, str(e) or type(e).__name__
+            else:
+                error = "MissID not found in the sheet yet"
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "DELETE FROM outbox WHERE id = ?",
+                    [(entry["id"],) for entry in entries if entry["missid"] not in waiting]
+                )
+                self.conn.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+                    [
+                        (time.time() + min(OUTBOX_MAX_BACKOFF, 2 ** (entry["attempts"] + 1)), error, entry["id"])
+                        for entry in entries if entry["missid"] in waiting
+                    ]
                 )
+
+    def _write(self, sheet_title, tab, entries):
+        """Apply one worksheet's entries; returns the MissIDs that must wait for a later pass."""
+        file_id = self.resolver.resolve(self.drive, sheet_title)
+        if not file_id:
+            raise LookupError(f"Sheet '{sheet_title}' does not exist")
+        ss = self.quota.call(self.client.open_by_key, file_id)
+        ws = self.quota.call(ss.worksheet, tab) if tab else self.quota.call(ss.get_worksheet, 0)
+        rows = self.row_maps.setdefault((ws.spreadsheet_id, ws.id), MissIdRowMap())
+        rows.reset(self.quota.call(ws.col_values, len(COLUMNS)))
+
+        appends, updates, base = {}, {}, {}
+        for entry in entries:
+            payload = json.loads(entry["payload"])
+            if entry["kind"] == "append":
+                appends.setdefault(entry["missid"], payload["row"])
+            else:
+                updates.setdefault(entry["missid"], {}).update(payload["updates"])
+                base.setdefault(entry["missid"], payload["row"])
+
+        waiting = set()
+        to_append = [{**row, **updates.pop(missid, {})} for missid, row in appends.items() if missid not in rows.rows]
+        for missid in [m for m in updates if m not in rows.rows and m not in appends]:
+            if tab:
+                # Missing from the weekly log: append it with the master values, as before
+                to_append.append({**base[missid], **updates.pop(missid)})
+            else:
+                waiting.add(missid)  # its append may still be queued or failing
+                updates.pop(missid)
+        if to_append:
+            resp = self.quota.call(ws.append_rows, [[row.get(col, "") for col in COLUMNS] for row in to_append], value_input_option="USER_ENTERED")
+            rows.note_appended(resp, [str(row.get("MissID", "")) for row in to_append])
+
+        requests = [
+            {"range": f"'{ws.title}'!{colnum_string(COLUMNS.index(col) + 1)}{rows.rows[missid]}", "values": [[value]]}
+            for missid, cells in updates.items() if missid in rows.rows
+            for col, value in cells.items() if col in COLUMNS
+        ]
+        if requests:
+            self.quota.call(ss.values_batch_update, {"valueInputOption": "USER_ENTERED", "data": requests})
+        return waiting
+
+@st.cache_resource
+def sheets_outbox(path):
+    """The process-wide outbox; its worker also picks up entries left from a previous run."""
+    return SheetsOutbox(path, get_drive_service(), gspread.authorize(credentials_gs))
+
+def outbox_status():
+    repo = get_miss_repository()
+    outbox = getattr(repo, "outbox", None) or getattr(getattr(repo, "replica", None), "outbox", None)
+    if outbox is None:
+        return
+    entries = outbox.pending()
+    if not entries:
+        return
+    failing = [entry for entry in entries if entry["attempts"]]
+    message = f"{len({entry['missid'] for entry in entries})} miss(es) waiting to be written to Google Sheets."
+    if failing:
+        st.sidebar.warning(f"{message} Retrying: {failing[-1]['last_error']}", icon=":material/sync_problem:")
+    else:
+        st.sidebar.caption(message)
+
+def get_miss_repository():
+    """
+    The storage backend for this session, chosen by the [storage] secrets section:
+    backend = "sheets" (default) or "sqlite", with sqlite_path and
+    replicate_to_sheets (default true) for the SQLite backend. Sheets writes go
+    through the outbox only when outbox_path names a file on persistent storage
+    (queued writes are lost with it), and never with outbox = false.
+
+    Kept in session state so fragment reruns and later reruns reuse its sheet
+    handles and master snapshot.
+    """
+    if "miss_repository" not in st.session_state:
+        storage = st.secrets.get("storage", {})
+        outbox_path = storage.get("outbox_path")
+        outbox = sheets_outbox(outbox_path) if outbox_path and storage.get("outbox", True) else None
+        sheets = SheetsMissRepository(get_drive_service(), gs_client, outbox=outbox)
+        if storage.get("backend", "sheets") == "sqlite":
+            store = open_sqlite_store(storage.get("sqlite_path", "missed_stops.db"))
+            st.session_state.miss_repository = SqliteMissRepository(store, replica=sheets if storage.get("replicate_to_sheets", True) else None)
+        else:
+            st.session_state.miss_repository = sheets
+    return st.session_state.miss_repository
+
+@st.cache_data(ttl=3600)
+def load_address_df(_service_account_info, address_sheet_url):
+    creds = Credentials.from_service_account_info(_service_account_info, scopes=SCOPES)
+    client = gspread.authorize(creds)
+    ws = sheets_call(sheets_call(client.open_by_url, address_sheet_url).get_worksheet, 0)
+    return sheets_call(ws.get_all_records)
+
+class SpatialIndex:
+    """
+    Uniform grid over the address coordinates for nearest-address and radius
+    queries. Points are projected to metres around the list's mean latitude,
+    which is accurate enough across one city.
+    """
+    CELL_METRES = 250
+
+    def __init__(self, addresses, lats, lons):
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        keys = pd.Index([normalize_address(a) for a in addresses])
+        ok = np.isfinite(lats) & np.isfinite(lons) & ~keys.duplicated()
+        self.addresses = np.asarray(addresses, dtype=object)[ok]
+        self.lat, self.lon = lats[ok], lons[ok]
+        self._lat0 = float(self.lat.mean()) if len(self.lat) else 0.0
+        self._keys = keys[ok]
+        self.xy = self.project(self.lat, self.lon)
+        cells = np.floor(self.xy / self.CELL_METRES).astype(int)
+        self._cells = {}
+        for i, cell in enumerate(map(tuple, cells)):
+            self._cells.setdefault(cell, []).append(i)
+        self._cells = {cell: np.array(idx) for cell, idx in self._cells.items()}
+        self._cell_min, self._cell_max = (cells.min(axis=0), cells.max(axis=0)) if len(cells) else (np.zeros(2), np.zeros(2))
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def project(self, lat, lon):
+        """(n, 2) array of metres east/north for the given coordinates."""
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        return np.column_stack([lon * 111320.0 * np.cos(np.radians(self._lat0)), lat * 110540.0])
+
+    def _cell(self, x, y):
+        return int(np.floor(x / self.CELL_METRES)), int(np.floor(y / self.CELL_METRES))
+
+    def _candidates(self, x, y, ring):
+        cx, cy = self._cell(x, y)
+        if (2 * ring + 1) ** 2 > len(self._cells):
+            # A wide ring holds more cells than the grid has filled, so walk those instead
+            found = [idx for (i, j), idx in self._cells.items() if abs(i - cx) <= ring and abs(j - cy) <= ring]
+        else:
+            found = [
+                self._cells[(i, j)]
+                for i in range(cx - ring, cx + ring + 1)
+                for j in range(cy - ring, cy + ring + 1)
+                if (i, j) in self._cells
             ]
-            form_data["Times Missed"] = str(len(matching_entries) + 1)
-            form_data["Last Missed"] = matching_entries[-1]["Date"] if matching_entries else "First Time"
+        return np.concatenate(found) if found else np.array([], dtype=int)
+
+    def _distances(self, x, y, idx):
+        return np.hypot(self.xy[idx, 0] - x, self.xy[idx, 1] - y)
+
+    def within(self, lat, lon, radius_m):
+        """[(address, metres)] within radius_m of the point, nearest first."""
+        (x, y), = self.project([lat], [lon])
+        idx = self._candidates(x, y, int(np.ceil(radius_m / self.CELL_METRES)))
+        dist = self._distances(x, y, idx)
+        keep = np.flatnonzero(dist <= radius_m)
+        order = keep[np.argsort(dist[keep], kind="stable")]
+        return list(zip(self.addresses[idx[order]], dist[order].round(1)))
+
+    def nearest(self, lat, lon, k=1):
+        """[(address, metres)] for the k addresses nearest the point."""
+        if not len(self):
+            return []
+        (x, y), = self.project([lat], [lon])
+        # The ring that covers every filled cell, measured from the query's cell (which may lie outside the grid)
+        cell = np.array(self._cell(x, y))
+        reach = int(max(np.abs(cell - self._cell_min).max(), np.abs(cell - self._cell_max).max()))
+        ring = 1
+        while True:
+            # Every point within ring * CELL_METRES lies in the searched cells
+            idx = self._candidates(x, y, ring)
+            dist = self._distances(x, y, idx)
+            if len(idx) >= k and np.sort(dist)[k - 1] <= ring * self.CELL_METRES or ring >= reach:
+                order = np.argsort(dist, kind="stable")[:k]
+                return list(zip(self.addresses[idx[order]], dist[order].round(1)))
+            ring *= 2
+
+    def locate(self, addresses):
+        """Vectorized lookup: (lat, lon, found) arrays aligned with addresses."""
+        keys = pd.Index([normalize_address(a) for a in addresses])
+        pos = self._keys.get_indexer(keys)
+        found = pos >= 0
+        lat = np.where(found, self.lat[pos] if len(self) else np.nan, np.nan)
+        lon = np.where(found, self.lon[pos] if len(self) else np.nan, np.nan)
+        return lat, lon, found
+
+# Street suffix and direction spellings, folded to the form the address list uses
+ADDRESS_WORD_VARIANTS = {
+    "STREET": "ST", "AVENUE": "AVE", "AV": "AVE", "ROAD": "RD", "DRIVE": "DR", "LANE": "LN",
+    "BOULEVARD": "BLVD", "PLACE": "PL", "COURT": "CT", "TERRACE": "TER", "PARKWAY": "PKWY",
+    "CIRCLE": "CIR", "HIGHWAY": "HWY", "ALLEY": "ALY", "SQUARE": "SQ",
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+}
+
+ADDRESS_SEARCH_RESULTS = 10
+ADDRESS_MIN_SIMILARITY = 0.3  # share of trigrams a fallback match must have in common with the query
+
+def address_tokens(text):
+    """House number and street words of an address or query, upper-cased with suffixes folded."""
+    return [ADDRESS_WORD_VARIANTS.get(t, t) for t in re.findall(r"[A-Z0-9]+", str(text or "").upper())]
+
+def address_trigrams(tokens):
+    text = f" {' '.join(tokens)} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class AddressSearch:
+    """
+    Server-side address lookup. Every token of every address is indexed, and a
+    query matches the addresses that have a token starting with each typed
+    token, so "12 MAIN" finds "1234 MAIN STREET". When nothing matches outright,
+    tokens no address starts with are respelled from the indexed words ("MIAN"
+    to "MAIN"), and failing that character trigrams rank the nearest spellings.
+    """
 
-    
-            ws = safe_gspread_call(weekly_ss.worksheet, today_tab, error_message="Could not open today's tab in the weekly sheet.")
-            safe_gspread_call(ws.append_row, [form_data.get(col, "") for col in COLUMNS], value_input_option="USER_ENTERED", error_message="Could not submit missed stop to Google Sheets. Please try again.")
-            safe_gspread_call(master_ws.append_row, [form_data.get(col, "") for col in COLUMNS], value_input_option="USER_ENTERED", error_message="Could not update master log. Please try again.")
-        
-            st.info("Miss submitted successfully!", icon=":material/list_alt_check:")         
-            for k in fields_to_reset:
-                if k in st.session_state:
-                    del st.session_state[k]
-            st.rerun()  # Ensures UI is reset instantly
-        
-        # Manual "Start Over" button for user control
-        if st.button("Start Over"):
-            for k in fields_to_reset:
-                if k in st.session_state:
-                    del st.session_state[k]
-            st.rerun()
+    def __init__(self, addresses):
+        self.addresses = list(addresses)
+        self.position = {address: i for i, address in enumerate(self.addresses)}
+        self._tokens = [address_tokens(address) for address in self.addresses]
+        by_token, by_gram = {}, {}
+        for i, tokens in enumerate(self._tokens):
+            for token in tokens:
+                by_token.setdefault(token, set()).add(i)
+            for gram in address_trigrams(tokens):
+                by_gram.setdefault(gram, []).append(i)
+        self._vocab = sorted(by_token)
+        self._by_token = by_token
+        self._by_gram = by_gram
+        self._exact = {}
+        for address, tokens in zip(self.addresses, self._tokens):
+            self._exact.setdefault(" ".join(tokens), address)
+
+    def exact(self, text):
+        """The listed address that text spells, ignoring case, punctuation and suffix variants; None if none."""
+        return self._exact.get(" ".join(address_tokens(text)))
+
+    def _prefixed(self, prefix):
+        found = set()
+        for token in self._vocab[bisect.bisect_left(self._vocab, prefix):]:
+            if not token.startswith(prefix):
+                break
+            found |= self._by_token[token]
+        return found
+
+    def _rank(self, ids, query):
+        def key(i):
+            tokens = self._tokens[i]
+            exact = sum(t in tokens for t in query)
+            house = bool(tokens) and tokens[0] == query[0]
+            return (-exact, not house, len(self.addresses[i]), self.addresses[i])
+        return sorted(ids, key=key)
+
+    def search(self, query, k=ADDRESS_SEARCH_RESULTS, within=None):
+        """Top k addresses for the query; within limits the hits to a set of addresses."""
+        query = address_tokens(query)
+        if not query:
+            return []
+        ids = None
+        for token in query:
+            ids = self._prefixed(token) if ids is None else ids & self._prefixed(token)
+            if not ids:
+                break
+        if within is not None:
+            ids = {i for i in ids if self.addresses[i] in within}
+        if ids:
+            return [self.addresses[i] for i in self._rank(ids, query)[:k]]
+
+        # No address has every token; respell the ones no indexed word starts with and try again
+        respelled = [token if self._prefixed(token) else next(iter(difflib.get_close_matches(token, self._vocab, n=1)), token) for token in query]
+        if respelled != query:
+            found = self.search(" ".join(respelled), k, within)
+            if found:
+                return found
+
+        # Then rank the addresses by how many trigrams they share with the query
+        grams = address_trigrams(query)
+        shared = collections.Counter(i for gram in grams for i in self._by_gram.get(gram, ()))
+        scored = [
+            (-similarity, self.addresses[i])
+            for i, count in shared.items()
+            if within is None or self.addresses[i] in within
+            for similarity in [count / len(grams | address_trigrams(self._tokens[i]))]
+            if similarity >= ADDRESS_MIN_SIMILARITY
+        ]
+        return [address for _, address in sorted(scored)[:k]]
+
+class AddressIndex:
+    """
+    Lookup tables over the address list, built once per address list refresh
+    so city_ops never has to scan every row on a rerun.
+    """
+    SERVICE_TYPES = ("MSW", "SS", "YW")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.zone_to_day = {svc: {} for svc in self.SERVICE_TYPES}
+        self.yw_colors = {}
+        self.by_address = {}
+        self.latlon = {}
+        self._routes = {}
+        addresses = {}
+
+        for row in rows:
+            address = row.get("Address")
+            if address not in self.by_address:
+                self.by_address[address] = row
+                self.latlon[address] = self._parse_latlon(row)
+            color = row.get("YW Zone Color")
+            for svc in self.SERVICE_TYPES:
+                zone = row.get(f"{svc} Zone")
+                if zone and zone not in self.zone_to_day[svc]:
+                    self.zone_to_day[svc][zone] = row.get(f"{svc} Zone") or row.get(f"{svc} Day", "")
+                key = (svc, zone, color if svc == "YW" else None)
+                addresses.setdefault(key, set()).add(address)
+                self._routes.setdefault(key + (address,), row.get(f"{svc} Route", ""))
+            if color:
+                self.yw_colors.setdefault(row.get("YW Zone"), set()).add(color)
+
+        self._addresses = {key: tuple(sorted(vals)) for key, vals in addresses.items()}
+        self._address_sets = {key: frozenset(vals) for key, vals in addresses.items()}
+        # Addresses each service type collects from, for searches across all zones
+        self.serviced = {
+            svc: frozenset().union(*(vals for key, vals in self._address_sets.items() if key[0] == svc and key[1]))
+            for svc in self.SERVICE_TYPES
+        }
+        self.search = AddressSearch(self.by_address)
+        located = [(address, latlon) for address, latlon in self.latlon.items() if latlon]
+        self.spatial = SpatialIndex(
+            [address for address, _ in located],
+            [latlon[0] for _, latlon in located],
+            [latlon[1] for _, latlon in located],
+        )
+        self.yw_colors = {zone: tuple(sorted(colors)) for zone, colors in self.yw_colors.items()}
+        self.zones = {
+            svc: sorted(self.zone_to_day[svc], key=lambda z, svc=svc: self._weekday_idx(self.zone_to_day[svc][z]))
+            for svc in self.SERVICE_TYPES
+        }
+        # Weekdays (lowercase) each service is collected on somewhere in the city
+        self.scheduled_days = {
+            svc: {str(row.get(f"{svc} Zone", "")).strip().lower() for row in rows} - {""}
+            for svc in self.SERVICE_TYPES
+        }
+
+    @staticmethod
+    def _weekday_idx(day):
+        week_order = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+        for i, name in enumerate(week_order):
+            if name.lower() in str(day).lower():
+                return i
+        return 99
+
+    @staticmethod
+    def _parse_latlon(row):
+        if "Latitude" not in row or "Longitude" not in row:
+            return None
+        try:
+            return float(row["Latitude"]), float(row["Longitude"])
+        except (TypeError, ValueError):
+            return None
+
+    def addresses(self, service_type, zone, zone_color=None):
+        key = (service_type, zone, zone_color if service_type == "YW" else None)
+        return self._addresses.get(key, ())
+
+    def address_set(self, service_type, zone, zone_color=None):
+        key = (service_type, zone, zone_color if service_type == "YW" else None)
+        return self._address_sets.get(key, frozenset())
+
+    def zone_of(self, service_type, address):
+        """(zone, YW zone color) of an address for a service type, from its address-list row."""
+        row = self.by_address.get(address, {})
+        return row.get(f"{service_type} Zone", ""), row.get("YW Zone Color") if service_type == "YW" else None
+
+    def route(self, service_type, address, zone, zone_color=None):
+        key = (service_type, zone, zone_color if service_type == "YW" else None, address)
+        return self._routes.get(key, "")
+
+@st.cache_resource(ttl=3600)
+def load_address_index(_service_account_info, address_sheet_url):
+    return AddressIndex(load_address_df(_service_account_info, address_sheet_url))
+
+def distance_matrix(xy):
+    """Pairwise distances between the rows of an (n, 2) array of metres."""
+    diff = xy[:, None, :] - xy[None, :, :]
+    return np.hypot(diff[..., 0], diff[..., 1])
+
+def route_order(xy):
+    """
+    Visiting order for one truck's stops: nearest neighbour from the stop farthest
+    from the centre, then 2-opt. The path is open, so a zero-cost dummy stop
+    closes it into a tour and any stop can end up first or last.
+    """
+    n = len(xy)
+    if n < 3:
+        return list(range(n))
+    dist = np.zeros((n + 1, n + 1))
+    dist[:n, :n] = distance_matrix(xy)
+
+    start = int(np.argmax(np.hypot(*(xy - xy.mean(axis=0)).T)))
+    visited = np.zeros(n + 1, dtype=bool)
+    visited[[start, n]] = True
+    tour = [n, start]
+    for _ in range(n - 1):
+        legs = np.where(visited, np.inf, dist[tour[-1]])
+        tour.append(int(np.argmin(legs)))
+        visited[tour[-1]] = True
+    tour = np.array(tour)
+
+    m = len(tour)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(m - 2):
+            # Reversing tour[i+1..j] swaps edges (a, b) and (c, e) for (a, c) and (b, e)
+            j = np.arange(i + 2, m if i else m - 1)
+            a, b, c, e = tour[i], tour[i + 1], tour[j], tour[(j + 1) % m]
+            delta = dist[a, c] + dist[b, e] - dist[a, b] - dist[c, e]
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-6:
+                tour[i + 1:j[k] + 1] = tour[i + 1:j[k] + 1][::-1]
+                improved = True
+    dummy = int(np.flatnonzero(tour == n)[0])
+    return [int(t) for t in np.roll(tour, -dummy)[1:]]
+
+def plan_dispatch(stops, spatial):
+    """
+    Split stops into trucks by (Service Type, Route) and order each truck's stops
+    with route_order. Stops without coordinates go last, in their given order.
+
+    Returns (ordered stops, DataFrame with Truck, Stop, Address, Zone, Leg (m)).
+    """
+    trucks = {}
+    for row in stops:
+        key = (str(row.get("Service Type", "")), str(row.get("Route", "")) or "No route")
+        trucks.setdefault(key, []).append(row)
+
+    ordered, plan = [], []
+    for (service_type, route), rows in sorted(trucks.items()):
+        lat, lon, found = spatial.locate([row.get("Address", "") for row in rows])
+        located = np.flatnonzero(found)
+        xy = spatial.project(lat[located], lon[located])
+        path = route_order(xy)
+        order = [located[i] for i in path] + list(np.flatnonzero(~found))
+        legs = np.r_[0.0, np.hypot(*np.diff(xy[path], axis=0).T)] if path else []
+        for n, i in enumerate(order):
+            row = rows[i]
+            ordered.append(row)
+            plan.append({
+                "Truck": f"{service_type} · {route}",
+                "Stop": n + 1,
+                "Address": row.get("Address", ""),
+                "Zone": row.get("Zone", ""),
+                "Leg (m)": round(float(legs[n])) if n < len(legs) else None,
+                "MissID": row.get("MissID", ""),
+            })
+    return ordered, pd.DataFrame(plan, columns=["Truck", "Stop", "Address", "Zone", "Leg (m)", "MissID"])
+
+def admin_usernames():
+    """Usernames allowed on the hidden ?page= admin pages, from the [admin] secrets section."""
+    return st.secrets.get("admin", {}).get("usernames", [])
+
+def percentile_table(df, by):
+    return (
+        df.groupby(by)["ms"]
+        .agg(calls="count", p50=lambda s: s.quantile(0.5), p95=lambda s: s.quantile(0.95), max="max")
+        .round(1)
+        .sort_values("p95", ascending=False)
+        .reset_index()
+    )
+
+def performance_page():
+    """
+    Hidden page (?page=performance, for usernames listed in admin_usernames) with
+    rolling p50/p95 latency of external calls, per call site and per screen.
+    """
+    set_trace_mode("Performance")
+    st.header("Performance")
+    calls = call_tracer().frame()
+    if calls.empty:
+        st.info("No external calls recorded since the app started.", icon=":material/monitoring:")
+        return
+    st.caption(f"Last {len(calls)} external calls in this process (window {CALL_TRACE_WINDOW}).")
+
+    calls["call site"] = calls["service"] + "." + calls["method"]
+    st.subheader("Per call site")
+    st.dataframe(percentile_table(calls, "call site"), hide_index=True, use_container_width=True)
+
+    # A rerun's cost is the sum of its calls, so screens are compared rerun by rerun
+    reruns = calls[calls["rerun"] != "background"].groupby(["mode", "rerun"]).agg(ms=("ms", "sum"), calls=("ms", "count")).reset_index()
+    st.subheader("Per screen (external time per rerun)")
+    if reruns.empty:
+        st.info("No reruns recorded yet.", icon=":material/monitoring:")
     else:
-        help_page(name, user_role)
+        st.dataframe(percentile_table(reruns, "mode").rename(columns={"calls": "reruns"}), hide_index=True, use_container_width=True)
 
-def jpm_ops(name, user_role):
+    errors = calls[calls["error"].notna()]
+    if not errors.empty:
+        st.subheader("Failed calls")
+        st.dataframe(errors[["at", "call site", "target", "error", "ms"]].iloc[::-1], hide_index=True, use_container_width=True)
 
-    st.sidebar.subheader("JPM Operations")
-    jpm_mode = st.sidebar.radio("Select Action:", ["Dispatch Misses", "Complete a Missed Stop", "Submit Completion Times", "Help"])
+    with st.expander("Slowest recent calls"):
+        st.dataframe(
+            calls.nlargest(50, "ms")[["at", "mode", "rerun", "call site", "target", "rows", "bytes", "ms", "wait_ms"]],
+            hide_index=True, use_container_width=True,
+        )
 
-    def update_rows(ws, indices, updates, columns=COLUMNS):
-        last_col = colnum_string(len(columns))
-        for idx in indices:
-            try:
-                row_values = safe_gspread_call(ws.row_values, idx, error_message="Could not fetch row values from Google Sheets.")
-
-                row_dict = dict(zip(columns, row_values + [""]*(len(columns)-len(row_values))))
-                row_dict.update(updates)
-                safe_gspread_call(
-                    ws.update,
-                    f"A{idx}:{last_col}{idx}",
-                    [[row_dict.get(col, "") for col in columns]],
-                    value_input_option="USER_ENTERED",
-                    error_message=f"Could not update row {idx} in Google Sheets."
-                )
+def maintenance_page():
+    """Hidden page (?page=maintenance) for moving old closed misses out of the active Master Misses Log."""
+    set_trace_mode("Maintenance")
+    st.header("Maintenance")
+    repo = get_miss_repository()
+    sheets = repo.replica if hasattr(repo, "replica") else repo  # the SQLite backend archives through its replica
+    if sheets is None:
+        st.info("The local miss store is not partitioned; there is nothing to archive.", icon=":material/inventory_2:")
+        return
 
-            except HttpError as e:
-                if e.resp.status == 429 or "Rate Limit" in str(e):
-                    st.error(
-                        "Too many updates at once! Google Sheets is rate-limiting you. "
-                        "Please wait a minute and try again, or select fewer items at a time.", icon=":material/warning:"
-                    )
-                    # Optionally: break or return to prevent further updates
-                    break
-                else:
-                    st.error(f"Error updating row {idx}: {e}", icon=":material/error:")
+    st.subheader("Archive closed misses")
+    st.caption(
+        f"Closed misses older than the threshold move to '{MASTER_ARCHIVE_TITLE}' (one tab per year), "
+        f"and the '{MASTER_ROLLUP_TAB}' tab is rebuilt so Times Missed still counts them. "
+        "Run this when nobody is dispatching or completing stops."
+    )
+    days = st.number_input("Archive closed misses older than (days)", min_value=7, value=MASTER_ARCHIVE_AFTER_DAYS, step=1)
+    cutoff = datetime.datetime.now(pytz.timezone("America/New_York")).date() - datetime.timedelta(days=int(days))
+    if sheets.outbox is not None and sheets.outbox.pending(MASTER_LOG_TITLE, ""):
+        st.warning("Writes to the Master Misses Log are still queued. Try again once they are written.", icon=":material/sync_problem:")
+        return
+    if st.button(f"Archive misses closed before {cutoff}"):
+        with st.spinner("Archiving..."):
+            result = sheets.archive_closed(cutoff)
+        if result["archived"]:
+            st.success(
+                f"Archived {result['archived']} miss(es) into {', '.join(result['years'])}. "
+                f"The rollup covers {result['addresses']} address(es).", icon=":material/inventory_2:"
+            )
+        else:
+            st.info("No closed misses are old enough to archive.", icon=":material/inventory_2:")
 
-    if jpm_mode == "Dispatch Misses":
-        # Always work from Master Misses Log
-        master_id = get_master_log_id(drive, FOLDER_ID)
-        master_ws = safe_gspread_call(gs_client.open_by_key, master_id, error_message="Could not open the Master Misses Log sheet. Please try again.").sheet1
-        master_records = safe_gspread_call(master_ws.get_all_records, error_message="Could not fetch missed stops from Google Sheets. Please try again.")
-
-        undispatched_records = [
-            row for row in master_records
-            if str(row.get("Collection Status", "")).strip().upper() in ("PENDING", "PREMATURE")
-            and not row.get("Time Dispatched")
+ADMIN_PAGES = {"performance": performance_page, "maintenance": maintenance_page}
+
+def help_page(name, user_role):
+    st.subheader("Help & Support")
+    st.write(
+        "Welcome to the Missed Pickup Portal Help page. "
+        "For detailed documentation, click the “View Full Docs” button above. "
+        "If you would like to submit feedback, request additional features, or report a bug, "
+        "please use the 'Submit Feedback' button below. "
+        "If you are in need of immediate assistance, please contact us via email or phone. "
+        "Thank you for using our service!"
+    )
+
+    st.markdown("---")
+
+    st.write("#### Rate your overall experience:")
+    feedback = st.feedback("thumbs", key="overall_exp")
+
+    FEEDBACK_SHEET_ID = "1fUrJymiIfC5GS_ofz9x4czUG6e3b8W63mMwLUyxHvFM"
+    FEEDBACK_SHEET_NAME = "Feedback"
+
+    if feedback is not None:
+        # Map thumbs to text
+        rating_map = {0: "Thumbs Down", 1: "Thumbs Up"}
+        rating_text = rating_map.get(feedback, str(feedback))
+
+        row = [
+            name,
+            user_role,
+            datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S"),
+            "Quick Feedback",
+            "",  # No details for thumbs, just the rating
+            rating_text
         ]
+        try:
+            feedback_ws = sheets_call(sheets_call(gs_client.open_by_key, FEEDBACK_SHEET_ID).worksheet, FEEDBACK_SHEET_NAME)
+            sheets_call(feedback_ws.append_row, row)
+            if feedback == 1:
+                st.info("Thanks for the thumbs up!", icon=":material/cheer:")
+            else:
+                st.info("Sorry to hear that. For more detailed feedback or to report an issue, please use the button below.", icon=":material/sentiment_dissatisfied:")
+        except Exception as e:
+            st.error(f"Failed to write to feedback sheet: {e}", icon=":material/error:")
 
-        if undispatched_records:
-            df_undispatched = pd.DataFrame(undispatched_records)
-            if 'Time Sent to JPM' in df_undispatched.columns:
-                df_undispatched['Time Sent to JPM'] = pd.to_datetime(df_undispatched['Time Sent to JPM'], errors='coerce')
-                df_undispatched = df_undispatched.sort_values(by='Time Sent to JPM', ascending=True)
-            if "MissID" not in df_undispatched.columns:
-                df_undispatched["MissID"] = ""
-            columns_to_show = [
-                "Time Sent to JPM", "Address", "Zone", "Service Type", "Collection Status"
-            ]
-            show_cols = [col for col in columns_to_show if col in df_undispatched.columns]
-            old_stops = [
-                row for row in undispatched_records
-                if "Time Sent to JPM" in row and
-                pd.to_datetime(row["Time Sent to JPM"], errors="coerce").date() < today
+    st.markdown("---")
+
+    @st.dialog("Submit Feedback / Report Bug / Request Feature")
+    def feedback_dialog():
+        feedback_type = st.selectbox("Type", ["Bug Report", "Feature Request", "General Feedback"])
+        details = st.text_area("Describe the issue or idea")
+        if st.button("Submit"):
+            row = [
+                name,
+                user_role,
+                datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S"),
+                feedback_type,
+                details,
+                ""  # Leave rating blank for detailed feedback
             ]
-            if old_stops:
-                count = len(old_stops)
-                st.info(
-                    f"**ATTN:** There {'is' if count == 1 else 'are'} {count} stop{'s' if count != 1 else ''} that need{'s' if count == 1 else ''} to be closed out from a previous day{'s' if count != 1 else ''}.", icon=":material/data_alert:"
-                )
-            st.subheader("Stops Awaiting Dispatch")
-            event = st.dataframe(
-                df_undispatched[show_cols],
-                key="undispatched_data",
-                on_select="rerun",
-                selection_mode="multi-row",
-                use_container_width=True,
-                hide_index=True,
-            )
+            try:
+                feedback_ws = sheets_call(sheets_call(gs_client.open_by_key, FEEDBACK_SHEET_ID).worksheet, FEEDBACK_SHEET_NAME)
+                sheets_call(feedback_ws.append_row, row)
+                st.info("Thank you for your feedback! It has been recorded.", icon=":material/feedback:")
+            except Exception as e:
+                st.error(f"Failed to write to feedback sheet: {e}", icon=":material/error:")
+            st.rerun()
 
-            selected_rows = event.selection.rows if hasattr(event, "selection") else []
+    if st.button("Submit Feedback / Report Bug / Request Feature"):
+        feedback_dialog()
 
-            if selected_rows:
-                st.info(f"Selected {len(selected_rows)} stop(s) to dispatch.", icon=":material/select_check_box:")
 
-            if st.button("Dispatch Selected Stops", disabled=not selected_rows):
-                now_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
-                selected_df = df_undispatched.iloc[selected_rows]
-                selected_missids = selected_df["MissID"].tolist()
-
-                # --- Master Log: batch update by MissID ---
-                indices_to_update = []
-                row_updates = []  # Parallel list: updates for each row
-
-                for missid in selected_missids:
-                    row_idx_master = find_row_by_missid(master_ws, missid)
-                    current_status = None
-                    for row in master_records:
-                        if row.get("MissID") == missid:
-                            current_status = row.get("Collection Status", "").strip().upper()
-                            break
-                    updates = {"Time Dispatched": now_time}
-                    if current_status != "PREMATURE":
-                        updates["Collection Status"] = "Dispatched"
-                    if row_idx_master:
-                        indices_to_update.append(row_idx_master)
-                        row_updates.append(updates)
-                    else:
-                        st.error(f"Could not find MissID {missid} in Master Misses Log. It may have been deleted.", icon=":material/error:")
-
-                if indices_to_update:
-                    # Use batch_update for all at once
-                    last_col = colnum_string(len(COLUMNS))
-                    data = master_ws.get_all_values()
-                    requests = []
-                    for idx, updates in zip(indices_to_update, row_updates):
-                        row_values = data[idx-1] if idx-1 < len(data) else []
-                        row_dict = dict(zip(COLUMNS, row_values + [""]*(len(COLUMNS)-len(row_values))))
-                        row_dict.update(updates)
-                        range_str = f"A{idx}:{last_col}{idx}"
-                        requests.append({
-                            "range": range_str,
-                            "values": [[row_dict.get(col, "") for col in COLUMNS]],
-                        })
-                    if requests:
-                        master_ws.batch_update(requests, value_input_option="USER_ENTERED")
-
-                # --- Weekly log: batch update by MissID ---
-                from collections import defaultdict
-
-                # 1. Collect updates for each sheet/tab as: {(sheet_id, tab_name): list of (row_idx, updates, full_row_dict)}
-                batch_update_map = defaultdict(list)
-                append_map = defaultdict(list)  # For missing rows
-
-                for row in selected_df.to_dict("records"):
-                    missid = row.get("MissID")
-                    miss_date = row.get("Date")
-                    if miss_date:
-                        try:
-                            miss_date_dt = datetime.datetime.strptime(miss_date, "%Y-%m-%d").date()
-                            sheet_title = get_sheet_title(miss_date_dt)
-                            weekly_id = ensure_gsheet_exists(drive, FOLDER_ID, sheet_title)
-                            weekly_ss = safe_gspread_call(gs_client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
-                            tab_name = get_today_tab_name(miss_date_dt)
-                            ws = safe_gspread_call(weekly_ss.worksheet, tab_name, error_message=f"Could not open weekly tab '{tab_name}'.")
-
-                            row_idx_weekly = find_row_by_missid(ws, missid)
-                            current_status = row.get("Collection Status", "").strip().upper()
-                            updates = {"Time Dispatched": now_time}
-                            if current_status != "PREMATURE":
-                                updates["Collection Status"] = "Dispatched"
-
-                            if row_idx_weekly:
-                                batch_update_map[(weekly_id, tab_name)].append((row_idx_weekly, updates, row))
-                            else:
-                                # Schedule for append, then update after appending
-                                append_map[(weekly_id, tab_name)].append((ws, row, updates, missid))
-                        except Exception as e:
-                            st.error(f"Error updating weekly sheet for MissID {missid} in tab '{tab_name}': {e}", icon=":material/error:")
-
-                # 2. Perform batch updates for existing rows
-                for (weekly_id, tab_name), row_tuples in batch_update_map.items():
-                    weekly_ss = gs_client.open_by_key(weekly_id)
-                    ws = weekly_ss.worksheet(tab_name)
-                    data = ws.get_all_values()
-                    last_col = colnum_string(len(COLUMNS))
-                    requests = []
-                    for row_idx_weekly, updates, row in row_tuples:
-                        row_values = data[row_idx_weekly - 1] if row_idx_weekly - 1 < len(data) else []
-                        row_dict = dict(zip(COLUMNS, row_values + [""]*(len(COLUMNS)-len(row_values))))
-                        row_dict.update(updates)
-                        range_str = f"A{row_idx_weekly}:{last_col}{row_idx_weekly}"
-                        requests.append({
-                            "range": range_str,
-                            "values": [[row_dict.get(col, "") for col in COLUMNS]],
-                        })
-                    if requests:
-                        ws.batch_update(requests, value_input_option="USER_ENTERED")
-
-                # 3. Handle appends and then update those rows as well
-                for (weekly_id, tab_name), append_tuples in append_map.items():
-                    weekly_ss = gs_client.open_by_key(weekly_id)
-                    ws = weekly_ss.worksheet(tab_name)
-                    for ws_obj, row, updates, missid in append_tuples:
-                        st.warning(f"MissID {missid} not found in weekly sheet '{tab_name}'. Appending from master...")
-                        try:
-                            # Append the missing row
-                            safe_gspread_call(
-                                ws_obj.append_row,
-                                [row.get(col, "") for col in COLUMNS],
-                                value_input_option="USER_ENTERED",
-                                error_message=f"Could not append missing MissID {missid} to weekly tab."
-                            )
-                            # After appending, get new row index (should be at the end)
-                            new_row_idx = len(ws_obj.get_all_values())
-                            row_values = ws_obj.row_values(new_row_idx)
-                            row_dict = dict(zip(COLUMNS, row_values + [""]*(len(COLUMNS)-len(row_values))))
-                            row_dict.update(updates)
-                            last_col = colnum_string(len(COLUMNS))
-                            ws_obj.update(
-                                f"A{new_row_idx}:{last_col}{new_row_idx}",
-                                [[row_dict.get(col, "") for col in COLUMNS]],
-                                value_input_option="USER_ENTERED"
-                            )
-                        except Exception as e:
-                            st.error(f"Failed to append/update missing row to weekly sheet: {e}", icon=":material/error:")
-
-                st.info(f"Dispatched {len(selected_rows)} missed stop(s)!", icon=":material/list_alt_check:")
-                st.rerun()
-        else:
-            st.info("No pending missed stops to dispatch!", icon=":material/done_all:")
 
-    elif jpm_mode == "Complete a Missed Stop":
-        fields_to_reset = ["driver_checkin", "collection_status", "jpm_notes", "uploaded_image"]
-        master_id = get_master_log_id(drive, FOLDER_ID)
-        master_ws = safe_gspread_call(gs_client.open_by_key, master_id, error_message="Could not open the Master Misses Log sheet. Please try again.").sheet1
-        master_records = safe_gspread_call(master_ws.get_all_records, error_message="Could not fetch missed stops from Google Sheets. Please try again.")
+
+@st.fragment
+def city_submission_form(name, today, address_index):
+    """The submission form; its widgets rerun only this fragment, not the whole app."""
+    begin_rerun_trace(fragment=True)
+    service_type = st.selectbox("Service Type", ["MSW", "SS", "YW"])
+    zone_to_day = address_index.zone_to_day[service_type]
+    zones = address_index.zones[service_type]
+
+    week_order = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+    
+    def weekday_to_week_order_idx(py_weekday):
+        return (py_weekday + 1) % 7
+    
+    today_py_idx = datetime.date.today().weekday()  
+    today_idx = weekday_to_week_order_idx(today_py_idx)  
+    
+    yesterday_idx = (today_idx - 1) % 7
+    yesterday_day = week_order[yesterday_idx]
     
-        # Use session state for caching/filtering if desired (optional)
-        if "to_complete_data" not in st.session_state or st.session_state.get("reload_to_complete", False):
-            st.session_state.to_complete_data = master_records
-            st.session_state.reload_to_complete = False
-
-        # --- PRIOR UNCOMPLETED WARNING BLOCK (Unified) ---
-        completed_statuses = ("PICKED UP", "REJECTED", "CONFIRMED PREMATURE", "ONE TIME EXCEPTION", "NOT OUT", "CREATED IN ERROR", "LATE PUT OUT")
-
-        # (1) Dispatched but not completed, from prior days
-        prior_uncompleted = [
-            row for row in master_records
-            if row.get("Time Dispatched")
-            and str(row.get("Collection Status", "").strip().upper()) not in completed_statuses
-            and row.get("Date")
-            and datetime.datetime.strptime(row.get("Date"), "%Y-%m-%d").date() < today
-        ]
 
-        # (2) Pending or Premature, not completed/dispatched, from prior days
-        pending_or_premature_prior = [
-            row for row in master_records
-            if str(row.get("Collection Status", "")).strip().upper() in ("PENDING", "PREMATURE")
-            and not row.get("Time Dispatched")
-            and row.get("Date")
-            and datetime.datetime.strptime(row.get("Date"), "%Y-%m-%d").date() < today
-        ]
+    default_zone = None
+    for z in zones:
+        if yesterday_day.lower() in str(zone_to_day[z]).lower():
+            default_zone = z
+            break
+    if not default_zone:
+        default_zone = zones[0] if zones else ""
+    
+
+    zone = st.selectbox("Zone", zones, index=zones.index(default_zone) if default_zone in zones else 0)
 
-        # --- Combine, deduplicate, display ---
-        all_prior_open = prior_uncompleted + pending_or_premature_prior
-        if all_prior_open:
-            df_all_prior = pd.DataFrame(all_prior_open)
-            if "MissID" in df_all_prior.columns:
-                df_all_prior = df_all_prior.drop_duplicates(subset="MissID")
-            count = len(df_all_prior)
+    zone_color = None
+    if service_type == "YW":
+        # Pull unique YW Zone Colors for this zone
+        zone_colors = address_index.yw_colors.get(zone, ())
+        if zone_colors:
+            zone_color = st.selectbox("YW Zone Color", zone_colors)
+        else:
+            zone_color = ""
+    
+    # Matches are found on the server, so only the top results are sent to the browser
+    query = st.text_input("Search Address", key="address_query", placeholder="House number and street")
+    all_zones = st.checkbox("Search all zones", key="address_all_zones")
+    if query.strip():
+        scope = address_index.serviced[service_type] if all_zones else address_index.address_set(service_type, zone, zone_color)
+        matches = address_index.search.search(query, within=scope)
+    else:
+        zone_addresses = address_index.addresses(service_type, zone, zone_color)
+        matches = list(zone_addresses[:ADDRESS_SEARCH_RESULTS])
+        if len(zone_addresses) > len(matches):
+            st.caption(f"Showing the first {len(matches)} of {len(zone_addresses)} addresses in this zone. Type to search the rest.")
+    if not matches:
+        st.info("No matching address. Check the spelling or search all zones.", icon=":material/search_off:")
+        return
+    address = st.selectbox("Address", matches)
+    if all_zones and query.strip():
+        zone, zone_color = address_index.zone_of(service_type, address)
+        st.caption(f"Zone: {zone}" + (f" · {zone_color}" if zone_color else "") + f" · Route: {address_index.route(service_type, address, zone, zone_color) or 'N/A'}")
+    latlon = address_index.latlon.get(address)
+    if latlon:
+        map_df = pd.DataFrame([{"lat": latlon[0], "lon": latlon[1]}])
+        st.map(map_df, latitude="lat", longitude="lon", zoom=16, size=10)       
+        nearby = [(a, m) for a, m in address_index.spatial.nearest(latlon[0], latlon[1], k=4) if a != address][:3]
+        if nearby:
+            st.caption("Nearest listed addresses: " + " · ".join(f"{a} ({m:.0f} m)" for a, m in nearby))
+    route = address_index.route(service_type, address, zone, zone_color)
+
+    placement_exception = st.selectbox("Placement Exception?", ["NO", "YES"])
+    pe_address = st.text_input("PE Address") if placement_exception == "YES" else "N/A"
+    fields_to_reset = [
+        "whole_block", "called_in_time", "city_notes", 
+        "placement_exception", "pe_address"
+    ]
+    
+    # --- Whole Block ---
+    whole_block = st.selectbox("Whole Block", ["NO", "YES"], key="whole_block")
+    
+    # --- Time Called In ---
+    if "called_in_time" not in st.session_state:
+        now = datetime.datetime.now(pytz.timezone("America/New_York"))
+        current_time_str = now.strftime("%I:%M %p")
+        st.session_state.called_in_time = (
+            current_time_str if current_time_str in time_options else time_options[0]
+        )
+    called_in_time = st.selectbox(
+        "Time Called In",
+        time_options,
+        key="called_in_time"
+    )
+    
+    city_notes = st.text_input("City Notes (optional)", key="city_notes")
+    submit_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
+    form_data = {
+        "Date": str(today), "Submitted By": name, "Time Called In": called_in_time, "Zone": zone,
+        "Time Sent to JPM": submit_time, "Address": address, "Service Type": service_type, "Route": route,
+        "Whole Block": whole_block, "Placement Exception": placement_exception, "PE Address": pe_address,
+        "City Notes": city_notes, "Collection Status": "Pending", "YW Zone Color": zone_color if service_type == "YW" else "N/A", "MissID": str(uuid.uuid4())
+    }
+
+    repo = get_miss_repository()
+    try:
+        form_data["Collection Status"] = miss_status(repo, today, service_type, zone, address_index)
+        if form_data["Collection Status"] == "Premature":
             st.info(
-                f"**ATTN:** There {'is' if count == 1 else 'are'} {count} stop{'s' if count != 1 else ''} from before today that {'needs' if count == 1 else 'need'} to be closed out. Check the table below:", icon=":material/data_alert:"
+                f"FYI: The {service_type} service has not been marked completed yet for today. "
+                f"This stop will be flagged as **Premature**.", icon=":material/data_info_alert:"
             )
-            show_cols = ["Address", "Zone", "Service Type", "Collection Status", "Date", "Time Dispatched"]
-            show_cols = [col for col in show_cols if col in df_all_prior.columns]
-            # Optional: sort by Date then Time Dispatched (if desired)
-            if "Date" in df_all_prior.columns:
-                df_all_prior = df_all_prior.sort_values(by=["Date", "Time Dispatched"], ascending=True)
-            st.dataframe(df_all_prior[show_cols], use_container_width=True, hide_index=True)
-
-
-        to_complete = []
-        for i, row in enumerate(st.session_state.to_complete_data):
-            status = row.get("Collection Status", "").strip().upper()
-            has_dispatched = bool(row.get("Time Dispatched"))
-
-            if has_dispatched and status in ("DISPATCHED", "DELAYED", "PREMATURE"):
-                label = (
-                    f"{row.get('Address','')} | {row.get('Zone','')} | Date: {row.get('Date','')} | Dispatched: {row.get('Time Dispatched','')}"
-                )
-                to_complete.append({"row_idx": i+2, "row": row, "label": label})
+    except Exception as e:
+        st.error(f"Could not check completion status for today: {e}", icon=":material/error:")
+
 
     
-        if not to_complete:
-            st.info("No dispatched, incomplete misses for today!", icon=":material/celebration:")
-        else:
-            st.caption(
-                "Only 'Premature' stops that have been dispatched will be listed here for completion."
-            )
+    missing_fields = []
+    
+    if placement_exception == "YES" and not pe_address.strip():
+        missing_fields.append("PE Address")
+    
+    if missing_fields:
+        st.error(f"Please complete the following required fields: {', '.join(missing_fields)}", icon=":material/block:")
+        st.stop()
+    
+    if st.button("Submit Missed Stop"):
+
+        if repo.has_open_miss(address):
+            st.error("This address already has a missed stop that is not yet resolved.", icon=":material/block:")
+            st.stop()
 
-            chosen = st.selectbox("Select a dispatched miss to complete:", to_complete, format_func=lambda x: x["label"])
-            sel = chosen["row"]
+        # Only count legitimate missed stops (exclude Premature/Rejected/other non-miss statuses)
+        history = repo.miss_history()
+        form_data["Times Missed"] = str(calculate_times_missed(history, address) + 1)
+        form_data["Last Missed"] = history.last(address) or "First Time"
+
+        repo.append_miss(form_data)
     
-            if "driver_checkin" not in st.session_state:
-                now = datetime.datetime.now(pytz.timezone("America/New_York"))
-                current_time_str = now.strftime("%I:%M %p")
-                st.session_state.driver_checkin = (
-                    current_time_str if current_time_str in time_options else time_options[0]
-                )
-            driver_checkin = st.selectbox(
-                "Driver Check In Time",
-                time_options,
-                key="driver_checkin"
+        st.info("Miss submitted successfully!", icon=":material/list_alt_check:")         
+        for k in fields_to_reset:
+            if k in st.session_state:
+                del st.session_state[k]
+        rerun_fragment()  # Ensures UI is reset instantly
+    
+    # Manual "Start Over" button for user control
+    if st.button("Start Over"):
+        for k in fields_to_reset:
+            if k in st.session_state:
+                del st.session_state[k]
+        rerun_fragment()
+
+IMPORT_COLUMNS = ["Address", "Service Type", "Date", "Time Called In", "Whole Block", "Placement Exception", "PE Address", "City Notes"]
+IMPORT_HEADERS = {col.lower(): col for col in IMPORT_COLUMNS}
+
+def read_import_rows(uploaded):
+    """
+    Yields (line number, {column: value}) for each non-blank row of an uploaded
+    CSV or XLSX file; an XLSX is read a row at a time. A CSV that is not UTF-8 is
+    read as cp1252, the encoding Excel on Windows saves. Headers match
+    IMPORT_COLUMNS regardless of case.
+    """
+    if uploaded.name.lower().endswith(".xlsx"):
+        if openpyxl is None:
+            st.error("Reading .xlsx files needs the openpyxl package. Save the file as CSV and try again.", icon=":material/error:")
+            st.stop()
+        rows = openpyxl.load_workbook(uploaded, read_only=True, data_only=True).active.iter_rows(values_only=True)
+        header = [str(cell or "") for cell in next(rows, ())]
+    else:
+        data = uploaded.read()
+        try:
+            text = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            try:
+                text = data.decode("cp1252")
+            except UnicodeDecodeError:
+                stop_with_error("Could not read the file's text. Save it as \"CSV UTF-8\" and try again.")
+        rows = csv.reader(io.StringIO(text, newline=""))
+        header = next(rows, [])
+    header = [IMPORT_HEADERS.get(str(col).strip().lower(), str(col).strip()) for col in header]
+    for line, values in enumerate(rows, start=2):
+        values = ["" if value is None else value for value in values]
+        if any(str(value).strip() for value in values):
+            yield line, dict(zip(header, values))
+
+def parse_import_date(value, today):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    text = str(value).strip()
+    if not text:
+        return today
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+def parse_import_time(value, default):
+    if isinstance(value, datetime.datetime):
+        value = value.time()
+    if isinstance(value, datetime.time):
+        return value.strftime("%I:%M %p")
+    text = str(value).strip().upper()
+    if not text:
+        return default
+    for fmt in ("%I:%M %p", "%I:%M%p", "%H:%M", "%H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(text, fmt).strftime("%I:%M %p")
+        except ValueError:
+            pass
+    return None
+
+def import_miss(raw, name, today, address_index, repo, history, seen):
+    """
+    The master-log row for one imported line, checked the way the submission form
+    checks it (open-miss duplicate, Premature, Times Missed), as (row, None); or
+    (None, reason) if the line is rejected. seen holds addresses accepted earlier in the file.
+    """
+    now = datetime.datetime.now(pytz.timezone("America/New_York"))
+    address = address_index.search.exact(raw.get("Address"))
+    if not address:
+        return None, "Address is not in the address list"
+    service_type = str(raw.get("Service Type", "")).strip().upper()
+    if service_type not in AddressIndex.SERVICE_TYPES:
+        return None, "Service Type must be MSW, SS or YW"
+    zone, zone_color = address_index.zone_of(service_type, address)
+    if not zone:
+        return None, f"Address has no {service_type} zone"
+    day = parse_import_date(raw.get("Date", ""), today)
+    if day is None or day > today:
+        return None, "Date must be YYYY-MM-DD or M/D/YYYY and not in the future"
+    problem = repo.target_problem(day)
+    if problem:
+        return None, problem
+    called_in_time = parse_import_time(raw.get("Time Called In", ""), now.strftime("%I:%M %p"))
+    if called_in_time is None:
+        return None, "Time Called In must look like 09:30 AM"
+    whole_block = str(raw.get("Whole Block", "") or "NO").strip().upper()
+    placement_exception = str(raw.get("Placement Exception", "") or "NO").strip().upper()
+    if whole_block not in ("YES", "NO") or placement_exception not in ("YES", "NO"):
+        return None, "Whole Block and Placement Exception must be YES or NO"
+    pe_address = str(raw.get("PE Address", "")).strip()
+    if placement_exception == "YES" and not pe_address:
+        return None, "PE Address is required for a placement exception"
+    if normalize_address(address) in seen:
+        return None, "Same address as an earlier row in this file"
+    if repo.has_open_miss(address):
+        return None, "This address already has a missed stop that is not yet resolved"
+    try:
+        status = miss_status(repo, day, service_type, zone, address_index)
+    except Exception as e:
+        return None, f"Could not check completion status: {e}"
+
+    seen.add(normalize_address(address))
+    return {
+        "Date": str(day), "Submitted By": name, "Time Called In": called_in_time, "Zone": zone,
+        "Time Sent to JPM": now.strftime("%Y-%m-%d %H:%M:%S"), "Address": address, "Service Type": service_type,
+        "Route": address_index.route(service_type, address, zone, zone_color),
+        "Whole Block": whole_block, "Placement Exception": placement_exception, "PE Address": pe_address or "N/A",
+        "City Notes": str(raw.get("City Notes", "")).strip(), "Collection Status": status,
+        "YW Zone Color": zone_color if service_type == "YW" else "N/A", "MissID": str(uuid.uuid4()),
+        # A backdated row only counts the misses called in before it
+        "Times Missed": str(get_prior_legit_miss_count(history, address, day, called_in_time) + 1),
+        "Last Missed": history.last_before(address, day, called_in_time) or "First Time",
+    }, None
+
+def bulk_import_page(name, today, address_index):
+    """Import a file of missed stops logged offline, with an accept/reject report per row."""
+    st.subheader("Bulk Import Missed Stops")
+    st.caption(
+        f"One missed stop per row, with a header row: {', '.join(IMPORT_COLUMNS)}. "
+        "Only Address and Service Type are required; Date defaults to today and Time Called In to now. "
+        "Zone and route come from the address list."
+    )
+    uploaded = st.file_uploader("CSV or Excel file", type=["csv", "xlsx"], key="bulk_import_file")
+
+    if st.button("Import Missed Stops", disabled=uploaded is None):
+        repo = get_miss_repository()
+        history = repo.miss_history()
+        seen, accepted, report = set(), [], []
+        progress = st.empty()
+        for line, raw in read_import_rows(uploaded):
+            row, reason = import_miss(raw, name, today, address_index, repo, history, seen)
+            if row is not None:
+                accepted.append(row)
+            report.append({
+                "Row": line, "Address": str(raw.get("Address", "")), "Service Type": str(raw.get("Service Type", "")),
+                "Result": "Accepted" if row is not None else "Rejected", "Reason": reason or "",
+                "MissID": row["MissID"] if row is not None else "",
+            })
+            if line % 50 == 0:
+                progress.caption(f"Checked {len(report)} row(s)...")
+        progress.empty()
+        if accepted:
+            repo.append_misses(accepted)
+        st.session_state.bulk_import_report = pd.DataFrame(report, columns=["Row", "Address", "Service Type", "Result", "Reason", "MissID"])
+
+    report = st.session_state.get("bulk_import_report")
+    if report is not None:
+        imported = int((report["Result"] == "Accepted").sum())
+        st.info(f"Imported {imported} missed stop(s); {len(report) - imported} row(s) rejected.", icon=":material/list_alt_check:")
+        st.dataframe(report, use_container_width=True, hide_index=True)
+        st.download_button("Download Report", report.to_csv(index=False), file_name=f"import_report_{today}.csv", mime="text/csv")
+
+def city_ops(name, user_role):
+    st.sidebar.subheader("City of Allentown")
+    if "city_mode" not in st.session_state:
+        st.session_state.city_mode = "Submit a Missed Pickup"
+
+    city_mode = st.sidebar.radio("Select Action:", ["Submit a Missed Pickup", "Bulk Import", "Help"])
+    set_trace_mode(city_mode)
+
+    if city_mode == "Submit a Missed Pickup":
+        today = datetime.datetime.now(pytz.timezone("America/New_York")).date()
+    
+        drive = get_drive_service()
+        sheet_title = get_sheet_title(today)
+        prefetch_sheet_ids(drive, FOLDER_ID, [sheet_title, get_completion_times_sheet_title(today), MASTER_LOG_TITLE])
+        ensure_gsheet_exists(drive, FOLDER_ID, sheet_title)  # stops here if this week's sheet is missing
+        address_index = load_address_index(SERVICE_ACCOUNT_INFO, ADDRESS_LIST_SHEET_URL)
+        
+        city_submission_form(name, today, address_index)
+    elif city_mode == "Bulk Import":
+        today = datetime.datetime.now(pytz.timezone("America/New_York")).date()
+        address_index = load_address_index(SERVICE_ACCOUNT_INFO, ADDRESS_LIST_SHEET_URL)
+        bulk_import_page(name, today, address_index)
+    else:
+        help_page(name, user_role)
+
+@st.fragment
+def dispatch_panel(repo):
+    """Stops awaiting dispatch; selecting rows reruns only this fragment."""
+    begin_rerun_trace(fragment=True)
+    today = datetime.datetime.now(pytz.timezone("America/New_York")).date()  # a fragment can outlive the full run's day
+    log = repo.master_log()
+    df_undispatched = log.undispatched()
+
+    dispatch_results = st.session_state.pop("dispatch_results", None)
+    if dispatch_results:
+        failed = [r for r in dispatch_results if r["Master"] not in ("Dispatched", "Queued") or r["Weekly"] not in ("Dispatched", "Appended from master", "Queued")]
+        dispatched = len(dispatch_results) - len(failed)
+        st.info(f"Dispatched {dispatched} missed stop(s)!", icon=":material/list_alt_check:")
+        if failed:
+            st.warning(f"{len(failed)} stop(s) were not fully dispatched. See details below.", icon=":material/warning:")
+        with st.expander("Dispatch details", expanded=bool(failed)):
+            st.dataframe(pd.DataFrame(dispatch_results), use_container_width=True, hide_index=True)
+
+    if not df_undispatched.empty:
+        show_cols = [
+            "Time Sent to JPM", "Address", "Zone", "Service Type", "Collection Status"
+        ]
+        count = log.old_stops(today)
+        if count:
+            st.info(
+                f"**ATTN:** There {'is' if count == 1 else 'are'} {count} stop{'s' if count != 1 else ''} that need{'s' if count == 1 else ''} to be closed out from a previous day{'s' if count != 1 else ''}.", icon=":material/data_alert:"
             )
+        st.subheader("Stops Awaiting Dispatch")
+        event = st.dataframe(
+            df_undispatched[show_cols],
+            key="undispatched_data",
+            on_select="rerun",
+            selection_mode="multi-row",
+            use_container_width=True,
+            hide_index=True,
+        )
+
+        selected_rows = event.selection.rows if hasattr(event, "selection") else []
+
+        if selected_rows:
+            st.info(f"Selected {len(selected_rows)} stop(s) to dispatch.", icon=":material/select_check_box:")
+            # One truck per service type and route, each in driving order
+            address_index = load_address_index(SERVICE_ACCOUNT_INFO, ADDRESS_LIST_SHEET_URL)
+            stops, plan = plan_dispatch(log.records_for(df_undispatched.iloc[selected_rows]), address_index.spatial)
+            st.caption("Truck order")
+            st.dataframe(plan.drop(columns="MissID"), use_container_width=True, hide_index=True)
+
+        if st.button("Dispatch Selected Stops", disabled=not selected_rows):
+            now_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
+            results = repo.dispatch(stops, now_time)
+            order = plan.set_index("MissID")[["Truck", "Stop"]].to_dict("index")
+            st.session_state.dispatch_results = [dict(r, **order.get(r["MissID"], {})) for r in results]
+            rerun_fragment()
+    else:
+        st.info("No pending missed stops to dispatch!", icon=":material/done_all:")
+
+@st.fragment
+def completion_form(repo):
+    """Complete a dispatched miss; its widgets rerun only this fragment."""
+    begin_rerun_trace(fragment=True)
+    today = datetime.datetime.now(pytz.timezone("America/New_York")).date()  # a fragment can outlive the full run's day
+    fields_to_reset = ["driver_checkin", "collection_status", "jpm_notes", "uploaded_image"]
+    log = repo.master_log()
+
+    completion_timings = st.session_state.pop("completion_timings", None)
+    if completion_timings:
+        st.info("Miss completed and logged!", icon=":material/list_alt_check:")
+        for notice in st.session_state.pop("completion_notices", []):
+            st.warning(notice, icon=":material/warning:")
+        st.caption("Last completion: " + " · ".join(f"{step} {secs:.2f}s" for step, secs in completion_timings.items()))
+
+    # --- PRIOR UNCOMPLETED WARNING BLOCK (Unified) ---
+    # Dispatched but not completed, or Pending/Premature and never dispatched, from prior days
+    df_all_prior = log.prior_open(today)
+    if not df_all_prior.empty:
+        count = len(df_all_prior)
+        st.info(
+            f"**ATTN:** There {'is' if count == 1 else 'are'} {count} stop{'s' if count != 1 else ''} from before today that {'needs' if count == 1 else 'need'} to be closed out. Check the table below:", icon=":material/data_alert:"
+        )
+        show_cols = ["Address", "Zone", "Service Type", "Collection Status", "Date", "Time Dispatched"]
+        st.dataframe(df_all_prior[show_cols], use_container_width=True, hide_index=True)
+
+
+    to_complete = []
+    for row_idx, row in log.to_complete():
+        label = (
+            f"{row.get('Address','')} | {row.get('Zone','')} | Date: {row.get('Date','')} | Dispatched: {row.get('Time Dispatched','')}"
+        )
+        to_complete.append({"row_idx": row_idx, "row": row, "label": label})
+
+
+    if not to_complete:
+        st.info("No dispatched, incomplete misses for today!", icon=":material/celebration:")
+    else:
+        st.caption(
+            "Only 'Premature' stops that have been dispatched will be listed here for completion."
+        )
+
+        chosen = st.selectbox("Select a dispatched miss to complete:", to_complete, format_func=lambda x: x["label"])
+        sel = chosen["row"]
+
+        if "driver_checkin" not in st.session_state:
+            now = datetime.datetime.now(pytz.timezone("America/New_York"))
+            current_time_str = now.strftime("%I:%M %p")
+            st.session_state.driver_checkin = (
+                current_time_str if current_time_str in time_options else time_options[0]
+            )
+        driver_checkin = st.selectbox(
+            "Driver Check In Time",
+            time_options,
+            key="driver_checkin"
+        )
+        
+        # --- The rest, using session state for sticky fields if you want ---
+        collection_status = st.selectbox("Collection Status", ["Picked Up", "Not Out", "Rejected", "Delayed", "Confirmed Premature", "One Time Exception", "Created in Error", "Late Put Out"], key="collection_status")
+        jpm_notes = st.text_area("JPM Notes", key="jpm_notes")
+        uploaded_image = st.file_uploader("Upload Image (optional)", type=["jpg","jpeg","png","heic","webp"])
+        
+        image_link = "N/A"
+        
+        if uploaded_image:
+            _, _, thumbnail = prepared_image(uploaded_image)
+            st.image(thumbnail or uploaded_image, caption="Preview", use_container_width=True)
+        
+        can_complete = driver_checkin and collection_status
+        
+        if st.button("Complete Missed Stop", disabled=not can_complete):
+            started = time.perf_counter()
+            now_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
+            check_in_time = driver_checkin
+
+            notices = []  # shown after the rerun below, which would wipe anything written now
+
+            def upload_image():
+                if not uploaded_image:
+                    return "N/A"
+                try:
+                    uploaded_image.seek(0)
+                    # Find matching row index in the weekly tab
+                    row_index_weekly = repo.weekly_row_index(sel)
             
-            # --- The rest, using session state for sticky fields if you want ---
-            collection_status = st.selectbox("Collection Status", ["Picked Up", "Not Out", "Rejected", "Delayed", "Confirmed Premature", "One Time Exception", "Created in Error", "Late Put Out"], key="collection_status")
-            jpm_notes = st.text_area("JPM Notes", key="jpm_notes")
-            uploaded_image = st.file_uploader("Upload Image (optional)", type=["jpg","jpeg","png","heic","webp"])
-            
-            image_link = "N/A"
-            
-            if uploaded_image:
-                uploaded_image.seek(0)
-                st.image(uploaded_image, caption="Preview", use_container_width=True)
+                    if not row_index_weekly:
+                        row_index_weekly = chosen["row_idx"] or "NA"  # fallback to master row, when known
             
-            can_complete = driver_checkin and collection_status
+                    service_type = sel.get("Service Type", "Unknown")
+                    dropbox_url = upload_to_dropbox(uploaded_image, row_index_weekly, service_type, today, missid=sel.get("MissID"))
+                    return f'=HYPERLINK("{dropbox_url}", "Image Link")'
+                except Exception as e:
+                    notices.append(f"Dropbox upload failed: {e}")
+                    return "UPLOAD FAILED"
+
+            # The upload does not depend on finding the master row, so both run at once
+            results, timings = run_steps({"Image upload": upload_image, "Row lookup": lambda: repo.locate(sel)})
+            image_link = results["Image upload"]
+
+            updates = {
+                "Driver Check-in Time": check_in_time,
+                "Collection Status": collection_status,
+                "JPM Notes": jpm_notes,
+                "Image": image_link,
+            }
             
-            if st.button("Complete Missed Stop", disabled=not can_complete):
-                now_time = datetime.datetime.now(pytz.timezone("America/New_York")).strftime("%Y-%m-%d %H:%M:%S")
-                check_in_time = driver_checkin
+            address = sel.get("Address")
+            row_date = sel.get("Date")
+            called_in_time = sel.get("Time Called In")
+            history = repo.miss_history()
+            prior_legit_misses = get_prior_legit_miss_count(history, address, row_date, called_in_time)
             
-                if uploaded_image:
-                    try:
-                        uploaded_image.seek(0)
-                        # Find matching row index in the weekly tab
-                        row_index_weekly = None
-                        r = sel
-                        miss_date = r.get("Date")
-                        if miss_date:
-                            try:
-                                miss_date_dt = datetime.datetime.strptime(miss_date, "%Y-%m-%d").date()
-                                sheet_title = get_sheet_title(miss_date_dt)
-                                weekly_id = ensure_gsheet_exists(drive, FOLDER_ID, sheet_title)
-                                weekly_ss = safe_gspread_call(gs_client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
-                                tab_name = get_today_tab_name(miss_date_dt)
-                                ws = safe_gspread_call(weekly_ss.worksheet, tab_name, error_message=f"Could not open weekly tab '{tab_name}'.")
-
-                                tab_records = ws.get_all_records()
-                                for j, tr in enumerate(tab_records):
-                                    if (tr.get("Address") == r.get("Address")
-                                        and tr.get("Date") == r.get("Date")
-                                        and tr.get("Time Called In") == r.get("Time Called In")):
-                                        row_index_weekly = j + 2  # +2 because get_all_records skips header
-                                        break
-                            except Exception as e:
-                                pass  # If not found, will fallback to master row
-                
-                        if not row_index_weekly:
-                            row_index_weekly = chosen["row_idx"]  # fallback to master row
-                
-                        service_type = sel.get("Service Type", "Unknown")
-                        dropbox_url = upload_to_dropbox(uploaded_image, row_index_weekly, service_type)
-                        image_link = f'=HYPERLINK("{dropbox_url}", "Image Link")'
-                    except Exception as e:
-                        st.error(f"Dropbox upload failed: {e}", icon=":material/error:")
-                        image_link = "UPLOAD FAILED"
-                else:
-                    image_link = "N/A"
-    
-                updates = {
-                    "Driver Check-in Time": check_in_time,
-                    "Collection Status": collection_status,
-                    "JPM Notes": jpm_notes,
-                    "Image": image_link,
-                }
-                
-                address = sel.get("Address")
-                row_date = sel.get("Date")
-                called_in_time = sel.get("Time Called In")
-                prior_legit_misses = get_prior_legit_miss_count(master_records, address, row_date, called_in_time)
-                
-                if collection_status.upper() in ("PREMATURE", "CONFIRMED PREMATURE", "REJECTED", "ONE TIME EXCEPTION", "NOT OUT", "CREATED IN ERROR", "LATE PUT OUT"):
-                    updates["Times Missed"] = str(prior_legit_misses)
-                    # Find last legit prior miss date, else "Never"
-                    prior_misses = [
-                        row for row in master_records
-                        if (
-                            row.get("Address") == address and
-                            str(row.get("Collection Status", "")).strip().upper() in LEGIT_MISS_STATUSES and
-                            (str(row.get("Date")) < str(row_date) or (
-                                str(row.get("Date")) == str(row_date) and str(row.get("Time Called In")) < str(called_in_time)
-                            ))
-                        )
-                    ]
-                    if prior_misses:
-                        updates["Last Missed"] = prior_misses[-1]["Date"]
-                    else:
-                        updates["Last Missed"] = "Never"
+            if collection_status.upper() in ("PREMATURE", "CONFIRMED PREMATURE", "REJECTED", "ONE TIME EXCEPTION", "NOT OUT", "CREATED IN ERROR", "LATE PUT OUT"):
+                updates["Times Missed"] = str(prior_legit_misses)
+                # Find last legit prior miss date, else "Never"
+                updates["Last Missed"] = history.last_before(address, row_date, called_in_time) or "Never"
 
-                else:
-                    updates["Times Missed"] = str(prior_legit_misses + 1)
-                    updates["Last Missed"] = row_date
-
-                missid = sel.get("MissID") if isinstance(sel, dict) else chosen["row"].get("MissID")
-                
-                # --- Update in Master Misses Log ---
-                row_idx_master = find_row_by_missid(master_ws, missid)
-                if row_idx_master:
-                    update_rows(master_ws, [row_idx_master], updates)
-                else:
-                    st.error("Could not find this record in the Master Misses Log. It may have been deleted.", icon=":material/error:")
-                
-                # --- Also update in the correct weekly sheet/tab for recordkeeping ---
-                r = sel
-                miss_date = r.get("Date")
-                if miss_date:
-                    try:
-                        miss_date_dt = datetime.datetime.strptime(miss_date, "%Y-%m-%d").date()
-                        sheet_title = get_sheet_title(miss_date_dt)
-                        weekly_id = ensure_gsheet_exists(drive, FOLDER_ID, sheet_title)
-                        weekly_ss = safe_gspread_call(gs_client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
-                        tab_name = get_today_tab_name(miss_date_dt)
-                        ws = safe_gspread_call(weekly_ss.worksheet, tab_name, error_message=f"Could not open weekly tab '{tab_name}'.")
-
-                        # NEW: find row by MissID in this worksheet!
-                        row_idx_weekly = find_row_by_missid(ws, missid)
-                        if row_idx_weekly:
-                            update_rows(ws, [row_idx_weekly], updates)
-                        else:
-                            # Append the missing row, using all columns from Master row!
-                            st.warning(f"MissID {missid} not found in weekly sheet '{tab_name}'. Appending from master...")
-                            try:
-                                safe_gspread_call(
-                                    ws.append_row,
-                                    [row.get(col, "") for col in COLUMNS],
-                                    value_input_option="USER_ENTERED",
-                                    error_message=f"Could not append missing MissID {missid} to weekly tab."
-                                )
-                                # After appending, try updating again (now it will exist)
-                                new_row_idx = len(ws.get_all_values())  # 1-based
-                                update_rows(ws, [new_row_idx], updates)
-                            except Exception as e:
-                                st.error(f"Failed to append missing row to weekly sheet: {e}", icon=":material/error:")
-
-                    except Exception as e:
-                        pass  # skip if the weekly sheet/tab doesn't exist
+            else:
+                updates["Times Missed"] = str(prior_legit_misses + 1)
+                updates["Last Missed"] = row_date
 
-    
-                st.session_state.reload_to_complete = True
-                st.info("Miss completed and logged!", icon=":material/list_alt_check:")
-                if 'miss_date_dt' in locals():
-                    completed_weekly_id = ensure_gsheet_exists(drive, FOLDER_ID, get_sheet_title(miss_date_dt))
-                for k in fields_to_reset:
-                    if k in st.session_state:
-                        del st.session_state[k]
-                st.rerun()  # Immediately resets the UI
-            
-            if st.button("Start Over"):
-                for k in fields_to_reset:
-                    if k in st.session_state:
-                        del st.session_state[k]
-                st.rerun()                
+            step_timings, step_notices = repo.complete_miss(sel, updates)
+            timings.update(step_timings)
+            timings["Total"] = time.perf_counter() - started
+            st.session_state.completion_timings = timings
+            st.session_state.completion_notices = notices + step_notices
+
+            for k in fields_to_reset:
+                if k in st.session_state:
+                    del st.session_state[k]
+            rerun_fragment()  # Immediately resets the UI
+        
+        if st.button("Start Over"):
+            for k in fields_to_reset:
+                if k in st.session_state:
+                    del st.session_state[k]
+            rerun_fragment()                
+
+# Map dot colors per open status; the names are the matching Streamlit text colors for the legend
+OPEN_MISS_COLORS = {
+    "PENDING": ("#ffa421", "orange"),
+    "PREMATURE": ("#803df5", "violet"),
+    "DISPATCHED": ("#1c83e1", "blue"),
+    "DELAYED": ("#ff2b2b", "red"),
+}
+OTHER_MISS_COLOR = ("#808495", "gray")
+
+@st.fragment
+def open_miss_map(repo, address_index):
+    """Every open miss for a day or zone on one map, colored by status."""
+    begin_rerun_trace(fragment=True)
+    log = repo.master_log()
+    st.subheader("Open Misses Map")
+    if not len(log):
+        st.info("No open missed stops!", icon=":material/done_all:")
+        return
+
+    zones = log.df["Zone"].astype(str)
+    dates = log.df["Date"].astype(str)
+    col1, col2 = st.columns(2)
+    zone = col1.selectbox("Zone", ["All zones"] + sorted(zones.unique()))
+    day = col2.selectbox("Date", ["All dates"] + sorted(dates.unique(), reverse=True))
+    mask = np.ones(len(log), dtype=bool)
+    if zone != "All zones":
+        mask &= (zones == zone).to_numpy()
+    if day != "All dates":
+        mask &= (dates == day).to_numpy()
+
+    # One color per status category, then picked per row by category code
+    categories = list(log.status.cat.categories)
+    palette = np.array([OPEN_MISS_COLORS.get(c, OTHER_MISS_COLOR)[0] for c in categories] + [OTHER_MISS_COLOR[0]])
+    colors = palette[log.status.cat.codes.to_numpy()][mask]
+    lat, lon, found = address_index.spatial.locate(log.df["Address"].to_numpy()[mask])
+    points = pd.DataFrame({"lat": lat[found], "lon": lon[found], "color": colors[found]})
+    st.map(points, latitude="lat", longitude="lon", color="color", size=15)
+
+    counts = log.status[mask].value_counts()
+    st.caption(" · ".join(
+        f":{OPEN_MISS_COLORS.get(status, OTHER_MISS_COLOR)[1]}[●] {status.title()} ({count})"
+        for status, count in counts.items() if count
+    ))
+    if (~found).any():
+        st.caption(f"{int((~found).sum())} open miss(es) have no coordinates in the address list.")
+
+def jpm_ops(name, user_role):
+
+    st.sidebar.subheader("JPM Operations")
+    jpm_mode = st.sidebar.radio("Select Action:", ["Dispatch Misses", "Complete a Missed Stop", "Open Misses Map", "Submit Completion Times", "Help"])
+    set_trace_mode(jpm_mode)
+
+    if jpm_mode == "Dispatch Misses":
+        # Always work from Master Misses Log
+        repo = get_miss_repository()
+        dispatch_panel(repo)
+
+    elif jpm_mode == "Complete a Missed Stop":
+        repo = get_miss_repository()
+        completion_form(repo)
+
+    elif jpm_mode == "Open Misses Map":
+        repo = get_miss_repository()
+        address_index = load_address_index(SERVICE_ACCOUNT_INFO, ADDRESS_LIST_SHEET_URL)
+        open_miss_map(repo, address_index)
 
     elif jpm_mode == "Submit Completion Times":
 
@@ -1333,16 +3819,25 @@ now = datetime.datetime.now(NY_TZ)
 now_str = now.strftime("%I:%M %p")
 time_options = generate_all_minutes()
 today = datetime.datetime.now(pytz.timezone("America/New_York")).date()
-today_str = today.strftime("%-m.%-d.%Y")
-drive = build('drive', 'v3', credentials=credentials_gs)
-sheet_title = get_sheet_title(today)
-weekly_id = ensure_gsheet_exists(drive, FOLDER_ID, sheet_title)
-weekly_ss = safe_gspread_call(gs_client.open_by_key, weekly_id, error_message="Could not open this week's sheet.")
-today_tab = get_today_tab_name(today)
+mark_startup("Setup")
+
+# Nothing remote is touched until the user is logged in
 name, username, user_role = user_login(authenticator, credentials)
+mark_startup("Login")
+
+drive = get_drive_service()
+sheet_title = get_sheet_title(today)
+weekly_id = prefetch_sheet_ids(drive, FOLDER_ID, role_sheet_titles(user_role, today)).get(sheet_title)
+mark_startup("Sheet lookup")
 
 updates()
-if user_role == "city":
+mark_startup("Header")
+if username in admin_usernames():
+    startup_timing_report()
+outbox_status()
+if st.query_params.get("page") in ADMIN_PAGES and username in admin_usernames():
+    ADMIN_PAGES[st.query_params["page"]]()
+elif user_role == "city":
     city_ops(name, user_role)
 elif user_role == "jpm":
     jpm_ops(name, user_role)
@@ -0,0 +1,67 @@
+"""
+The tests load missapptesting.py the way benchmarks/api_budget.py does: through
+Streamlit's AppTest against the in-memory fakes in benchmarks/fakes.py, with the
+clock pinned to API_BUDGET_NOW. The fixtures hand them the app's module globals
+after one logged-in run, so its classes and functions can be called directly.
+
+    python -m pytest -q
+"""
+
+import datetime
+import logging
+import os
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "benchmarks"))
+os.environ.setdefault("API_BUDGET_NOW", "2026-10-21 15:00")
+
+import api_budget  # noqa: E402
+
+api_budget.patch_widgets()
+logging.getLogger("missapp.calls").propagate = False  # one JSON line per fake call is only noise here
+
+TODAY = datetime.datetime.strptime(os.environ["API_BUDGET_NOW"], "%Y-%m-%d %H:%M").date()
+
+
+def load(username="jpmuser"):
+    session = api_budget.Session(username, "direct", os.environ["API_BUDGET_NOW"], 0)
+    session.run()
+    return session
+
+
+def app_globals(session):
+    return type(session.at.session_state["miss_repository"]).__init__.__globals__
+
+
+@pytest.fixture(scope="module")
+def app():
+    """The app's globals, shared by a module's tests; only for code that keeps no state."""
+    return app_globals(load())
+
+
+@pytest.fixture
+def session():
+    """A fresh JPM session, writing to Sheets directly, after its first run."""
+    return load()
+
+
+@pytest.fixture
+def g(session):
+    """The globals of the session fixture's app."""
+    return app_globals(session)
+
+
+@pytest.fixture
+def repo(session):
+    return session.at.session_state["miss_repository"]
+
+
+@pytest.fixture
+def steps(g):
+    """Makes stop_with_error raise StepFailed, as it does inside run_steps, instead of stopping the script."""
+    g["_step_state"].active = True
+    yield g["StepFailed"]
+    g["_step_state"].active = False
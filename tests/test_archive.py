@@ -0,0 +1,91 @@
+import datetime
+
+import gspread
+import pytest
+
+import fakes
+from conftest import TODAY
+
+CUTOFF = TODAY - datetime.timedelta(days=3)
+ADDRESSES = ["1599 MAIN ST", "1598 MAIN ST", "1596 MAIN ST", "1550 MAIN ST"]
+
+
+class FailedResponse:
+    # Not retried, so the failure surfaces at once
+    status_code = 400
+    text = "bad request"
+
+    def json(self):
+        return {"error": {"code": 400, "message": "bad request", "status": "FAILED_PRECONDITION"}}
+
+
+def all_rows(session):
+    """Every row of the master log and the archive's year tabs, without headers."""
+    archive = session.spreadsheets["ARCHIVE"]
+    rows = [row for ws in archive.worksheets() if ws.title.isdigit() for row in ws.values[1:]]
+    return rows + session.spreadsheets["MASTER"].worksheet("Sheet1").values[1:]
+
+
+def truth(session, g, address):
+    status, column = g["COLUMNS"].index("Collection Status"), g["COLUMNS"].index("Address")
+    return sum(1 for row in all_rows(session) if row[column] == address and row[status].strip().upper() in g["LEGIT_MISS_STATUSES"])
+
+
+def counts(repo, session, g):
+    assert [repo.miss_history().count(a) for a in ADDRESSES] == [truth(session, g, a) for a in ADDRESSES]
+    return [truth(session, g, a) for a in ADDRESSES]
+
+
+def test_archive_moves_closed_rows_and_keeps_the_counts(session, g, repo):
+    before = counts(repo, session, g)
+    result = repo.archive_closed(CUTOFF)
+    assert result["archived"] > 0 and result["years"] == [str(TODAY.year)]
+
+    master = session.spreadsheets["MASTER"].worksheet("Sheet1").values
+    date, status = g["COLUMNS"].index("Date"), g["COLUMNS"].index("Collection Status")
+    assert not [row for row in master[1:] if row[date] < str(CUTOFF) and row[status].upper() in g["COMPLETED_STATUSES"]]
+    assert len(session.spreadsheets["ARCHIVE"].worksheet(str(TODAY.year)).values) == result["archived"] + 1
+    assert counts(repo, session, g) == before
+
+    # A second run has nothing left to move and changes nothing
+    rows = len(all_rows(session))
+    assert repo.archive_closed(CUTOFF)["archived"] == 0
+    assert len(all_rows(session)) == rows and counts(repo, session, g) == before
+
+
+def test_archive_rerun_after_a_failed_delete(session, g, repo, steps, monkeypatch):
+    before = counts(repo, session, g)
+
+    def fail(self, body):
+        raise gspread.exceptions.APIError(FailedResponse())
+
+    monkeypatch.setattr(fakes.FakeSpreadsheet, "batch_update", fail)
+    with pytest.raises(steps, match="Could not remove archived rows"):
+        repo.archive_closed(CUTOFF)
+    # The rows are in both places now, and the rollup was left alone so nothing counts twice
+    assert counts(repo, session, g) == before
+    monkeypatch.undo()
+
+    assert repo.archive_closed(CUTOFF)["archived"] > 0
+    assert counts(repo, session, g) == before
+
+
+def test_a_hand_edited_rollup_is_rebuilt(session, g, repo):
+    rollup = session.spreadsheets["ARCHIVE"].worksheet(g["MASTER_ROLLUP_TAB"])
+    good = [[str(cell) for cell in row] for row in rollup.values]
+    rollup.values[1][3] = "last spring"
+    g["_miss_rollup_store"]().clear()
+    counts(repo, session, g)
+    assert rollup.values == good
+
+
+def test_archive_trims_the_rollup_only_when_it_shrank(session, g, repo):
+    repo.archive_closed(CUTOFF)
+    assert session.rec.calls["sheets.batch_clear"] == 0
+
+    rollup = session.spreadsheets["ARCHIVE"].worksheet(g["MASTER_ROLLUP_TAB"])
+    rows = len(rollup.values)
+    rollup.values.extend([["9999 GONE ST", "1", "2020-01-01", "2020-01-01 09:00"]] * 3)
+    repo.archive_closed(CUTOFF)
+    assert session.rec.calls["sheets.batch_clear"] == 1
+    assert len(rollup._rows("A1:D")) == rows
@@ -0,0 +1,77 @@
+import pytest
+
+
+def miss(missid, address, date, called_in, status="Picked Up"):
+    return {"MissID": missid, "Address": address, "Date": date, "Time Called In": called_in, "Collection Status": status}
+
+
+RECORDS = [
+    miss("a", "12 Main St", "2026-10-01", "09:00 AM"),
+    miss("b", "12 MAIN ST ", "2026-10-05", "08:30 AM", "Pending"),
+    miss("c", "12 main st", "2026-10-05", "10:15 AM", "Rejected"),
+    miss("d", "12 Main St", "2026-10-09", "07:00 AM", "Dispatched"),
+    miss("e", "40 Oak Ave", "2026-10-02", "11:00 AM", "Not Out"),
+]
+
+
+def test_history_counts_legit_misses_per_normalized_address(app):
+    history = app["MissHistoryIndex"](RECORDS)
+    assert history.count("12 MAIN ST") == 3
+    assert history.last(" 12 main st") == "2026-10-09"
+    assert history.count("99 Elm St") == 0
+    assert history.last("99 Elm St") is None
+
+
+def test_history_lookups_before_a_miss(app):
+    history = app["MissHistoryIndex"](RECORDS)
+    assert history.count_before("12 Main St", "2026-10-05", "08:30 AM") == 1
+    assert history.count_before("12 Main St", "2026-10-05", "10:15 AM") == 2
+    assert history.last_before("12 Main St", "2026-10-05", "10:15 AM") == "2026-10-05"
+    assert history.count_before("12 Main St", "2026-10-01", "09:00 AM") == 0
+    assert history.last_before("12 Main St", "2026-10-01", "09:00 AM") is None
+
+
+def test_history_follows_status_changes_and_new_rows(app):
+    history = app["MissHistoryIndex"](RECORDS)
+    history.set_status("a", "Created in Error")
+    assert history.count("12 Main St") == 2
+    history.set_status("c", "Picked Up")
+    history.set_status("unknown", "Picked Up")
+    assert history.count("12 Main St") == 3
+    history.add_row(miss("f", "12 Main St", "2026-10-12", "09:00 AM", "Pending"))
+    assert (history.count("12 Main St"), history.last("12 Main St")) == (4, "2026-10-12")
+
+
+def test_shared_history_is_rebuilt_only_from_a_newer_generation(g):
+    first = g["get_miss_history"]("master", RECORDS, 3)
+    assert g["get_miss_history"]("master", RECORDS[:2], 3) is first
+    assert g["get_miss_history"]("master", RECORDS[:2], 2) is first
+    newer = g["get_miss_history"]("master", RECORDS[:1], 4)
+    assert newer is not first and newer.count("12 Main St") == 1
+
+
+def test_rollup_survives_a_round_trip_through_its_tab(app):
+    rollup = app["MissRollup"].from_rows(RECORDS)
+    values = rollup.to_values()
+    assert values[0] == app["ROLLUP_COLUMNS"]
+    read = app["MissRollup"].from_records(dict(zip(values[0], row)) for row in values[1:])
+    assert len(read) == len(rollup) == 2
+    for address, date, called_in in [("12 Main St", "2026-10-05", "10:15 AM"), ("40 OAK AVE", "2026-10-03", "")]:
+        assert read.count(address) == rollup.count(address)
+        assert read.count_before(address, date, called_in) == rollup.count_before(address, date, called_in)
+        assert read.last_before(address, date, called_in) == rollup.last_before(address, date, called_in)
+
+
+@pytest.mark.parametrize("missed_on", ["2026-10-01 9am", "Oct 1", "2026-10-01 09:00; someday"])
+def test_rollup_rejects_a_hand_edited_cell(app, missed_on):
+    with pytest.raises(ValueError):
+        app["MissRollup"].from_records([{"Address": "12 MAIN ST", "Missed On": missed_on}])
+
+
+def test_archived_history_adds_the_rollup_to_the_active_log(app):
+    rollup = app["MissRollup"].from_records([{"Address": "12 MAIN ST", "Missed On": "2025-03-01 09:00; 2026-10-03"}])
+    history = app["ArchivedHistory"](app["MissHistoryIndex"](RECORDS), rollup)
+    assert history.count("12 Main St") == 5
+    assert history.last("12 Main St") == "2026-10-09"
+    assert history.count_before("12 Main St", "2026-10-04", "09:00 AM") == 3
+    assert history.last_before("12 Main St", "2026-10-04", "09:00 AM") == "2026-10-03"
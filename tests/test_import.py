@@ -0,0 +1,86 @@
+import datetime
+from io import BytesIO
+
+import openpyxl
+import pytest
+
+from conftest import TODAY
+
+
+def upload(data, name):
+    file = BytesIO(data)
+    file.name = name
+    return file
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-10-01", datetime.date(2026, 10, 1)),
+    ("10/1/2026", datetime.date(2026, 10, 1)),
+    ("10/1/26", datetime.date(2026, 10, 1)),
+    ("2026-10-01 00:00:00", datetime.date(2026, 10, 1)),
+    ("", TODAY),
+    ("Oct 1", None),
+])
+def test_parse_import_date(app, value, expected):
+    assert app["parse_import_date"](value, TODAY) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("9:30 am", "09:30 AM"), ("9:30PM", "09:30 PM"), ("21:30", "09:30 PM"), ("07:05:00", "07:05 AM"), ("", "NOW"), ("noonish", None),
+])
+def test_parse_import_time(app, value, expected):
+    assert app["parse_import_time"](value, "NOW") == expected
+
+
+def test_csv_rows_match_headers_in_any_case_and_skip_blank_lines(app):
+    data = "address,SERVICE TYPE,Notes\r\n1000 Main St,msw,x\r\n,,\r\n1001 Main St,SS,\r\n".encode("utf-8-sig")
+    assert list(app["read_import_rows"](upload(data, "misses.CSV"))) == [
+        (2, {"Address": "1000 Main St", "Service Type": "msw", "Notes": "x"}),
+        (4, {"Address": "1001 Main St", "Service Type": "SS", "Notes": ""}),
+    ]
+
+
+def test_csv_saved_by_excel_on_windows_is_read_as_cp1252(app):
+    data = "Address,City Notes\r\n1000 Main St,Café – side door\r\n".encode("cp1252")
+    assert list(app["read_import_rows"](upload(data, "misses.csv"))) == [(2, {"Address": "1000 Main St", "City Notes": "Café – side door"})]
+
+
+def test_undecodable_csv_stops_with_a_message(g, steps):
+    with pytest.raises(steps, match="CSV UTF-8"):
+        list(g["read_import_rows"](upload(b"Address\r\n\x81\x8d\r\n", "misses.csv")))
+
+
+def test_xlsx_rows(app):
+    book = openpyxl.Workbook()
+    book.active.append(["Address", "Date", "Time Called In"])
+    book.active.append(["1000 MAIN ST", "2026-10-01", None])
+    book.active.append([None, None, None])
+    book.active.append(["1001 MAIN ST", None, "9:15 AM"])
+    data = BytesIO()
+    book.save(data)
+    assert list(app["read_import_rows"](upload(data.getvalue(), "misses.xlsx"))) == [
+        (2, {"Address": "1000 MAIN ST", "Date": "2026-10-01", "Time Called In": ""}),
+        (4, {"Address": "1001 MAIN ST", "Date": "", "Time Called In": "9:15 AM"}),
+    ]
+
+
+def import_one(g, repo, **raw):
+    address_index = g["load_address_index"](g["SERVICE_ACCOUNT_INFO"], g["ADDRESS_LIST_SHEET_URL"])
+    return g["import_miss"](dict({"Service Type": "MSW"}, **raw), "Tester", TODAY, address_index, repo, repo.miss_history(), set())
+
+
+def test_import_rejects_unknown_addresses_and_future_dates(g, repo):
+    assert import_one(g, repo, Address="1 NOWHERE LN") == (None, "Address is not in the address list")
+    tomorrow = str(TODAY + datetime.timedelta(days=1))
+    assert import_one(g, repo, Address="1000 main street", Date=tomorrow)[1].startswith("Date must be")
+    row, reason = import_one(g, repo, Address="1000 main street")
+    assert reason is None and row["Address"] == "1000 MAIN ST" and row["Date"] == str(TODAY)
+
+
+def test_backdated_import_counts_only_earlier_misses(g, repo):
+    # 1599 MAIN ST was missed today at 1, 5 and 9 AM, and twice last year (archived)
+    row, _ = import_one(g, repo, Address="1599 MAIN ST", **{"Time Called In": "06:00 AM"})
+    assert (row["Times Missed"], row["Last Missed"]) == ("5", str(TODAY))
+    yesterday = str(TODAY - datetime.timedelta(days=1))
+    row, _ = import_one(g, repo, Address="1599 MAIN ST", Date=yesterday, **{"Time Called In": "09:00 AM"})
+    assert (row["Times Missed"], row["Last Missed"]) == ("3", f"{TODAY.year - 1}-05-17")
@@ -0,0 +1,104 @@
+import json
+
+from conftest import TODAY
+
+
+def master_values(session):
+    return session.spreadsheets["MASTER"].worksheet("Sheet1").values
+
+
+def column(g, name):
+    return g["COLUMNS"].index(name)
+
+
+def test_open_index_tracks_unresolved_misses(app):
+    index = app["OpenMissIndex"]([
+        {"MissID": "a", "Address": "12 Main St", "Collection Status": "Pending"},
+        {"MissID": "b", "Address": "40 Oak Ave", "Collection Status": "Picked Up"},
+        {"MissID": "", "Address": "7 Elm St", "Collection Status": "Dispatched"},
+    ])
+    assert "a" in index and "b" not in index
+    assert index.has_address("12 MAIN ST") and not index.has_address("40 Oak Ave")
+    assert index.count("PENDING", "DISPATCHED") == 2
+    index.put({"MissID": "c", "Address": "40 Oak Ave", "Collection Status": "Premature"})
+    index.update("a", {"Collection Status": "Dispatched"})
+    # Rows keep their sheet order; a miss not synced yet (row 0) goes last
+    assert [(row, record.get("MissID")) for row, record in index.entries("DISPATCHED", "PREMATURE")] == [(2, "a"), (4, ""), (0, "c")]
+    index.update("a", {"Collection Status": "Picked Up"})
+    assert "a" not in index and not index.has_address("12 Main St")
+
+
+def test_snapshot_syncs_changes_without_a_full_read(session, g, repo):
+    snapshot = g["master_log_snapshot"](repo.master_id)
+    for _ in range(2):  # a full read, then the first version check
+        records, generation = snapshot.sync(repo.drive, repo.master_ws, max_age=0)
+    session.measure()
+    assert snapshot.sync(repo.drive, repo.master_ws, max_age=0) == (records, generation)
+    assert dict(session.rec.calls) == {"drive.files.get": 1}
+
+    values = master_values(session)
+    assert values[2][column(g, "MissID")] == "miss-1" and "miss-1" in snapshot.open
+    values[2][column(g, "Collection Status")] = "Picked Up"
+    new = list(values[1])
+    new[column(g, "MissID")], new[column(g, "Collection Status")] = "miss-new", "Pending"
+    values.append(new)
+    session.spreadsheets["MASTER"].version += 1
+
+    session.measure()
+    records, newer = snapshot.sync(repo.drive, repo.master_ws, max_age=0)
+    assert dict(session.rec.calls) == {"drive.files.get": 1, "sheets.values_batch_get": 1}
+    assert newer > generation
+    assert len(records) == len(values) - 1 and records[-1]["MissID"] == "miss-new"
+    assert records[1]["Collection Status"] == "Picked Up"
+    assert "miss-1" not in snapshot.open and "miss-new" in snapshot.open
+
+
+def test_snapshot_reads_in_full_once_rows_move(session, g, repo):
+    snapshot = g["master_log_snapshot"](repo.master_id)
+    for _ in range(2):
+        snapshot.sync(repo.drive, repo.master_ws, max_age=0)
+    values = master_values(session)
+    del values[3]
+    session.spreadsheets["MASTER"].version += 1
+    session.measure()
+    records, _ = snapshot.sync(repo.drive, repo.master_ws, max_age=0)
+    assert session.rec.calls["sheets.get_all_values"] == 1
+    assert [r["MissID"] for r in records] == [row[column(g, "MissID")] for row in values[1:]]
+
+
+def outbox(g, monkeypatch, tmp_path):
+    # No worker thread, so each test decides when to flush
+    monkeypatch.setattr(g["SheetsOutbox"], "run", lambda self: None)
+    return g["SheetsOutbox"](str(tmp_path / "outbox.db"), g["get_drive_service"](), g["gs_client"])
+
+
+def new_miss(g, missid, day):
+    return {col: "" for col in g["COLUMNS"]} | {
+        "MissID": missid, "Date": str(day), "Address": "1001 MAIN ST", "Collection Status": "Pending", "Time Called In": "09:00 AM",
+    }
+
+
+def test_outbox_overlays_and_flushes_queued_writes(session, g, monkeypatch, tmp_path):
+    box = outbox(g, monkeypatch, tmp_path)
+    row = new_miss(g, "queued-1", TODAY)
+    box.enqueue("append", row)
+    box.enqueue("update", row, {"Collection Status": "Dispatched"})
+    assert len(box.pending()) == 4  # master log and weekly tab, twice
+    records = box.overlay([{"MissID": "miss-0", "Collection Status": "Picked Up"}])
+    assert [(r["MissID"], r["Collection Status"]) for r in records] == [("miss-0", "Picked Up"), ("queued-1", "Dispatched")]
+
+    box.flush()
+    assert box.pending() == []
+    written = [r for r in master_values(session) if r[column(g, "MissID")] == "queued-1"]
+    assert len(written) == 1 and written[0][column(g, "Collection Status")] == "Dispatched"
+
+
+def test_outbox_keeps_failed_writes_with_the_error(session, g, monkeypatch, tmp_path):
+    box = outbox(g, monkeypatch, tmp_path)
+    box.enqueue("append", new_miss(g, "queued-2", "2020-01-06"))  # no weekly sheet for that week
+    box.flush()
+    entries = box.pending()
+    assert [(e["sheet_title"], e["attempts"]) for e in entries] == [("Misses Week Ending 2020-01-11", 1)]
+    assert "does not exist" in entries[0]["last_error"]
+    assert json.loads(entries[0]["payload"])["row"]["MissID"] == "queued-2"
+    assert any(r[column(g, "MissID")] == "queued-2" for r in master_values(session))
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def spatial(app):
+    rng = np.random.default_rng(1)
+    lats, lons = 40.6 + rng.random(2000) * 0.05, -75.5 + rng.random(2000) * 0.06
+    return app["SpatialIndex"]([f"{i} A ST" for i in range(2000)], lats, lons)
+
+
+def brute_force(spatial, lat, lon):
+    (x, y), = spatial.project([lat], [lon])
+    dist = np.hypot(spatial.xy[:, 0] - x, spatial.xy[:, 1] - y)
+    order = np.argsort(dist, kind="stable")
+    return spatial.addresses[order], dist[order]
+
+
+# Inside the grid, just outside it and far away from it
+@pytest.mark.parametrize("lat, lon", [(40.62, -75.48), (40.4, -75.3), (41.5, -75.5), (35.0, -80.0)])
+@pytest.mark.parametrize("k", [1, 5])
+def test_nearest_matches_brute_force(spatial, lat, lon, k):
+    expected, _ = brute_force(spatial, lat, lon)
+    assert [address for address, _ in spatial.nearest(lat, lon, k)] == list(expected[:k])
+
+
+def test_within_returns_every_address_in_the_radius_nearest_first(spatial):
+    addresses, dist = brute_force(spatial, 40.62, -75.48)
+    found = spatial.within(40.62, -75.48, 500)
+    assert [address for address, _ in found] == list(addresses[dist <= 500])
+    assert len(found) > 10
+
+
+def test_spatial_index_skips_bad_and_duplicate_points(app):
+    spatial = app["SpatialIndex"](["1 A ST", "1 a st", "2 A ST", "3 A ST"], [40.6, 40.7, np.nan, 40.61], [-75.5, -75.5, -75.5, -75.51])
+    assert list(spatial.addresses) == ["1 A ST", "3 A ST"]
+    lat, _, found = spatial.locate(["3 a st", "2 A ST"])
+    assert list(found) == [True, False] and lat[0] == 40.61
+    assert app["SpatialIndex"]([], [], []).nearest(40.6, -75.5) == []
+
+
+@pytest.fixture(scope="module")
+def search(app):
+    return app["AddressSearch"]([
+        "1234 MAIN ST", "12 MAIN ST", "120 MAPLE AVE", "1234 N 7TH ST", "88 WALNUT ST", "500 S FRONT ST",
+    ])
+
+
+def test_search_matches_token_prefixes(search):
+    assert search.search("12 MAIN") == ["12 MAIN ST", "1234 MAIN ST"]
+    assert search.search("maple avenue") == ["120 MAPLE AVE"]
+    assert search.search("12", k=2) == ["12 MAIN ST", "1234 MAIN ST"]
+    assert search.search("12 MAIN", within={"1234 MAIN ST"}) == ["1234 MAIN ST"]
+    assert search.search("  ") == []
+
+
+def test_search_respells_and_falls_back_to_trigrams(search):
+    assert search.search("88 WALNTU") == ["88 WALNUT ST"]
+    assert search.search("5000 SOUTH FRONT") == ["500 S FRONT ST"]
+    assert search.search("QQQQ ZZZZ") == []
+
+
+def test_exact_ignores_case_punctuation_and_suffix_spelling(search):
+    assert search.exact("1234 north 7th street.") == "1234 N 7TH ST"
+    assert search.exact("1234 7TH ST") is None
+
+
+def path_length(xy, order):
+    return float(np.hypot(*np.diff(xy[order], axis=0).T).sum())
+
+
+def test_route_order_visits_every_stop_once(app):
+    xy = np.random.default_rng(7).random((40, 2)) * 5000
+    order = app["route_order"](xy)
+    assert sorted(order) == list(range(40))
+    # 2-opt never leaves a path longer than the stops in their given order
+    assert path_length(xy, order) < path_length(xy, list(range(40)))
+    assert app["route_order"](xy[:2]) == [0, 1]
+
+
+def test_route_order_drives_along_a_street_end_to_end(app):
+    shuffled = np.array([3, 0, 7, 5, 1, 6, 2, 4])
+    xy = np.column_stack([shuffled * 100.0, np.zeros(8)])
+    assert list(shuffled[app["route_order"](xy)]) in (list(range(8)), list(range(7, -1, -1)))